@@ -1,19 +1,36 @@
 from livekit.agents import Agent
+from livekit.agents import llm as livekitllm
+from collections import deque
+import pronunciation
 import logging
 import os
 logger = logging.getLogger(__name__)
 class DebugAvatarAgent(Agent):
     """Agent with debug logging and system identification"""
+
+    speculator = None  # SpeculativeGenerator when speculative LLM generation is on
+    on_pronunciation_result = None  # callback(PronunciationResult) for locally scored pronunciation turns
     
-    def __init__(self, system_type="unknown") -> None:
+    def __init__(self, system_type="unknown", chat_ctx=None) -> None:
         avatar_language = os.getenv("AVATAR_LANGUAGE")
         avatar_language_stt = os.getenv("AVATAR_LANGUAGE_STT")
         if not avatar_language:
             logger.warning("AVATAR_LANGUAGE environment variable is not set. Defaulting to 'ar'.")
             avatar_language = "ar"
-            language = "arabic-Syrian"
-            
-        elif avatar_language == "ar":
+        instructions = self._base_instructions(system_type, avatar_language)
+
+        super().__init__(instructions=instructions, chat_ctx=chat_ctx)
+        self.system_type = system_type
+        self.avatar_language = avatar_language
+        self._current_instructions = instructions  # Store modifiable instructions
+        self._overlays: deque[tuple[str, str, str | None]] = deque()  # (purpose, text, target), one per upcoming user turn
+        self._realtime_overlay: str | None = None  # purpose of the overlay in the realtime instructions
+        self._realtime_overlay_id = 0  # bumped each time an overlay goes into the realtime instructions
+        logger.info(f"DebugAvatarAgent initialized with system type: {system_type}, language: {avatar_language}")
+
+    @staticmethod
+    def _base_instructions(system_type: str, avatar_language: str) -> str:
+        if avatar_language == "ar":
             language = "arabic-Syrian"
         elif avatar_language == "fr":
             language = "french" 
@@ -28,13 +45,108 @@ class DebugAvatarAgent(Agent):
             instructions = f"Instruction for the LLM in the openai realtime API, and your output will be sent to the TTS, make full use of its capabilities to make the speech as realistic and natural as possible. Always respond in {language} language. Be friendly and conversational. If I am asking you to respond in a particular dialect, I want you to enforce this really hard, to make sure the phonetics and pronuncation are accurate to that dialect."
         else:
             instructions = f"You're the LLM between the STT and TTS systems, and your output will be sent to the TTS, make full use of its capabilities to make the speech as realistic and natural as possible. Always respond in {language} language. Be friendly and conversational. If I am asking you to respond in a particular dialect, I want you to enforce this really hard, to make sure the phonetics and pronuncation are accurate to that dialect."
+        return instructions
 
-        super().__init__(instructions=instructions)
-        self.system_type = system_type
+    async def set_instructions(self, instructions: str) -> None:
+        """Replace the base instructions of the running session; queued overlays stay on top"""
+        self.instructions = instructions
+        if self.system_type == "openai_realtime" and self._realtime_overlay is not None:
+            await self._apply_realtime_overlay()
+        else:
+            await self.update_instructions(instructions)
+
+    async def set_language(self, avatar_language: str) -> None:
+        """Switch the running session to another language; greeting, idle and feedback texts follow"""
         self.avatar_language = avatar_language
-        self._current_instructions = instructions  # Store modifiable instructions
-        logger.info(f"DebugAvatarAgent initialized with system type: {system_type}, language: {avatar_language}")
+        await self.set_instructions(self._base_instructions(self.system_type, avatar_language))
+        logger.info(f"DebugAvatarAgent switched to language: {avatar_language}")
     
+    async def llm_node(self, chat_ctx, tools, model_settings):
+        """Attach the next queued overlay, and use the reply speculated from interim transcripts when it matches"""
+        if self._overlays and self.system_type != "openai_realtime" and self._replies_to_user(chat_ctx):
+            purpose, text, target = self._overlays.popleft()
+            if purpose == "pronunciation" and target:
+                result = pronunciation.score(target, self._last_user_text(chat_ctx))
+                logger.info(f"Pronunciation of '{target}': {result.verdict} ({result.score:.2f}) in {result.elapsed_ms} ms")
+                if self.on_pronunciation_result:
+                    self.on_pronunciation_result(result)
+                feedback = pronunciation.canned_feedback(result, self.avatar_language)
+                if feedback:
+                    # clear pass or fail: no LLM round trip, and no use for the speculated reply either
+                    if self.speculator:
+                        self.speculator.skip()
+                    yield feedback
+                    return
+                text = f"{text}\n\n{pronunciation.describe(result)}"
+            chat_ctx = self._with_overlay(chat_ctx, text)
+            logger.info(f"Applied '{purpose}' instruction overlay to this turn ({len(self._overlays)} queued)")
+        speculation = self.speculator.take(chat_ctx, tools) if self.speculator else None
+        if speculation is None:
+            speculation = Agent.default.llm_node(self, chat_ctx, tools, model_settings)
+        async for chunk in speculation:
+            yield chunk
+
+    async def queue_overlay(self, purpose: str, text: str, target: str | None = None) -> None:
+        """
+        Instructions for one upcoming user turn; overlapping overrides wait for their own turn.
+        A pronunciation overlay with a target is scored locally before the LLM is involved.
+        """
+        self._overlays.append((purpose, text, target))
+        logger.info(f"Queued '{purpose}' instruction overlay ({len(self._overlays)} queued)")
+        if self.system_type == "openai_realtime" and self._realtime_overlay is None:
+            await self._apply_realtime_overlay()
+
+    def overlay_token(self) -> int | None:
+        """
+        Taken when the reply to a user turn is created: names the realtime overlay that reply was
+        generated with, None when there was none
+        """
+        if self.system_type != "openai_realtime" or self._realtime_overlay is None:
+            return None
+        return self._realtime_overlay_id
+
+    async def end_overlay_turn(self, token: int | None) -> None:
+        """
+        A reply to a user turn played out: on realtime sessions retire the overlay it was generated with
+        (`token` from overlay_token()) and apply the next one. Any other speech leaves the overlay in place.
+        """
+        if token is None or token != self.overlay_token():
+            return
+        self._overlays.popleft()
+        await self._apply_realtime_overlay()
+
+    async def _apply_realtime_overlay(self) -> None:
+        # realtime sessions have no llm_node, the overlay has to live in the session instructions
+        self._realtime_overlay = self._overlays[0][0] if self._overlays else None
+        text = self._overlays[0][1] if self._overlays else None
+        if text:
+            self._realtime_overlay_id += 1
+        await self.update_instructions(self.instructions + (f"\n\n{text}" if text else ""))
+
+    @staticmethod
+    def _last_user_text(chat_ctx) -> str:
+        return next((i.text_content or "" for i in reversed(chat_ctx.items)
+                     if i.type == "message" and i.role == "user"), "")
+
+    @staticmethod
+    def _replies_to_user(chat_ctx) -> bool:
+        items = [i for i in chat_ctx.items if i.type == "message" and i.role != "system"]
+        return bool(items) and items[-1].role == "user"
+
+    def _with_overlay(self, chat_ctx, text: str):
+        """
+        The stable instructions stay the first system message so providers can cache the prompt prefix;
+        the overlay goes right before the latest user message
+        """
+        chat_ctx = chat_ctx.copy()
+        items = chat_ctx.items
+        idx = next((i for i in range(len(items) - 1, -1, -1)
+                    if items[i].type == "message" and items[i].role == "user"), len(items))
+        items.insert(idx, livekitllm.ChatMessage(
+            role="system", content=[f"Instructions for this turn only, they take precedence:\n{text}"]
+        ))
+        return chat_ctx
+
     @property
     def instructions(self) -> str:
         """Return current instructions (override parent property)"""
@@ -77,3 +189,14 @@ class DebugAvatarAgent(Agent):
                 return "Hey! I'm an AI assistant with a visual avatar. How can I help you today?"
         self.system_type = system_type
         logger.info(f"DebugAvatarAgent initialized with system type: {system_type}")
+
+    def get_idle_message(self) -> str:
+        """Instruction for the check-in spoken when the session went quiet"""
+        if self.avatar_language == "ar":
+            return "الطفل صامت منذ فترة. اسأله بلطف وباختصار إن كان لا يزال هنا ويريد أن نكمل."
+        elif self.avatar_language == "fr":
+            return "L'enfant ne dit plus rien depuis un moment. Demande-lui gentiment et brièvement s'il est toujours là et s'il veut continuer."
+        elif self.avatar_language == "du":
+            return "Das Kind ist seit einer Weile still. Frag es freundlich und kurz, ob es noch da ist und weitermachen möchte."
+        else:
+            return "The child has been quiet for a while. Kindly and briefly ask if they are still there and want to keep going."
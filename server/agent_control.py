@@ -0,0 +1,120 @@
+"""
+Local control channel between the token server and its running agents
+Every agent listens on a Unix domain socket per room (AGENT_CONTROL_DIR/<room>.sock). The token server
+sends one JSON command per connection, on one line, and reads one JSON reply line:
+  {"cmd": "health"}                                                -> session, mode, language and idle state
+  {"cmd": "set_language", "language": "fr", "language_stt": "fr"}  -> reply language, STT language, spoken texts
+  {"cmd": "set_instructions", "instructions": "..."}               -> base instructions of the running session
+  {"cmd": "stop"}                                                  -> graceful shutdown, as when the user leaves
+Replies are {"ok": true, ...} or {"ok": false, "error": "..."}. Nothing is restarted: same process, same avatar.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+AGENT_CONTROL = os.getenv("AGENT_CONTROL", "1") == "1"
+# Socket paths are limited to ~100 characters, point this somewhere short on deep checkouts
+AGENT_CONTROL_DIR = os.getenv("AGENT_CONTROL_DIR", os.path.join(os.path.dirname(__file__), "agent_control"))
+AGENT_CONTROL_TIMEOUT = float(os.getenv("AGENT_CONTROL_TIMEOUT", 5))
+# asyncio has no Unix domain sockets on Windows (local testing): no control channel there
+_SUPPORTED = AGENT_CONTROL and not sys.platform.startswith("win")
+
+
+def socket_path(room: str) -> str:
+    return os.path.join(AGENT_CONTROL_DIR, f"{room}.sock")
+
+
+def remove_socket(room: str):
+    try:
+        os.remove(socket_path(room))
+    except FileNotFoundError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Agent side
+# ---------------------------------------------------------------------------
+class ControlServer:
+    """Serves the commands registered with `on()`; handler keyword arguments are the command's fields"""
+
+    def __init__(self, room: str):
+        self.room = room
+        self._handlers: dict[str, Callable[..., Awaitable[dict | None]]] = {}
+        self._server: asyncio.AbstractServer | None = None
+        self.commands = 0
+        self.errors = 0
+
+    def on(self, cmd: str, handler: Callable[..., Awaitable[dict | None]]) -> None:
+        self._handlers[cmd] = handler
+
+    async def start(self) -> None:
+        if not _SUPPORTED:
+            return
+        # Only the token server's user may reach the sockets: a 0700 directory, and the socket created
+        # 0600 from the start (a chmod after bind leaves a window where anyone can connect)
+        os.makedirs(AGENT_CONTROL_DIR, mode=0o700, exist_ok=True)
+        os.chmod(AGENT_CONTROL_DIR, 0o700)
+        # left behind by a killed agent of the same room
+        remove_socket(self.room)
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._serve, path=socket_path(self.room))
+        finally:
+            os.umask(umask)
+        logger.info(f"🎛️ Control channel listening on {socket_path(self.room)}")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cmd = None
+        try:
+            request = json.loads(await asyncio.wait_for(reader.readline(), AGENT_CONTROL_TIMEOUT))
+            cmd = request.pop("cmd", None)
+            handler = self._handlers.get(cmd)
+            if handler is None:
+                raise ValueError(f"unknown command {cmd!r}")
+            reply = {"ok": True, **(await handler(**request) or {})}
+            self.commands += 1
+        except Exception as e:
+            logger.warning(f"Control command {cmd!r} failed: {e}")
+            reply = {"ok": False, "error": str(e)}
+            self.errors += 1
+        try:
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def aclose(self) -> None:
+        if self._server:
+            self._server.close()
+            remove_socket(self.room)
+
+    def stats(self) -> dict:
+        return {"commands": self.commands, "errors": self.errors}
+
+
+# ---------------------------------------------------------------------------
+# Token server side
+# ---------------------------------------------------------------------------
+async def send_command(room: str, cmd: str, **fields) -> dict:
+    """
+    One command to the agent of `room`. Raises OSError when no agent listens there and
+    asyncio.TimeoutError when it does not answer within AGENT_CONTROL_TIMEOUT.
+    """
+    if not _SUPPORTED:
+        raise OSError("agent control channel is not available")
+    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(socket_path(room)), AGENT_CONTROL_TIMEOUT)
+    try:
+        writer.write(json.dumps({"cmd": cmd, **fields}).encode("utf-8") + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), AGENT_CONTROL_TIMEOUT)
+    finally:
+        writer.close()
+    if not line:
+        raise OSError(f"agent of {room} closed the control connection")
+    return json.loads(line)
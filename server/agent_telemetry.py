@@ -0,0 +1,100 @@
+"""
+Per-agent resource telemetry and limits for the token server
+Samples CPU, RSS, open FDs and threads of every agent's process tree into a short time series,
+and applies the per-agent rlimits to the agent processes at spawn
+"""
+
+import os
+import time
+import logging
+from collections import deque
+
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, telemetry only
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+AGENT_SAMPLE_INTERVAL = float(os.getenv("AGENT_SAMPLE_INTERVAL", 5))
+# Samples kept per agent (10 minutes at the default interval)
+AGENT_TELEMETRY_SAMPLES = int(os.getenv("AGENT_TELEMETRY_SAMPLES", 120))
+# Limits of every agent process (0 = inherit the token server's); children inherit them at fork
+AGENT_MAX_MEMORY_MB = int(os.getenv("AGENT_MAX_MEMORY_MB", 0))  # address space, RLIMIT_AS
+AGENT_MAX_FDS = int(os.getenv("AGENT_MAX_FDS", 0))  # RLIMIT_NOFILE
+AGENT_MAX_CPU_S = int(os.getenv("AGENT_MAX_CPU_S", 0))  # CPU seconds, RLIMIT_CPU (SIGXCPU when reached)
+
+
+def agent_limits() -> dict:
+    return {"memory_mb": AGENT_MAX_MEMORY_MB, "fds": AGENT_MAX_FDS, "cpu_s": AGENT_MAX_CPU_S}
+
+
+def apply_limits() -> None:
+    """
+    preexec_fn of agent processes: own session (so the tree can be killed by process group)
+    plus the per-agent rlimits. Runs in the forked child, so no logging here.
+    """
+    os.setsid()
+    if resource is None:
+        return
+    for limit, value in (
+        (resource.RLIMIT_AS, AGENT_MAX_MEMORY_MB * 2**20),
+        (resource.RLIMIT_NOFILE, AGENT_MAX_FDS),
+        (resource.RLIMIT_CPU, AGENT_MAX_CPU_S),
+    ):
+        if not value:
+            continue
+        _, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, hard))
+
+
+class AgentTelemetry:
+    """Time series of one agent's process tree: the CLI process and its worker and job processes"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.samples: deque[dict] = deque(maxlen=AGENT_TELEMETRY_SAMPLES)
+        # same Process objects across samples: cpu_percent() measures since the previous call on the object
+        self._procs: dict[int, psutil.Process] = {}
+
+    def sample(self) -> dict | None:
+        try:
+            root = psutil.Process(self.pid)
+            tree = [root, *root.children(recursive=True)]
+        except psutil.Error:
+            return None
+        self._procs = {p.pid: self._procs.get(p.pid, p) for p in tree}
+        cpu = rss = 0.0
+        fds = threads = 0
+        for p in self._procs.values():
+            try:
+                with p.oneshot():
+                    cpu += p.cpu_percent()
+                    rss += p.memory_info().rss
+                    threads += p.num_threads()
+                    fds += p.num_fds() if hasattr(p, "num_fds") else p.num_handles()
+            except psutil.Error:
+                pass
+        sample = {
+            "ts": time.time(),
+            "cpu_pct": round(cpu, 1),
+            "rss_mb": round(rss / 2**20, 1),
+            "fds": fds,
+            "threads": threads,
+            "processes": len(self._procs),
+        }
+        self.samples.append(sample)
+        return sample
+
+    def snapshot(self) -> dict:
+        samples = list(self.samples)
+        return {
+            "latest": samples[-1] if samples else None,
+            "peak_rss_mb": max((s["rss_mb"] for s in samples), default=None),
+            "peak_cpu_pct": max((s["cpu_pct"] for s in samples), default=None),
+            "samples": samples,
+        }
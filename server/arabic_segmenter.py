@@ -0,0 +1,162 @@
+"""
+Clause-level streaming segmentation for Arabic TTS
+Cuts the LLM token stream into clauses on Arabic and Latin punctuation, conjunctions and a
+maximum wait, so ElevenLabs starts synthesizing on the first natural clause instead of a full sentence
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+
+from livekit.agents import tokenize
+from livekit.agents.tokenize.tokenizer import TokenData
+from livekit.agents.utils import shortuuid
+
+from turn_latency import percentile
+
+logger = logging.getLogger(__name__)
+
+ARABIC_CLAUSE_SEGMENTER = os.getenv("ARABIC_CLAUSE_SEGMENTER", "1") == "1"
+CLAUSE_MIN_CHARS = int(os.getenv("CLAUSE_MIN_CHARS", 12))  # before a comma-like boundary
+CLAUSE_MIN_CONJ_CHARS = int(os.getenv("CLAUSE_MIN_CONJ_CHARS", 25))  # before a conjunction boundary
+CLAUSE_MAX_WAIT_MS = float(os.getenv("CLAUSE_MAX_WAIT_MS", 400))
+
+# Always a boundary once followed by a space (Latin ones could be decimals or abbreviations otherwise)
+HARD_BOUNDARIES = set(".!?…؟\n")
+SOFT_BOUNDARIES = set(",;:،؛")
+# Arabic marks are unambiguous, no need to wait for the following space
+ARABIC_MARKS = set("؟،؛")
+# Standard and Syrian Arabic words that open a new clause
+CONJUNCTIONS = {
+    "لكن", "ولكن", "لكنّ", "بس", "ثم", "وبعدين", "بعدين", "لأن", "لان", "لأنو", "لانو", "عشان", "مشان",
+    "يعني", "إذا", "اذا", "حتى", "بينما", "كمان", "أو", "او", "لما", "وقت",
+    "but", "because", "so", "then", "and", "or", "when", "if",
+}
+_WORD = re.compile(r"\S+")
+
+
+def _boundary(buf: str) -> tuple[int, str] | None:
+    """(cut index, reason) of the first clause boundary in `buf`, None if no clause is complete"""
+    conjunction = None
+    for m in _WORD.finditer(buf):
+        if m.end() == len(buf):
+            break  # the last word may still be incomplete
+        if m.group().strip(".,!?؟،؛") in CONJUNCTIONS and len(buf[:m.start()].strip()) >= CLAUSE_MIN_CONJ_CHARS:
+            conjunction = m.start()
+            break
+
+    for i, c in enumerate(buf[:conjunction]):
+        followed = i + 1 < len(buf) and buf[i + 1].isspace()
+        if c in HARD_BOUNDARIES and (followed or c in ARABIC_MARKS or c == "\n"):
+            return i + 1, "punctuation"
+        if c in SOFT_BOUNDARIES and (followed or c in ARABIC_MARKS) and len(buf[:i].strip()) >= CLAUSE_MIN_CHARS:
+            return i + 1, "punctuation"
+    return (conjunction, "conjunction") if conjunction is not None else None
+
+
+class ClauseStream(tokenize.SentenceStream):
+    """Emits one TokenData per clause as soon as the clause is complete"""
+
+    def __init__(self, tokenizer: "ArabicClauseTokenizer"):
+        super().__init__()
+        self._tokenizer = tokenizer
+        self._buf = ""
+        self._segment_id = shortuuid()
+        self._first_text_at: float | None = None
+        self._emitted_first = False
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _emit(self, text: str, reason: str) -> None:
+        text = text.strip()
+        if not text:
+            return
+        if not self._emitted_first and self._first_text_at is not None:
+            self._emitted_first = True
+            self._tokenizer._first_clause_ms.append(round((time.perf_counter() - self._first_text_at) * 1000, 1))
+        self._tokenizer.reasons[reason] = self._tokenizer.reasons.get(reason, 0) + 1
+        self._event_ch.send_nowait(TokenData(token=text, segment_id=self._segment_id))
+
+    def _scan(self) -> None:
+        emitted = False
+        while (cut := _boundary(self._buf)) is not None:
+            index, reason = cut
+            self._emit(self._buf[:index], reason)
+            self._buf = self._buf[index:].lstrip()
+            emitted = True
+        if emitted:
+            # the wait restarts with what is left of the buffer
+            self._cancel_timer()
+        self._arm_timer()
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm_timer(self) -> None:
+        # Counted from the first buffered character, later pushes do not extend it: a steady
+        # stream of tokens without punctuation still gets a clause out every CLAUSE_MAX_WAIT_MS
+        if self._timer is None and self._buf.strip():
+            self._timer = asyncio.get_running_loop().call_later(CLAUSE_MAX_WAIT_MS / 1000, self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        # flush up to the last complete word; a lone partial word keeps waiting
+        self._timer = None
+        if self._event_ch.closed:
+            return
+        cut = max(self._buf.rfind(" "), self._buf.rfind("\n"))
+        if cut > 0:
+            self._emit(self._buf[:cut], "timeout")
+            self._buf = self._buf[cut:].lstrip()
+        self._arm_timer()
+
+    def push_text(self, text: str) -> None:
+        self._check_not_closed()
+        if self._first_text_at is None:
+            self._first_text_at = time.perf_counter()
+        self._buf += text
+        self._scan()
+
+    def flush(self) -> None:
+        self._check_not_closed()
+        self._cancel_timer()
+        self._emit(self._buf, "end")
+        self._buf = ""
+        self._segment_id = shortuuid()
+
+    def end_input(self) -> None:
+        self.flush()
+        self._do_close()
+
+    async def aclose(self) -> None:
+        self._cancel_timer()
+        self._do_close()
+
+
+class ArabicClauseTokenizer(tokenize.SentenceTokenizer):
+    """Sentence tokenizer for the ElevenLabs stream that splits at clause level"""
+
+    def __init__(self):
+        self.reasons: dict[str, int] = {}
+        self._first_clause_ms: list[float] = []
+
+    def tokenize(self, text: str, *, language: str | None = None) -> list[str]:
+        clauses = []
+        while (cut := _boundary(text)) is not None:
+            clauses.append(text[:cut[0]].strip())
+            text = text[cut[0]:].lstrip()
+        if text.strip():
+            clauses.append(text.strip())
+        return [c for c in clauses if c]
+
+    def stream(self, *, language: str | None = None) -> ClauseStream:
+        return ClauseStream(self)
+
+    def stats(self) -> dict:
+        return {
+            "clauses": self.reasons,
+            "first_clause_ms_p50": percentile(self._first_clause_ms, 50),
+            "first_clause_ms_p90": percentile(self._first_clause_ms, 90),
+        }
@@ -3,7 +3,6 @@ from livekit import agents, rtc
 from livekit.agents import AgentSession, stt as livekitstt, llm as livekitllm, tts as livekittts
 from livekit.agents import UserInputTranscribedEvent
 from livekit.agents import SpeechCreatedEvent
-from livekit.plugins import openai, tavus, elevenlabs, silero, anthropic
 from livekit import api
 import os
 import logging
@@ -13,8 +12,28 @@ import subprocess
 import psutil
 import atexit
 
-from openai.types.beta.realtime.session import InputAudioTranscription, TurnDetection
 from AgentInstructions import DebugAvatarAgent
+from turn_latency import TurnLatencyTracker
+from provider_routing import attach_routers
+from hedged_llm import HedgedLLM, LLM_HEDGING
+from provider_health import breaker_key, open_circuits, report_failure, watch_providers
+from provider_warmup import PROVIDER_WARMUP, ProviderWarmup, build_openai_client
+from startup import StartupTimeline, avatar_audio_output, chain_plugins, load_plugin, wait_for_avatar_ready
+from realtime_stack import HOT_FAILOVER, REALTIME_STANDBY, build_realtime_model, rebind_after_swap, swap_to_realtime
+from tavus_provisioning import adopt_provisioned_avatar
+from stt_language import STT_LANGUAGE_LOCK, LanguageLock, set_stt_language
+from speculative_llm import SPECULATIVE_LLM, SpeculativeGenerator
+from arabic_segmenter import ARABIC_CLAUSE_SEGMENTER, ArabicClauseTokenizer
+from context_manager import CONTEXT_MANAGER, RollingContext
+from prompt_cache import PromptCacheStats
+from session_mode import AVATAR_MODE, CONTROL_TOPIC
+from session_recorder import SESSION_RECORD, SessionRecorder
+from session_replay import SESSION_REPLAY, replay_chains
+from stand_in_providers import SIM_PROVIDERS, sim_avatar, sim_chains
+from fault_injection import active as fault_active, hang, inject
+from idle_monitor import IdleMonitor
+from session_resume import RECONNECT_GRACE_S, write_presence
+from agent_control import ControlServer
 import sys, signal, time, threading, shutil
 from dataclasses import dataclass
 
@@ -25,6 +44,8 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
 TAVUS_API_KEY = os.getenv("TAVUS_API_KEY")
+# Set by the token server when it already created the Tavus conversation for this room
+TAVUS_PREPROVISIONED = os.getenv("TAVUS_PREPROVISIONED", "0") == "1"
 replica_id = os.getenv("TAVUS_REPLICA_ID")
 persona_id = os.getenv("TAVUS_PERSONA_ID")
 voice_id = os.getenv("ELEVEN_VOICE_ID")
@@ -36,6 +57,8 @@ LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 EXPECTED_USER_IDENTITY = os.getenv("EXPECTED_USER_IDENTITY")
 AVATAR_LANGUAGE = os.getenv("AVATAR_LANGUAGE") 
 AVATAR_LANGUAGE_STT = os.getenv("AVATAR_LANGUAGE_STT")
+# Hard limit on the agent process lifetime, whatever state the session is in
+AGENT_FAILSAFE_S = float(os.getenv("AGENT_FAILSAFE_S", 900))
 
 # ---------------------------------------------------------------------------
 # Fallback process registry utilities (unchanged)
@@ -125,8 +148,10 @@ def atexit_handler():
 atexit.register(atexit_handler)
 
 
-async def shutdown_now(ctx, session, avatar):
+async def shutdown_now(ctx, session, avatar, latency=None):
     logger.info("EMERGENCY SHUTDOWN INITIATED")
+    if latency:
+        latency.close()
     force_kill_self(ctx.room.name)
     # Set a hard deadline - kill process in 10 seconds no matter what
     def deadline_kill():
@@ -137,6 +162,7 @@ async def shutdown_now(ctx, session, avatar):
 
     deadline_thread = threading.Thread(target=deadline_kill, daemon=True)
     deadline_thread.start()
+    hang("shutdown_hang")
     
     # Try quick cleanup (with very short timeouts)
     try:
@@ -341,14 +367,49 @@ async def entrypoint(ctx: agents.JobContext):
     logger.info(f"Room name: {ctx.room.name}")
     avatar = None
     session = None
+    agent = None
+    latency = None
+    routers = []
+    hedged_llm = None
+    language_lock = None
+    speculator = None
+    segmenter = None
+    rolling_context = None
+    prompt_cache = PromptCacheStats()
+    standby_model = None
+    warmup = None
+    recorder = None
+    idle_monitor = None
+    control = None
+    stt_providers = []
     fallback_triggered = False
+    hot_swapped = False
 
     async def trigger_fallback(error_msg: str):
-        nonlocal fallback_triggered
+        nonlocal fallback_triggered, hot_swapped, session, agent, stt_providers
         if fallback_triggered:
             return
         fallback_triggered = True
+        if HOT_FAILOVER and session and not hot_swapped:
+            # Keep the room and the Tavus avatar (if any), only swap the session to the realtime stack
+            logger.error(f"❌ Custom STS stack failing, HOT SWAPPING TO REALTIME STACK... the error btw: {error_msg}")
+            hot_swapped = True
+            try:
+                session, agent = await swap_to_realtime(ctx, session, avatar, realtime_model=standby_model, old_agent=agent)
+                _attach_session_handlers(session)
+                prompt_cache.attach(session)
+                stt_providers = await rebind_after_swap(
+                    session, agent, rolling_context=rolling_context, speculator=speculator,
+                    language_lock=language_lock, routers=routers, on_pronunciation_result=_publish_pronunciation_result,
+                )
+                # a failing realtime session still has the fallback agent to go to
+                fallback_triggered = False
+                return
+            except Exception as swap_error:
+                logger.error(f"❌ Hot failover failed, relaunching fallback agent instead: {swap_error}")
         logger.error(f"❌ Custom STS stack failing, LAUNCHING FALLBACK AGENT... the error btw: {error_msg}")
+        # The fallback agent owns the room from here: a reconnect gets a fresh agent, not this one
+        write_presence(ctx.room.name, "closed")
         try:
             await ctx.room.disconnect()
             await start_new_agent_fallback(ctx.room.name)
@@ -360,15 +421,36 @@ async def entrypoint(ctx: agents.JobContext):
         # ------------------------------------------------------------------
         # Connect to room
         # ------------------------------------------------------------------
+        # VAD model load is CPU bound and independent of the room: run it alongside the connect
+        timeline = StartupTimeline(ctx.room.name)
+        if SESSION_RECORD and not SESSION_REPLAY:
+            recorder = SessionRecorder(ctx.room.name)
+        # Plugins are imported here, on the main thread, and only for providers the chains use
+        dead = open_circuits()
+        with timeline.span("plugin_load"):
+            silero = load_plugin("silero")
+        vad_task = timeline.task("vad_load", asyncio.to_thread(silero.VAD.load))
+
         # Try to disable automatic close on disconnect
         if hasattr(ctx, 'room_input_options'):
             ctx.room_input_options = agents.RoomInputOptions(close_on_disconnect=False)
-        await ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY)
+        connect_task = timeline.task("room_connect", ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY))
+        # Let the connect send its first request, the remaining imports then overlap its round trips
+        await asyncio.sleep(0)
+        with timeline.span("plugin_load_chains"):
+            plugins = {} if SESSION_REPLAY or SIM_PROVIDERS else {name: load_plugin(name) for name in chain_plugins(AVATAR_MODE, dead)}
+        openai = plugins.get("openai")
+        await connect_task
+        if recorder:
+            recorder.attach_room(ctx.room)
 
         # ------------------------------------------------------------------
-        # Create Tavus avatar
+        # Create Tavus avatar (audio-only sessions run without one until upgraded)
         # ------------------------------------------------------------------
-        avatar = tavus.AvatarSession(replica_id=replica_id, persona_id=persona_id)
+        if AVATAR_MODE == "video":
+            avatar = sim_avatar() if SIM_PROVIDERS else plugins["tavus"].AvatarSession(replica_id=replica_id, persona_id=persona_id)
+        else:
+            logger.info("🔈 Audio-only session, no Tavus avatar")
 
         # ------------------------------------------------------------------
         # Create custom STS stack
@@ -377,17 +459,77 @@ async def entrypoint(ctx: agents.JobContext):
         greeting_message = ""
         agent_system_type = "unknown"
         try:
-            vad = silero.VAD.load()
-            if AVATAR_LANGUAGE_STT == "detect":
-                stt = livekitstt.FallbackAdapter([openai.STT(model="gpt-4o-transcribe", detect_language=True), openai.STT(model="whisper-1", detect_language=True)], vad=vad)
+            inject("stack_init")
+            # Providers with an open host-wide circuit breaker are left out of the chains
+            if dead:
+                logger.warning(f"🔌 Skipping providers with open circuit breakers: {list(dead)}")
+
+            def _healthy(kind: str, providers: list) -> list:
+                alive = [p for p in providers if breaker_key(p) not in dead]
+                if not alive:
+                    raise RuntimeError(f"No {kind} provider available, circuit open for {list(dead)}")
+                return alive
+
+            vad = await vad_task
+            openai_client = anthropic_llm = elevenlabs_tts = None
+            if SESSION_REPLAY or SIM_PROVIDERS:
+                # Stand-ins answering from the recording or timed by the SIM_* settings: no network, no API keys
+                stt_providers, llm_providers, tts_providers = (
+                    replay_chains(SESSION_REPLAY) if SESSION_REPLAY else sim_chains(AVATAR_LANGUAGE or "")
+                )
+                stt = livekitstt.FallbackAdapter(stt_providers, vad=vad)
+                llm = livekitllm.FallbackAdapter(llm_providers)
             else:
-                stt = livekitstt.FallbackAdapter([openai.STT(model="gpt-4o-transcribe",language=AVATAR_LANGUAGE_STT), openai.STT(model="whisper-1", language=AVATAR_LANGUAGE_STT)], vad=vad)
-            
-            llm = livekitllm.FallbackAdapter([openai.LLM(model="gpt-4o", temperature=0.7), anthropic.LLM(model="claude-sonnet-4-20250514", temperature=0.7)])
+                # One connection pool for every OpenAI plugin instead of one per plugin
+                openai_client = build_openai_client()
+
+                if AVATAR_LANGUAGE_STT == "detect":
+                    stt_providers = _healthy("STT", [openai.STT(model="gpt-4o-transcribe", detect_language=True, use_realtime=SPECULATIVE_LLM, client=openai_client), openai.STT(model="whisper-1", detect_language=True, client=openai_client)])
+                    if STT_LANGUAGE_LOCK:
+                        language_lock = LanguageLock(stt_providers, AVATAR_LANGUAGE)
+                else:
+                    stt_providers = _healthy("STT", [openai.STT(model="gpt-4o-transcribe",language=AVATAR_LANGUAGE_STT, use_realtime=SPECULATIVE_LLM, client=openai_client), openai.STT(model="whisper-1", language=AVATAR_LANGUAGE_STT, client=openai_client)])
+                stt = livekitstt.FallbackAdapter(stt_providers, vad=vad)
+
+                openai_llm = openai.LLM(model="gpt-4o", temperature=0.7, client=openai_client)
+                # Anthropic only caches behind explicit cache_control marks; OpenAI caches prefixes on its own
+                if "anthropic" in plugins:
+                    anthropic_llm = plugins["anthropic"].LLM(model="claude-sonnet-4-20250514", temperature=0.7, caching="ephemeral")
+                llm_providers = _healthy("LLM", [p for p in (openai_llm, anthropic_llm) if p is not None])
+                if LLM_HEDGING and len(llm_providers) == 2:
+                    # gpt-4o first, Claude fired after the hedge deadline; Claude alone stays as the hard fallback
+                    hedged_llm = HedgedLLM(openai_llm, anthropic_llm)
+                    llm = livekitllm.FallbackAdapter([hedged_llm, anthropic_llm])
+                else:
+                    llm = livekitllm.FallbackAdapter(llm_providers)
+
+                if "elevenlabs" in plugins:
+                    tokenizer_opts = {}
+                    if ARABIC_CLAUSE_SEGMENTER and AVATAR_LANGUAGE == "ar":
+                        # One ElevenLabs generation per clause instead of waiting for the chunk schedule
+                        segmenter = ArabicClauseTokenizer()
+                        tokenizer_opts = {"word_tokenizer": segmenter, "auto_mode": True}
+                    elevenlabs_tts = plugins["elevenlabs"].TTS(voice_id=voice_id, model=model, api_key=ELEVEN_API_KEY, **tokenizer_opts)
+                tts_providers = _healthy("TTS", [p for p in (elevenlabs_tts, openai.TTS(model="gpt-4o-mini-tts", voice="ash", client=openai_client), openai.TTS(model="tts-1", voice="ash", client=openai_client)) if p is not None])
+            tts = livekittts.FallbackAdapter(tts_providers)
+            watch_providers([*stt_providers, *llm_providers, *tts_providers], opened_by=ctx.room.name)
+            prompt_cache.watch(llm_providers)
 
-            tts = livekittts.FallbackAdapter([elevenlabs.TTS(voice_id=voice_id, model=model, api_key=ELEVEN_API_KEY), openai.TTS(model="gpt-4o-mini-tts", voice="ash"), openai.TTS(model="tts-1", voice="ash")])
+            routers = attach_routers(llm, tts)
 
             session = AgentSession(stt=stt, llm=llm, tts=tts, vad=vad)
+            if recorder:
+                recorder.attach_session(session)
+            timeline.mark("providers_built")
+
+            if PROVIDER_WARMUP:
+                # Runs while the avatar starts; the greeting does not wait for it
+                warmup = ProviderWarmup(
+                    openai_client=openai_client,
+                    anthropic_llm=anthropic_llm if anthropic_llm in llm_providers else None,
+                    elevenlabs_tts=elevenlabs_tts if elevenlabs_tts in tts_providers else None,
+                )
+                timeline.task("provider_warmup", warmup.warm_once())
 
             agent_system_type = "elevenlabs"
         except Exception as sts_error:
@@ -436,33 +578,96 @@ async def entrypoint(ctx: agents.JobContext):
             raise RuntimeError("Failed to create any session (both primary and fallback failed)")
 
         # ------------------------------------------------------------------
-        # Start avatar in room
+        # Start avatar in room (concurrently with the session start)
         # ------------------------------------------------------------------
 
         # This publishes the avatar video to the room
-        await avatar.start(session, room=ctx.room)
+        async def _start_avatar():
+            try:
+                if TAVUS_PREPROVISIONED and await adopt_provisioned_avatar(ctx, avatar):
+                    return
+                await avatar.start(session, room=ctx.room)
+            except Exception as avatar_error:
+                if not SIM_PROVIDERS:
+                    report_failure("tavus", str(avatar_error), opened_by=ctx.room.name)
+                raise
 
+        avatar_task = None
+        if avatar:
+            # Route audio to the avatar up front so the session can start before the replica joins
+            # (the stand-in avatar moves the output itself once started)
+            if not SIM_PROVIDERS:
+                session.output.audio = avatar_audio_output(ctx.room, avatar)
+            avatar_task = timeline.task("avatar_start", _start_avatar())
 
         # ------------------------------------------------------------------
         # Start interactive session
         # ------------------------------------------------------------------
         agent = DebugAvatarAgent(system_type="elevenlabs")
         greeting_message = agent.get_greeting_message()
-        # Disable automatic close on participant disconnect
-        session._room_input_options = agents.RoomInputOptions(close_on_disconnect=False)
-        await session.start(room=ctx.room, agent=agent)
+        latency = TurnLatencyTracker(ctx.room.name)
+        latency.attach(session)
+        if hedged_llm:
+            latency.register_summary("llm_hedging", hedged_llm.stats)
+        for router in routers:
+            latency.register_summary(f"{router.kind}_routing", router.snapshot)
+        if language_lock:
+            language_lock.attach(session)
+            latency.register_summary("stt_language", language_lock.stats)
+        latency.register_summary("prompt_cache", prompt_cache.stats)
+        idle_monitor = IdleMonitor(CONTROL_TOPIC)
+        idle_monitor.attach(session)
+        idle_monitor.attach_room(ctx.room)
+        latency.register_summary("idle", idle_monitor.stats)
+        if segmenter:
+            latency.register_summary("tts_segmenter", segmenter.stats)
+        if CONTEXT_MANAGER and openai_client:
+            # Older turns are folded into a summary so the prompt does not grow over the lesson
+            rolling_context = RollingContext(agent, openai_client)
+            rolling_context.attach(session)
+            latency.register_summary("context", rolling_context.stats)
+        if SPECULATIVE_LLM:
+            # interim transcripts come from the streaming gpt-4o-transcribe above
+            speculator = SpeculativeGenerator(llm, latency=latency)
+            speculator.attach(session, agent)
+            latency.register_summary("llm_speculation", speculator.stats)
+        if SESSION_REPLAY:
+            # The replay's fake room has no room IO: audio comes from and goes to the harness
+            session.input.audio, session.output.audio = ctx.replay_audio()
+            session_started = session.start(agent=agent)
+        else:
+            # A user who drops out must not close the session: they may come back within RECONNECT_GRACE_S
+            session_started = session.start(room=ctx.room, agent=agent,
+                                            room_input_options=agents.RoomInputOptions(close_on_disconnect=False))
+        await timeline.stage("session_start", session_started)
+        for router in routers:
+            router.start()
+        if warmup:
+            warmup.start_keepalive()
+        if HOT_FAILOVER and REALTIME_STANDBY:
+            # Off the critical path: the greeting does not wait for the standby connection
+            standby_model = build_realtime_model(standby=True)
+            standby_model.start_keep_warm()
 
-        # --- Temp instruction state (one-turn override) ---
-        agent._orig_instructions = agent.instructions  # Use consistent source
-        agent._temp_prompt_active = False
-        agent._temp_prompt_purpose = None
-        agent._temp_prompt_text = None
+        # --- Local pronunciation scores go to the client alongside the spoken feedback ---
+        def _publish_pronunciation_result(result):
+            payload = json.dumps({
+                "type": "pronunciation_result",
+                "target": result.target,
+                "transcript": result.transcript,
+                "score": result.score,
+                "verdict": result.verdict,
+                "mismatches": [{"expected": m.expected, "heard": m.heard, "score": m.score} for m in result.mismatches],
+            })
+            asyncio.create_task(ctx.room.local_participant.publish_data(
+                payload.encode("utf-8"), reliable=True, topic="avatar"
+            ))
+        agent.on_pronunciation_result = _publish_pronunciation_result
 
         # --- Data message serialization lock ---
         data_lock = asyncio.Lock()
 
         # --- For voice-initiated turns (not user_message), use speech_created to know when to restore ---
-        @session.on("speech_created")
         def _on_speech_created(ev: SpeechCreatedEvent):
             # Emit started event only for non-text-initiated turns
             async def _emit_started():
@@ -478,7 +683,12 @@ async def entrypoint(ctx: agents.JobContext):
             if not getattr(ev, "user_initiated", False):
                 asyncio.create_task(_emit_started())
 
-            # When speech finishes, emit ended and, if a temp prompt was active, restore defaults.
+            # Only the reply to a voice turn carries the turn's realtime overlay; greeting, idle prompt and
+            # text turns are generate_reply calls of ours (user_initiated), text turns retire their own
+            reply_agent = agent
+            overlay = agent.overlay_token() if ev.source == "generate_reply" and not ev.user_initiated else None
+
+            # When speech finishes, emit ended and retire a realtime instruction overlay
             def _on_done(_):
                 async def _finish_and_restore():
                     # Emit ended only for voice path (non-text-initiated)
@@ -490,15 +700,10 @@ async def entrypoint(ctx: agents.JobContext):
                             )
                         except Exception:
                             pass
-                    # Always revert if a temp prompt is active
-                    if getattr(agent, "_temp_prompt_active", False):
-                        await agent.update_instructions(agent._orig_instructions)  # <-- revert remotely
-                        agent._current_instructions = agent._orig_instructions     # <-- sync local property
-                        agent._temp_prompt_active = False
-                        purpose = agent._temp_prompt_purpose
-                        agent._temp_prompt_purpose = None
-                        agent._temp_prompt_text = None
-                        logger.info(f"System prompt reset to default after one voice turn (was '{purpose}')")
+                    # Pipeline overlays are consumed by their generation; realtime ones are retired here,
+                    # once the reply they were meant for played out in full
+                    if not ev.speech_handle.interrupted:
+                        await reply_agent.end_overlay_turn(overlay)
                 asyncio.create_task(_finish_and_restore())
 
             # Always attach completion callback to the speech handle
@@ -507,8 +712,66 @@ async def entrypoint(ctx: agents.JobContext):
             except Exception as e:
                 logger.warning(f"Could not attach done callback to speech handle: {e}")
 
+        # Session-level handlers, re-attached when the session is hot swapped
+        def _attach_session_handlers(session):
+            session.on("speech_created", _on_speech_created)
+            session.on("close", _on_session_close)
+            if latency:
+                latency.attach(session)
+            if idle_monitor:
+                idle_monitor.attach(session)
+
+        session.on("speech_created", _on_speech_created)
+
+        # An unrecoverable STT/LLM/TTS error closes the session: fail over instead of going silent
+        def _on_session_close(ev):
+            if getattr(ev, "error", None) is not None:
+                asyncio.create_task(trigger_fallback(f"session closed on error: {ev.error}"))
+        session.on("close", _on_session_close)
+
         # --- Listen for data messages ---
+        async def _publish_mode(mode: str):
+            try:
+                await ctx.room.local_participant.publish_data(
+                    json.dumps({"type": "avatar_mode", "mode": mode}).encode("utf-8"), reliable=True, topic="avatar"
+                )
+            except Exception as e:
+                logger.debug(f"Could not publish avatar_mode: {e}")
+
+        async def _upgrade_to_video():
+            # Same session, only the audio output moves to the newly started avatar
+            nonlocal avatar
+            if avatar is not None:
+                return
+            logger.info("🎥 Upgrading audio-only session to video")
+            if SIM_PROVIDERS:
+                avatar = sim_avatar()
+            else:
+                avatar = load_plugin("tavus").AvatarSession(replica_id=replica_id, persona_id=persona_id)
+            try:
+                await avatar.start(session, room=ctx.room)
+                if not SIM_PROVIDERS:
+                    await wait_for_avatar_ready(ctx.room, None, avatar)
+            except Exception as e:
+                # avatar.start only moves the audio output once the replica joined
+                logger.error(f"Video upgrade failed, staying audio-only: {e}")
+                if not SIM_PROVIDERS:
+                    report_failure("tavus", str(e), opened_by=ctx.room.name)
+                avatar = None
+                return
+            await _publish_mode("video")
+
         def on_data_received(data_packet: rtc.DataPacket):
+            if data_packet.topic == CONTROL_TOPIC:
+                # Only the token server (server API, no participant) may send control messages
+                if data_packet.participant is None:
+                    try:
+                        if json.loads(data_packet.data.decode("utf-8")).get("type") == "upgrade_video":
+                            asyncio.create_task(_upgrade_to_video())
+                    except Exception as e:
+                        logger.warning(f"Bad control message: {e}")
+                return
+
             async def handle_data():
                 async with data_lock:
                     try:
@@ -539,32 +802,25 @@ async def entrypoint(ctx: agents.JobContext):
                                 
                                 # Generate the reply (includes TTS streaming)
                                 logger.debug(f"🤖 Starting reply generation for content: '{content[:50]}...'")
+                                latency.begin_text_turn()
+                                overlay = agent.overlay_token()
                                 handle = await session.generate_reply(user_input=content)
                                 logger.debug("✅ Reply generation initiated")
                                 
-                                try:
-                                    # Wait for the TTS audio to finish playing to LiveKit
-                                    logger.debug("⏳ Waiting for TTS playout to complete...")
-                                    await handle.wait_for_playout()
-                                    logger.debug("✅ TTS playout completed successfully")
-                                    
-                                    # Authoritatively signal EOS to clients
-                                    logger.debug("🔚 Emitting avatar_speech_ended event")
-                                    speech_ended_msg = json.dumps({"type": "avatar_speech_ended"})
-                                    await ctx.room.local_participant.publish_data(
-                                        speech_ended_msg.encode('utf-8'), reliable=True, topic="avatar"
-                                    )
-                                    logger.debug("✅ avatar_speech_ended event emitted successfully")
-                                finally:
-                                    # If a temporary system prompt was in effect for a text turn, clear it now
-                                    if getattr(agent, "_temp_prompt_active", False):
-                                        await agent.update_instructions(agent._orig_instructions)  # <-- revert remotely
-                                        agent._current_instructions = agent._orig_instructions     # <-- sync local property
-                                        agent._temp_prompt_active = False
-                                        purpose = agent._temp_prompt_purpose
-                                        agent._temp_prompt_purpose = None
-                                        agent._temp_prompt_text = None
-                                        logger.info(f"System prompt reset to default after one text turn (was '{purpose}')")
+                                # Wait for the TTS audio to finish playing to LiveKit
+                                logger.debug("⏳ Waiting for TTS playout to complete...")
+                                await handle.wait_for_playout()
+                                if not handle.interrupted:
+                                    await agent.end_overlay_turn(overlay)
+                                logger.debug("✅ TTS playout completed successfully")
+
+                                # Authoritatively signal EOS to clients
+                                logger.debug("🔚 Emitting avatar_speech_ended event")
+                                speech_ended_msg = json.dumps({"type": "avatar_speech_ended"})
+                                await ctx.room.local_participant.publish_data(
+                                    speech_ended_msg.encode('utf-8'), reliable=True, topic="avatar"
+                                )
+                                logger.debug("✅ avatar_speech_ended event emitted successfully")
                                 
                             except Exception as e:
                                 logger.error(f"❌ Error processing prompt: {e}", exc_info=True)
@@ -587,22 +843,11 @@ async def entrypoint(ctx: agents.JobContext):
                             prompt = (data_obj.get('content') or "").strip()
                             logger.debug(f"📋 Received system_prompt with purpose='{purpose}' and content length={len(prompt)} chars")
                             if purpose in ["pronunciation", "debug_override"] and prompt:
-                                # prevent overlapping temp prompts
-                                if getattr(agent, "_temp_prompt_active", False):
-                                    logger.warning("Temp system prompt already active; ignoring new one until current completes.")
-                                    return
-                                
                                 try:
-                                    # store original and apply a one-turn override
-                                    agent._orig_instructions = agent.instructions
-                                    await agent.update_instructions(prompt)      # <-- propagate to running session
-                                    agent._current_instructions = prompt         # <-- keep your override property in sync
-                                    agent._temp_prompt_active = True
-                                    agent._temp_prompt_purpose = purpose
-                                    agent._temp_prompt_text = prompt
-                                    logger.info(f"Applied temporary '{purpose}' system prompt for next turn")
-                                    
-                                    # only ACK after the update was sent
+                                    # Attached to the next reply and dropped after it; overlapping prompts queue up
+                                    await agent.queue_overlay(purpose, prompt, target=(data_obj.get('target') or "").strip() or None)
+
+                                    # only ACK once the overlay is queued
                                     try:
                                         ack = json.dumps({"type": "system_prompt_ack", "purpose": purpose})
                                         await ctx.room.local_participant.publish_data(
@@ -631,11 +876,67 @@ async def entrypoint(ctx: agents.JobContext):
         
         ctx.room.on("data_received", on_data_received)
 
+        # --- Local control channel from the token server: reconfigure without a respawn ---
+        stop_requested = asyncio.Event()
+
+        async def _control_health():
+            return {
+                "agent_state": session.agent_state,
+                "user_state": session.user_state,
+                "user_present": EXPECTED_USER_IDENTITY in ctx.room.remote_participants,
+                "mode": "video" if avatar else "audio",
+                "language": AVATAR_LANGUAGE,
+                "language_stt": AVATAR_LANGUAGE_STT,
+                "system_type": agent.system_type,
+                "fallback_triggered": fallback_triggered,
+                "idle": idle_monitor.stats(),
+            }
+
+        async def _control_set_language(language: str, language_stt: str | None = None):
+            global AVATAR_LANGUAGE, AVATAR_LANGUAGE_STT
+            language_stt = language_stt or language
+            AVATAR_LANGUAGE, AVATAR_LANGUAGE_STT = language, language_stt
+            # agents built later from the environment (hot failover) keep the new language
+            os.environ["AVATAR_LANGUAGE"], os.environ["AVATAR_LANGUAGE_STT"] = language, language_stt
+            await agent.set_language(language)
+            if language_lock:
+                language_lock.session_language = language
+                language_lock.pin(None if language_stt == "detect" else language_stt)
+            else:
+                set_stt_language(stt_providers, "" if language_stt == "detect" else language_stt)
+            logger.info(f"🎛️ Language switched to {language} (STT {language_stt})")
+            return {"language": language, "language_stt": language_stt}
+
+        async def _control_set_instructions(instructions: str):
+            await agent.set_instructions(instructions)
+            logger.info(f"🎛️ Instructions replaced ({len(instructions)} chars)")
+
+        async def _control_stop():
+            stop_requested.set()
+            return {"stopping": True}
+
+        control = ControlServer(ctx.room.name)
+        control.on("health", _control_health)
+        control.on("set_language", _control_set_language)
+        control.on("set_instructions", _control_set_instructions)
+        control.on("stop", _control_stop)
+        latency.register_summary("control", control.stats)
+        try:
+            await control.start()
+        except OSError as e:
+            logger.warning(f"Control channel unavailable: {e}")
+
         # ------------------------------------------------------------------
         # Initial greeting
         # ------------------------------------------------------------------
+        # Readiness signal instead of a fixed sleep; an avatar start failure propagates from here
+        if avatar_task:
+            # the stand-in avatar publishes no video, its start is the readiness signal
+            await timeline.stage("avatar_ready", avatar_task if SIM_PROVIDERS else wait_for_avatar_ready(ctx.room, avatar_task, avatar))
+        await _publish_mode("video" if avatar else "audio")
+        timeline.mark("greeting_requested")
+        timeline.log()
         try:
-            await asyncio.sleep(1.5)
             # Emit speech started event for greeting
             greeting_started_msg = json.dumps({"type": "avatar_speech_started"})
             await ctx.room.local_participant.publish_data(
@@ -644,6 +945,8 @@ async def entrypoint(ctx: agents.JobContext):
             logger.debug("Emitted avatar_speech_started event for greeting")
             
             # Generate greeting
+            inject("greeting_api_key")
+            latency.begin_greeting()
             handle = await session.generate_reply(instructions=greeting_message)
             
             # Wait for greeting TTS to finish
@@ -666,6 +969,17 @@ async def entrypoint(ctx: agents.JobContext):
             else:
                 logger.info("  - Will continue without initial greeting")
 
+        # --- Check on a quiet user, end the session if nobody answers ---
+        async def _speak_idle_prompt():
+            await ctx.room.local_participant.publish_data(
+                json.dumps({"type": "avatar_speech_started"}).encode("utf-8"), reliable=True, topic="avatar"
+            )
+            handle = await session.generate_reply(instructions=agent.get_idle_message())
+            await handle.wait_for_playout()
+            await ctx.room.local_participant.publish_data(
+                json.dumps({"type": "avatar_speech_ended"}).encode("utf-8"), reliable=True, topic="avatar"
+            )
+        idle_monitor.start(_speak_idle_prompt)
 
         # ------------------------------------------------------------------
         # Monitor participants and exit when *human* participants leave
@@ -673,24 +987,78 @@ async def entrypoint(ctx: agents.JobContext):
         expected_user = EXPECTED_USER_IDENTITY
         logger.info(f"Expected user identity: {expected_user}")
         user_left = asyncio.Event()
+        user_back = asyncio.Event()
 
         def _on_p_disconnected(p):
-            if expected_user and p.identity == expected_user:
+            if expected_user and p.identity == expected_user and not fault_active("user_left"):
                 user_left.set()
         ctx.room.on("participant_disconnected", _on_p_disconnected)
 
+        def _on_p_connected(p):
+            if p.identity == expected_user:
+                user_back.set()
+        ctx.room.on("participant_connected", _on_p_connected)
+
+        async def _wait_first(*events: asyncio.Event):
+            tasks = [asyncio.create_task(ev.wait()) for ev in events]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        async def _user_reconnected() -> bool:
+            """Hold the session while the user is gone; the token server hands the room back to them"""
+            user_back.clear()
+            # rejoining with the same identity evicts the stale participant, the new one may already be here
+            if expected_user in ctx.room.remote_participants:
+                return True
+            logger.info("User %s left; holding the session %.0fs for a reconnect.", expected_user, RECONNECT_GRACE_S)
+            write_presence(ctx.room.name, "waiting", until=time.time() + RECONNECT_GRACE_S)
+            try:
+                await asyncio.wait_for(_wait_first(user_back, stop_requested), RECONNECT_GRACE_S)
+            except asyncio.TimeoutError:
+                pass
+            return user_back.is_set() and not stop_requested.is_set()
 
         if expected_user:
             logger.info("Waiting for user %s to leave...", expected_user)
+            write_presence(ctx.room.name, "active")
             try:
-                await user_left.wait()
-                logger.info("User %s left; 4s grace then shutdown.", expected_user)
-                await asyncio.sleep(4)
-                await shutdown_now(ctx, session, avatar)
+                while True:
+                    await _wait_first(user_left, idle_monitor.idle, stop_requested)
+                    if (stop_requested.is_set() or not user_left.is_set() or RECONNECT_GRACE_S <= 0
+                            or not await _user_reconnected()):
+                        break
+                    logger.info("🔁 User %s reconnected; resuming the session.", expected_user)
+                    user_left.clear()
+                    write_presence(ctx.room.name, "active")
+                    idle_monitor.touch("reconnect")
+                    # messages published while the user was away are lost
+                    await _publish_mode("video" if avatar else "audio")
+                write_presence(ctx.room.name, "closed")
+                if user_left.is_set() and not stop_requested.is_set():
+                    if RECONNECT_GRACE_S > 0:
+                        logger.info("User %s did not come back; shutting down.", expected_user)
+                    else:
+                        logger.info("User %s left; 4s grace then shutdown.", expected_user)
+                        await asyncio.sleep(4)
+                else:
+                    reason = "stopped" if stop_requested.is_set() else "idle"
+                    logger.info("User %s session %s; shutting down.", expected_user, reason)
+                    try:
+                        await ctx.room.local_participant.publish_data(
+                            json.dumps({"type": "session_ended", "reason": reason}).encode("utf-8"),
+                            reliable=True, topic="avatar",
+                        )
+                    except Exception as e:
+                        logger.debug(f"Could not publish session_ended: {e}")
+                await shutdown_now(ctx, session, avatar, latency)
                 force_kill_self(ctx.room.name, kill_self=True)
             except asyncio.CancelledError:
                 logger.warning("Shutdown cancelled by framework - forcing termination anyway!")
-                await shutdown_now(ctx, session, avatar)
+                write_presence(ctx.room.name, "closed")
+                await shutdown_now(ctx, session, avatar, latency)
                 force_kill_self(ctx.room.name, kill_self=True)
             return
         else:
@@ -708,8 +1076,31 @@ async def entrypoint(ctx: agents.JobContext):
         
         kill_timer = threading.Thread(target=final_kill, daemon=True)
         kill_timer.start()
+        hang("finally_hang")
         
         try:
+            if latency:
+                latency.close()
+            for router in routers:
+                try:
+                    await asyncio.wait_for(router.aclose(), timeout=1)
+                except:
+                    pass
+            if warmup:
+                await warmup.aclose()
+            if rolling_context:
+                await rolling_context.aclose()
+            if recorder:
+                recorder.close()
+            if idle_monitor:
+                await idle_monitor.aclose()
+            if control:
+                await control.aclose()
+            if standby_model:
+                try:
+                    await asyncio.wait_for(standby_model.aclose(), timeout=1)
+                except:
+                    pass
             # Quick cleanup attempts
             if 'session' in locals() and session:
                 logger.info("Finally: Stopping agent session...")
@@ -744,10 +1135,10 @@ async def entrypoint(ctx: agents.JobContext):
 if __name__ == "__main__":
     logger.info("Starting Tavus Avatar Agent Worker...")
     
-    # Start a failsafe timer that will kill the process after 60 seconds no matter what
+    # Start a failsafe timer that will kill the process after AGENT_FAILSAFE_S no matter what
     def failsafe_kill():
-        time.sleep(900)
-        logger.error("FAILSAFE: Process still alive after 15 minutes, force killing!")
+        time.sleep(AGENT_FAILSAFE_S)
+        logger.error(f"FAILSAFE: Process still alive after {AGENT_FAILSAFE_S:.0f}s, force killing!")
         os.killpg(os.getpgid(os.getpid()), signal.SIGKILL)
         os._exit(1)
     
@@ -5,20 +5,22 @@ Enhanced Tavus Avatar Agent with proper cleanup and error handling
 from dotenv import load_dotenv
 #from flask import session
 from livekit import agents, rtc
-from livekit.agents import AgentSession, Agent
-from livekit.plugins import openai, tavus, elevenlabs, silero
+from livekit.agents import AgentSession, Agent, stt as livekitstt, llm as livekitllm, tts as livekittts
 from livekit import api
 import os
 import logging
 import asyncio
 import json
-from openai.types.beta.realtime.session import InputAudioTranscription, TurnDetection
 import signal
 import time
 import threading
 import psutil
 import atexit
 from AgentInstructions import DebugAvatarAgent
+from realtime_stack import build_realtime_model
+from startup import StartupTimeline, avatar_audio_output, load_plugin, wait_for_avatar_ready
+from session_mode import AVATAR_MODE, CONTROL_TOPIC
+from stand_in_providers import SIM_PROVIDERS, sim_avatar, sim_chains
 import subprocess
 
 # Load environment variables
@@ -30,6 +32,7 @@ AVATAR_LANGUAGE = os.getenv("AVATAR_LANGUAGE")
 AVATAR_LANGUAGE_STT = os.getenv("AVATAR_LANGUAGE_STT")
 replica_id = os.getenv("TAVUS_REPLICA_ID")
 persona_id = os.getenv("TAVUS_PERSONA_ID")
+AGENT_FAILSAFE_S = float(os.getenv("AGENT_FAILSAFE_S", 900))
 
 # Set up detailed logging
 logging.basicConfig(
@@ -121,52 +124,78 @@ async def entrypoint(ctx: agents.JobContext):
     
     try:
         # Connect to room
+        timeline = StartupTimeline(ctx.room.name)
         if hasattr(ctx, 'room_input_options'):
             ctx.room_input_options = agents.RoomInputOptions(close_on_disconnect=False)
-        await ctx.connect()
+        await timeline.stage("room_connect", ctx.connect())
         
-        # Create Tavus avatar
-        avatar = tavus.AvatarSession(replica_id=replica_id, persona_id=persona_id)
-
-        realtime_model = openai.realtime.RealtimeModel(
-            model="gpt-4o-realtime-preview-2024-12-17",
-            voice="echo",
-            api_key=OPENAI_API_KEY,
-            input_audio_transcription=InputAudioTranscription(
-                model="gpt-4o-transcribe",
-                language=AVATAR_LANGUAGE,
-            ),
-            temperature=1.0,
-            turn_detection=TurnDetection(
-                type="semantic_vad",
-                eagerness="auto",
-                create_response=True,
-                interrupt_response=True,
-            ),
+        # Create Tavus avatar (audio-only sessions run without one until upgraded)
+        if AVATAR_MODE == "video":
+            avatar = sim_avatar() if SIM_PROVIDERS else load_plugin("tavus").AvatarSession(replica_id=replica_id, persona_id=persona_id)
+
+        if SIM_PROVIDERS:
+            # Stand-in for the realtime model; the faults injected into the main agent's chains do not apply
+            stt_providers, llm_providers, tts_providers = sim_chains(AVATAR_LANGUAGE or "", inject_failures=False)
+            session = AgentSession(
+                stt=livekitstt.FallbackAdapter(stt_providers, vad=load_plugin("silero").VAD.load()),
+                llm=livekitllm.FallbackAdapter(llm_providers),
+                tts=livekittts.FallbackAdapter(tts_providers),
+            )
+        else:
+            realtime_model = build_realtime_model()
 
-        )
-        
-        # Create agent session
-        session = AgentSession(llm=realtime_model)
+            # Create agent session
+            session = AgentSession(llm=realtime_model)
 
         
         # Start avatar in room
-        # This publishes the avatar video to the room
-        await avatar.start(session, room=ctx.room)
-        
-        # Add a small delay to ensure avatar is ready
-        await asyncio.sleep(1)
+        # This publishes the avatar video to the room, concurrently with the session start
+        avatar_task = None
+        if avatar:
+            if not SIM_PROVIDERS:
+                session.output.audio = avatar_audio_output(ctx.room, avatar)
+            avatar_task = timeline.task("avatar_start", avatar.start(session, room=ctx.room))
         
         # Start the interactive session
         agent = DebugAvatarAgent(system_type="openai_realtime")
         # Disable automatic close on participant disconnect
         if hasattr(session, '_room_input_options'):
             session._room_input_options = agents.RoomInputOptions(close_on_disconnect=False)
-        await session.start(room=ctx.room, agent=agent)
+        await timeline.stage("session_start", session.start(room=ctx.room, agent=agent))
+
+        async def _upgrade_to_video():
+            nonlocal avatar
+            if avatar is not None:
+                return
+            logger.info("Upgrading audio-only session to video")
+            if SIM_PROVIDERS:
+                avatar = sim_avatar()
+            else:
+                avatar = load_plugin("tavus").AvatarSession(replica_id=replica_id, persona_id=persona_id)
+            try:
+                await avatar.start(session, room=ctx.room)
+                if not SIM_PROVIDERS:
+                    await wait_for_avatar_ready(ctx.room, None, avatar)
+                await ctx.room.local_participant.publish_data(
+                    json.dumps({"type": "avatar_mode", "mode": "video"}).encode("utf-8"), reliable=True, topic="avatar"
+                )
+            except Exception as e:
+                logger.error(f"Video upgrade failed, staying audio-only: {e}")
+                avatar = None
 
         # --- Listen for data messages ---
         def on_data_received(data_packet: rtc.DataPacket):
             """Handle data messages from Flutter app"""
+            if data_packet.topic == CONTROL_TOPIC:
+                # Only the token server (server API, no participant) may send control messages
+                if data_packet.participant is None:
+                    try:
+                        if json.loads(data_packet.data.decode("utf-8")).get("type") == "upgrade_video":
+                            asyncio.create_task(_upgrade_to_video())
+                    except Exception as e:
+                        logger.warning(f"Bad control message: {e}")
+                return
+
             async def handle_data():
                 try:
                     # Decode the data
@@ -218,8 +247,19 @@ async def entrypoint(ctx: agents.JobContext):
 
         greeting_message = agent.get_greeting_message()
         logger.info("Step 10: Generating initial greeting...")
+        # Readiness signal instead of fixed sleeps; an avatar start failure propagates from here
+        if avatar_task:
+            await timeline.stage("avatar_ready", avatar_task if SIM_PROVIDERS else wait_for_avatar_ready(ctx.room, avatar_task, avatar))
+        try:
+            await ctx.room.local_participant.publish_data(
+                json.dumps({"type": "avatar_mode", "mode": "video" if avatar else "audio"}).encode("utf-8"),
+                reliable=True, topic="avatar",
+            )
+        except Exception as e:
+            logger.debug(f"Could not publish avatar_mode: {e}")
+        timeline.mark("greeting_requested")
+        timeline.log()
         try:
-            await asyncio.sleep(1.5)
             await session.generate_reply(instructions=greeting_message)
 
         except Exception as e:
@@ -350,10 +390,10 @@ async def entrypoint(ctx: agents.JobContext):
 if __name__ == "__main__":
     logger.info("Starting Tavus Avatar Agent Worker (Fallback)...")
     
-    # Start a failsafe timer that will kill the process after 15 minutes no matter what
+    # Start a failsafe timer that will kill the process after AGENT_FAILSAFE_S no matter what
     def failsafe_kill():
-        time.sleep(900)  # 15 minutes
-        logger.error("FAILSAFE: Process still alive after 15 minutes, force killing!")
+        time.sleep(AGENT_FAILSAFE_S)
+        logger.error(f"FAILSAFE: Process still alive after {AGENT_FAILSAFE_S:.0f}s, force killing!")
         os.kill(os.getpid(), signal.SIGKILL)
     
     failsafe_thread = threading.Thread(target=failsafe_kill, daemon=True)
@@ -0,0 +1,329 @@
+"""
+Single-host capacity test
+`python capacity_driver.py --levels 1,2,4,8` starts token_server.py with SIM_PROVIDERS=1, launches N agents
+through /token at each level, drives every room with a simulated user and reports turn latency
+against concurrency, with the CPU and RSS of every agent's process tree.
+Needs LiveKit credentials and TOKEN_SERVER_API_KEY; no provider API keys.
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import logging
+import argparse
+import statistics
+import subprocess
+
+import aiohttp
+import psutil
+from dotenv import load_dotenv
+from livekit import rtc
+from livekit.agents.types import ATTRIBUTE_AGENT_STATE
+
+from turn_latency import LATENCY_LOG_PATH, percentile
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+TOKEN_SERVER_API_KEY = os.getenv("TOKEN_SERVER_API_KEY")
+SAMPLE_INTERVAL = 1.0
+REPLY_TIMEOUT = 30.0
+# Agents and token server run on stand-ins; features that need a provider network are off
+_SERVER_ENV = {
+    "SIM_PROVIDERS": "1",
+    "TAVUS_EARLY_PROVISION": "0",
+    "VIDEO_SESSION_CAPACITY": "0",
+    "PROVIDER_WARMUP": "0",
+    "HOT_FAILOVER": "0",
+    "REALTIME_STANDBY": "0",
+    "SPECULATIVE_LLM": "0",
+    "CONTEXT_MANAGER": "0",
+    "SESSION_RECORD": "0",
+}
+_MIC_RATE = 16000
+_FRAME_SAMPLES = _MIC_RATE // 50  # 20 ms
+# identity/room ids of the test sessions, clear of the counter ids real clients get
+_ID_BASE = 900_000
+
+
+# ---------------------------------------------------------------------------
+# Simulated user
+# ---------------------------------------------------------------------------
+class SimUser:
+    """
+    Joins the room like the Flutter client: publishes a microphone track (silence between turns, so the
+    agent's VAD runs on every frame), waits for the greeting, then takes `turns` turns, each after the
+    previous reply ended. A turn is a user_message, or the `speech` PCM on the microphone when given.
+    """
+
+    def __init__(self, session: dict, *, turns: int, think_s: float, speech: bytes | None = None,
+                 reply_timeout: float = REPLY_TIMEOUT):
+        self.session = session
+        self.reply_timeout = reply_timeout
+        self.turns = turns
+        self.think_s = think_s
+        self.speech = speech
+        self.replies = 0
+        self.missed = 0
+        self.speaking_at: list[float] = []  # time.monotonic() whenever an agent in the room started speaking
+        self.left_at: float | None = None
+        self._room = rtc.Room()
+        self._speech_ended = asyncio.Event()
+        self._speak = asyncio.Event()
+
+    def _on_attributes(self, changed: dict, participant) -> None:
+        if changed.get(ATTRIBUTE_AGENT_STATE) == "speaking":
+            self.speaking_at.append(time.monotonic())
+
+    def _on_data(self, packet: rtc.DataPacket) -> None:
+        if packet.topic != "avatar":
+            return
+        try:
+            if json.loads(packet.data.decode("utf-8")).get("type") == "avatar_speech_ended":
+                self._speech_ended.set()
+        except ValueError:
+            pass
+
+    async def _mic(self, source: rtc.AudioSource) -> None:
+        silence = b"\x00\x00" * _FRAME_SAMPLES
+        while True:
+            if self._speak.is_set():
+                self._speak.clear()
+                for i in range(0, len(self.speech), _FRAME_SAMPLES * 2):
+                    chunk = self.speech[i:i + _FRAME_SAMPLES * 2].ljust(_FRAME_SAMPLES * 2, b"\x00")
+                    await source.capture_frame(rtc.AudioFrame(chunk, _MIC_RATE, 1, _FRAME_SAMPLES))
+            # capture_frame blocks once its buffer is full, which paces the track in real time
+            await source.capture_frame(rtc.AudioFrame(silence, _MIC_RATE, 1, _FRAME_SAMPLES))
+
+    async def _reply(self) -> None:
+        try:
+            await asyncio.wait_for(self._speech_ended.wait(), self.reply_timeout)
+            self.replies += 1
+        except asyncio.TimeoutError:
+            self.missed += 1
+        self._speech_ended.clear()
+
+    async def run(self) -> None:
+        self._room.on("data_received", self._on_data)
+        self._room.on("participant_attributes_changed", self._on_attributes)
+        await self._room.connect(self.session["url"], self.session["accessToken"])
+        source = rtc.AudioSource(_MIC_RATE, 1)
+        track = rtc.LocalAudioTrack.create_audio_track("microphone", source)
+        await self._room.local_participant.publish_track(
+            track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE)
+        )
+        mic_task = asyncio.create_task(self._mic(source))
+        try:
+            await self._reply()  # greeting
+            for i in range(self.turns):
+                await asyncio.sleep(self.think_s)
+                if self.speech:
+                    self._speak.set()
+                else:
+                    await self._room.local_participant.publish_data(
+                        json.dumps({"type": "user_message", "content": f"Question {i + 1}: what is this word?"}),
+                        reliable=True, topic="avatar",
+                    )
+                await self._reply()
+        finally:
+            mic_task.cancel()
+            await self._room.disconnect()
+            self.left_at = time.monotonic()
+
+
+def load_speech(path: str) -> bytes:
+    """16 kHz mono 16-bit WAV the simulated users speak for their voice turns"""
+    with wave.open(path, "rb") as f:
+        if (f.getframerate(), f.getnchannels(), f.getsampwidth()) != (_MIC_RATE, 1, 2):
+            raise ValueError(f"{path}: expected {_MIC_RATE} Hz mono 16-bit PCM")
+        return f.readframes(f.getnframes())
+
+
+# ---------------------------------------------------------------------------
+# Token server and agent processes
+# ---------------------------------------------------------------------------
+def start_server(port: int, max_agents: int, latency_log: str, extra_env: dict | None = None) -> subprocess.Popen:
+    """token_server.py on the simulated providers; its agents inherit `extra_env`"""
+    env = {**os.environ, **_SERVER_ENV, **(extra_env or {}), "PORT": str(port), "MAX_ACTIVE_AGENTS": str(max_agents),
+           "LATENCY_LOG_PATH": latency_log}
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_server.py")
+    return subprocess.Popen([sys.executable, script], env=env, cwd=os.path.dirname(script))
+
+
+async def wait_healthy(http: aiohttp.ClientSession, url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with http.get(f"{url}/health") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Token server at {url} not healthy after {timeout:.0f}s")
+        await asyncio.sleep(0.5)
+
+
+class AgentSampler:
+    """CPU% and RSS of every agent's process tree (CLI, worker and job processes) every SAMPLE_INTERVAL"""
+
+    def __init__(self, http: aiohttp.ClientSession, url: str, rooms: set[str]):
+        self._http = http
+        self._url = url
+        self._rooms = rooms
+        self._procs: dict[int, psutil.Process] = {}
+        self.samples: dict[str, list[tuple[float, float]]] = {room: [] for room in rooms}  # (cpu %, rss MB)
+        self.host_cpu: list[float] = []
+
+    def _tree(self, pid: int) -> list[psutil.Process]:
+        try:
+            root = psutil.Process(pid)
+            tree = [root, *root.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            return []
+        # keep the Process objects: cpu_percent() measures since the previous call on the same object
+        return [self._procs.setdefault(p.pid, p) for p in tree]
+
+    async def run(self) -> None:
+        psutil.cpu_percent()
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            try:
+                async with self._http.get(f"{self._url}/_debug/agents") as resp:
+                    agents = await resp.json()
+            except aiohttp.ClientError as e:
+                logger.warning(f"Could not list agents: {e}")
+                continue
+            self.host_cpu.append(psutil.cpu_percent())
+            for room, info in agents.items():
+                if room not in self._rooms:
+                    continue
+                cpu = rss = 0.0
+                for p in self._tree(info["pid"]):
+                    try:
+                        cpu += p.cpu_percent()
+                        rss += p.memory_info().rss / 2**20
+                    except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                        pass
+                self.samples[room].append((cpu, rss))
+
+
+# ---------------------------------------------------------------------------
+# Levels
+# ---------------------------------------------------------------------------
+def _read_records(path: str, rooms: set[str]) -> list[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+    return [r for r in records if r.get("room") in rooms]
+
+
+def _stats(values: list[float]) -> dict:
+    return {f"p{pct}": percentile(values, pct) for pct in (50, 90, 99)}
+
+
+async def run_level(http: aiohttp.ClientSession, url: str, n: int, args, latency_log: str, speech) -> dict:
+    sessions = []
+    for i in range(n):
+        async with http.get(f"{url}/token", params={"identity_id": _ID_BASE + n * 1000 + i, "mode": args.mode}) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"/token failed ({resp.status}): {await resp.text()}")
+            sessions.append(await resp.json())
+    rooms = {s["room"] for s in sessions}
+    logger.info(f"📈 {n} agents launched: {sorted(rooms)}")
+
+    sampler = AgentSampler(http, url, rooms)
+    sampler_task = asyncio.create_task(sampler.run())
+    users = [SimUser(s, turns=args.turns, think_s=args.think, speech=speech) for s in sessions]
+    try:
+        results = await asyncio.gather(*(u.run() for u in users), return_exceptions=True)
+    finally:
+        sampler_task.cancel()
+    failed = [r for r in results if isinstance(r, BaseException)]
+    for e in failed:
+        logger.warning(f"Simulated user failed: {e!r}")
+
+    # The agents only leave the registry when stopped, free the slots for the next level
+    await asyncio.sleep(args.settle)
+    for room in rooms:
+        async with http.post(f"{url}/_debug/stop/{room}") as resp:
+            await resp.read()
+
+    records = _read_records(latency_log, rooms)
+    turns = [r for r in records if r["kind"] == "turn" and r["source"] != "greeting"]
+    greetings = [r for r in records if r["kind"] == "turn" and r["source"] == "greeting"]
+    startups = [r["total_ms"] for r in records if r["kind"] == "startup"]
+    # first sample of every process has no CPU interval behind it
+    per_agent = [samples[1:] for samples in sampler.samples.values() if len(samples) > 1]
+    return {
+        "agents": n,
+        "users_failed": len(failed),
+        "replies": sum(u.replies for u in users),
+        "missed_replies": sum(u.missed for u in users),
+        "turns": len(turns),
+        "first_audio_ms": _stats([t["stages_ms"]["first_audio"] for t in turns if "first_audio" in t["stages_ms"]]),
+        "llm_ms": _stats([t["stages_ms"]["llm"] for t in turns if "llm" in t["stages_ms"]]),
+        "tts_ms": _stats([t["stages_ms"]["tts"] for t in turns if "tts" in t["stages_ms"]]),
+        "greeting_first_audio_ms": _stats([t["stages_ms"]["first_audio"] for t in greetings
+                                           if "first_audio" in t["stages_ms"]]),
+        "startup_ms": _stats(startups),
+        "cpu_pct_per_agent": round(statistics.mean(c for s in per_agent for c, _ in s), 1) if per_agent else None,
+        "cpu_pct_per_agent_max": round(max(c for s in per_agent for c, _ in s), 1) if per_agent else None,
+        "rss_mb_per_agent": round(statistics.mean(max(r for _, r in s) for s in per_agent), 1) if per_agent else None,
+        "host_cpu_pct": round(statistics.mean(sampler.host_cpu), 1) if sampler.host_cpu else None,
+    }
+
+
+async def main(args) -> list[dict]:
+    levels = [int(n) for n in args.levels.split(",")]
+    os.makedirs(args.out, exist_ok=True)
+    # a running server's agents write to its LATENCY_LOG_PATH, a started one's to the output directory
+    latency_log = args.latency_log or (LATENCY_LOG_PATH if args.url else os.path.abspath(os.path.join(args.out, "latency.jsonl")))
+    speech = load_speech(args.speech) if args.speech else None
+    server = None if args.url else start_server(args.port, max(levels), latency_log)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    curve = []
+    try:
+        async with aiohttp.ClientSession(headers={"X-API-Key": TOKEN_SERVER_API_KEY}) as http:
+            await wait_healthy(http, url)
+            for n in levels:
+                row = await run_level(http, url, n, args, latency_log, speech)
+                curve.append(row)
+                logger.info(f"  {n:>3} agents: first audio p50 {row['first_audio_ms']['p50']} ms, "
+                            f"p90 {row['first_audio_ms']['p90']} ms, CPU {row['cpu_pct_per_agent']}%/agent, "
+                            f"RSS {row['rss_mb_per_agent']} MB/agent, missed {row['missed_replies']}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait(10)
+    return curve
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Turn latency against concurrent agents on this host")
+    parser.add_argument("--levels", default="1,2,4,8", help="comma separated agent counts")
+    parser.add_argument("--turns", type=int, default=5, help="turns per simulated user after the greeting")
+    parser.add_argument("--think", type=float, default=2.0, help="seconds between a reply and the next turn")
+    parser.add_argument("--mode", default="video", choices=("video", "audio"))
+    parser.add_argument("--speech", help="16 kHz mono WAV spoken as voice turns instead of text messages")
+    parser.add_argument("--settle", type=float, default=6.0, help="seconds for agents to exit after their user left")
+    parser.add_argument("--url", help="running token server (must run with SIM_PROVIDERS=1); default starts one")
+    parser.add_argument("--latency-log", help="LATENCY_LOG_PATH of the agents of --url")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "capacity"))
+    args = parser.parse_args()
+    if not TOKEN_SERVER_API_KEY:
+        parser.error("TOKEN_SERVER_API_KEY is not set")
+
+    curve = asyncio.run(main(args))
+    path = os.path.join(args.out, f"capacity_{int(time.time())}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"mode": args.mode, "turns": args.turns, "think_s": args.think,
+                   "sim": {k: v for k, v in os.environ.items() if k.startswith("SIM_")}, "curve": curve}, f, indent=2)
+    logger.info(f"📈 Capacity curve written to {path}")
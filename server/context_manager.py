@@ -0,0 +1,156 @@
+"""
+Bounded chat context for long lessons
+Keeps the last turns verbatim and folds older ones into a rolling summary, computed in the
+background after a reply so the prompt sent on every turn stays under a token budget
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from livekit.agents import llm as livekitllm
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_MANAGER = os.getenv("CONTEXT_MANAGER", "1") == "1"
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", 6))
+CONTEXT_MIN_TURNS = int(os.getenv("CONTEXT_MIN_TURNS", 2))
+# Turns gathered beyond CONTEXT_KEEP_TURNS before they are folded together: the summary sits right
+# after the instructions, so every fold changes the cached prompt prefix
+CONTEXT_FOLD_BATCH = int(os.getenv("CONTEXT_FOLD_BATCH", 4))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_ID = "context_summary"
+
+_SUMMARY_PROMPT = (
+    "You maintain the memory of a spoken language lesson between a tutor and a child. "
+    "Merge the previous summary and the new conversation excerpt into one short summary in the "
+    "language of the conversation. Keep names, facts the child shared, words practiced, mistakes "
+    "corrected and promises made. At most 120 words, no preamble."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # rough: ~3 characters per token across Arabic and Latin text
+    return len(text) // 3 + 1
+
+
+def _is_instructions(item) -> bool:
+    return item.type == "message" and item.role in ("system", "developer") and item.id != SUMMARY_ID
+
+
+class RollingContext:
+    """Folds old turns of an agent's chat context into a summary message"""
+
+    def __init__(self, agent, openai_client):
+        self._agent = agent
+        self._client = openai_client
+        self._task: asyncio.Task | None = None
+        self.summary = ""
+        self.summaries = 0
+        self.folded_items = 0
+        self.failures = 0
+        self._summary_ms: list[float] = []
+        self._prompt_tokens: list[int] = []
+
+    def attach(self, session) -> None:
+        session.on("conversation_item_added", self._on_item_added)
+
+    def rebind(self, agent, session) -> None:
+        """Follow the agent and session that replaced the current ones (hot failover)"""
+        if self._task is not None and not self._task.done():
+            # its result would be written into the old agent's context
+            self._task.cancel()
+        self._agent = agent
+        self.attach(session)
+
+    def _split(self, items: list) -> tuple[list, list, list]:
+        """(instructions, items to fold, items kept verbatim) under the turn and token limits"""
+        head = [i for i in items if _is_instructions(i)]
+        convo = [i for i in items if not _is_instructions(i) and i.id != SUMMARY_ID]
+        user_idx = [n for n, i in enumerate(convo) if i.type == "message" and i.role == "user"]
+
+        keep = CONTEXT_KEEP_TURNS
+        while True:
+            cut = user_idx[-keep] if len(user_idx) >= keep else 0
+            kept_tokens = sum(estimate_tokens(i.text_content or "") for i in convo[cut:] if i.type == "message")
+            if kept_tokens <= CONTEXT_TOKEN_BUDGET or keep <= CONTEXT_MIN_TURNS:
+                break
+            keep -= 1
+        return head, convo[:cut], convo[cut:]
+
+    @staticmethod
+    def _due(items: list) -> bool:
+        """Whether the verbatim turns have outgrown the batch or the token budget"""
+        convo = [i for i in items if not _is_instructions(i) and i.id != SUMMARY_ID]
+        turns = sum(1 for i in convo if i.type == "message" and i.role == "user")
+        tokens = sum(estimate_tokens(i.text_content or "") for i in convo if i.type == "message")
+        return turns > CONTEXT_KEEP_TURNS + CONTEXT_FOLD_BATCH or tokens > CONTEXT_TOKEN_BUDGET
+
+    def _on_item_added(self, ev) -> None:
+        item = ev.item
+        if item.type != "message" or item.role != "assistant":
+            return
+        items = self._agent.chat_ctx.items
+        self._prompt_tokens.append(sum(estimate_tokens(i.text_content or "") for i in items if i.type == "message"))
+        if self._task is not None and not self._task.done() or not self._due(items):
+            return
+        _, fold, _ = self._split(items)
+        if fold:
+            # off the critical path: the reply is already playing
+            self._task = asyncio.create_task(self._fold())
+
+    async def _fold(self) -> None:
+        start = time.perf_counter()
+        _, fold, _ = self._split(self._agent.chat_ctx.items)
+        excerpt = "\n".join(
+            f"{i.role}: {i.text_content}" for i in fold if i.type == "message" and i.text_content
+        )
+        try:
+            resp = await self._client.chat.completions.create(
+                model=CONTEXT_SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": _SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Previous summary:\n{self.summary or '(none)'}\n\nExcerpt:\n{excerpt}"},
+                ],
+                max_tokens=300,
+                temperature=0.2,
+            )
+            summary = (resp.choices[0].message.content or "").strip()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Context summarization failed, keeping full context: {e}")
+            return
+        if not summary:
+            return
+
+        # Rebuild from the current context: items added while summarizing are kept
+        folded_ids = {i.id for i in fold}
+        head, _, _ = self._split(self._agent.chat_ctx.items)
+        rest = [i for i in self._agent.chat_ctx.items
+                if i.id not in folded_ids and i.id != SUMMARY_ID and not _is_instructions(i)]
+        summary_msg = livekitllm.ChatMessage(
+            id=SUMMARY_ID, role="system", content=[f"Summary of the earlier conversation:\n{summary}"]
+        )
+        await self._agent.update_chat_ctx(livekitllm.ChatContext([*head, summary_msg, *rest]))
+
+        self.summary = summary
+        self.summaries += 1
+        self.folded_items += len(fold)
+        self._summary_ms.append(round((time.perf_counter() - start) * 1000, 1))
+        logger.info(f"🧠 Folded {len(fold)} context items into the rolling summary ({len(rest)} kept)")
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "summaries": self.summaries,
+            "folded_items": self.folded_items,
+            "failures": self.failures,
+            "summary_ms": self._summary_ms,
+            "prompt_tokens_est_max": max(self._prompt_tokens, default=0),
+            "prompt_tokens_est_last": self._prompt_tokens[-1] if self._prompt_tokens else 0,
+        }
@@ -0,0 +1,42 @@
+"""
+Faults the agents inject into themselves for the recovery path tests (fault_suite.py)
+FAULT_INJECT is a comma separated list of:
+  stack_init        building the provider chains fails          -> start_new_agent_fallback
+  greeting_api_key  the greeting fails with an API key error    -> trigger_fallback
+  shutdown_hang     shutdown_now blocks the event loop          -> deadline_kill
+  finally_hang      the entrypoint's finally block blocks       -> final_kill
+  user_left         the expected user's departure goes unseen   -> failsafe_kill
+Provider faults come from the simulated providers (SIM_<KIND>_FAILURE_RATE).
+"""
+
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FAULT_INJECT = frozenset(f.strip() for f in os.getenv("FAULT_INJECT", "").split(",") if f.strip())
+# How long an injected hang blocks, longer than any kill timer it is meant to trip
+FAULT_HANG_S = float(os.getenv("FAULT_HANG_S", 60))
+
+
+class InjectedFault(Exception):
+    pass
+
+
+def active(fault: str) -> bool:
+    return fault in FAULT_INJECT
+
+
+def inject(fault: str) -> None:
+    """Raise InjectedFault (its message names the fault) when `fault` is injected"""
+    if fault in FAULT_INJECT:
+        logger.warning(f"💥 Injecting fault: {fault}")
+        raise InjectedFault(f"injected fault {fault}")
+
+
+def hang(fault: str) -> None:
+    """Block the calling thread, event loop included, for FAULT_HANG_S when `fault` is injected"""
+    if fault in FAULT_INJECT:
+        logger.warning(f"💥 Injecting fault: {fault}, blocking for {FAULT_HANG_S:.0f}s")
+        time.sleep(FAULT_HANG_S)
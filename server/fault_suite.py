@@ -0,0 +1,211 @@
+"""
+Fault-injection suite for the agent's recovery paths
+`python fault_suite.py [scenario ...]` runs every scenario against a fresh token_server.py on the simulated
+providers, with its fault present from the start of the session, and drives the room with a simulated
+user. Reports the time to (recovered) agent speech, how long the agent processes took to exit after the
+user left, the processes still alive after that (orphans) and the token server registry slots left behind.
+Needs LiveKit credentials and TOKEN_SERVER_API_KEY, like capacity_driver.py.
+"""
+
+import os
+import json
+import time
+import signal
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass, field
+
+import aiohttp
+import psutil
+
+from capacity_driver import TOKEN_SERVER_API_KEY, SimUser, load_speech, start_server, wait_healthy
+
+logger = logging.getLogger(__name__)
+
+_AGENT_SCRIPTS = ("avatar_agent.py", "avatar_agent_fallback.py")
+_IDENTITY_ID = 990_001
+SCAN_INTERVAL = 0.5
+
+
+@dataclass
+class Scenario:
+    path: str  # recovery path the fault exercises
+    env: dict = field(default_factory=dict)  # agent environment injecting the fault
+    needs_speech: bool = False  # the fault is only reached by voice turns (--speech)
+    exit_timeout: float = 20.0  # seconds after the user left before survivors count as orphans
+
+
+SCENARIOS = {
+    "baseline": Scenario("none"),
+    "stt_primary": Scenario("STT FallbackAdapter", {"SIM_STT_FAILURE_RATE": "1"}, needs_speech=True),
+    "llm_primary": Scenario("LLM FallbackAdapter", {"SIM_LLM_FAILURE_RATE": "1"}),
+    "tts_primary": Scenario("TTS FallbackAdapter", {"SIM_TTS_FAILURE_RATE": "1"}),
+    "llm_chain_down": Scenario("session error -> trigger_fallback",
+                               {"SIM_LLM_FAILURE_RATE": "1", "SIM_LLM_BACKUP_FAILURE_RATE": "1"}),
+    "tts_chain_down": Scenario("session error -> trigger_fallback",
+                               {"SIM_TTS_FAILURE_RATE": "1", "SIM_TTS_BACKUP_FAILURE_RATE": "1"}),
+    "stack_init": Scenario("start_new_agent_fallback", {"FAULT_INJECT": "stack_init"}),
+    "greeting_api_key": Scenario("greeting error -> trigger_fallback", {"FAULT_INJECT": "greeting_api_key"}),
+    "avatar_down": Scenario("avatar start failure", {"SIM_AVATAR_FAILURE_RATE": "1"}),
+    "shutdown_hang": Scenario("deadline_kill", {"FAULT_INJECT": "shutdown_hang"}, exit_timeout=30.0),
+    "finally_hang": Scenario("final_kill", {"FAULT_INJECT": "finally_hang", "SIM_AVATAR_FAILURE_RATE": "1"}),
+    "user_left_missed": Scenario("failsafe_kill", {"FAULT_INJECT": "user_left", "AGENT_FAILSAFE_S": "90"},
+                                 exit_timeout=90.0),
+}
+
+
+class ProcessWatch:
+    """Every process of the room's agents seen so far: the CLI processes (main and fallback) and their children"""
+
+    def __init__(self, room: str):
+        self.room = room
+        self.seen: dict[int, tuple[float, str]] = {}  # pid -> (create time, command line)
+        self.scripts: list[str] = []  # agent scripts launched for the room, in order
+
+    def scan(self) -> None:
+        for p in psutil.process_iter(["cmdline"]):
+            args = p.info["cmdline"] or []
+            script = next((os.path.basename(a) for a in args if os.path.basename(a) in _AGENT_SCRIPTS), None)
+            if script is None or self.room not in args:
+                continue
+            try:
+                tree = [p, *p.children(recursive=True)]
+                if p.pid not in self.seen:
+                    self.scripts.append(script)
+                for q in tree:
+                    self.seen.setdefault(q.pid, (q.create_time(), " ".join(q.cmdline())))
+            except psutil.NoSuchProcess:
+                pass
+
+    def alive(self) -> list[tuple[int, str]]:
+        """Seen processes still running; zombies count as exited, the pid was not reused"""
+        running = []
+        for pid, (created, cmd) in self.seen.items():
+            try:
+                p = psutil.Process(pid)
+                if p.create_time() == created and p.status() != psutil.STATUS_ZOMBIE:
+                    running.append((pid, cmd))
+            except psutil.NoSuchProcess:
+                pass
+        return running
+
+    async def run(self) -> None:
+        while True:
+            self.scan()
+            await asyncio.sleep(SCAN_INTERVAL)
+
+
+async def run_scenario(name: str, scenario: Scenario, args, speech: bytes | None) -> dict:
+    result = {"scenario": name, "path": scenario.path, "env": scenario.env}
+    if scenario.needs_speech and speech is None:
+        result["skipped"] = "needs --speech"
+        return result
+
+    out_dir = os.path.join(args.out, name)
+    os.makedirs(out_dir, exist_ok=True)
+    server = start_server(args.port, 1, os.path.abspath(os.path.join(out_dir, "latency.jsonl")), scenario.env)
+    url = f"http://127.0.0.1:{args.port}"
+    watch = None
+    try:
+        async with aiohttp.ClientSession(headers={"X-API-Key": TOKEN_SERVER_API_KEY}) as http:
+            await wait_healthy(http, url)
+            launched_at = time.monotonic()
+            async with http.get(f"{url}/token", params={"identity_id": _IDENTITY_ID, "mode": args.mode}) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"/token failed ({resp.status}): {await resp.text()}")
+                session = await resp.json()
+            room = session["room"]
+
+            watch = ProcessWatch(room)
+            watch_task = asyncio.create_task(watch.run())
+            user = SimUser(session, turns=args.turns, think_s=args.think,
+                           speech=speech if scenario.needs_speech else None, reply_timeout=args.reply_timeout)
+            try:
+                await user.run()
+            except Exception as e:
+                result["user_error"] = repr(e)
+            left_at = user.left_at or time.monotonic()
+
+            # Wait for the room's agents to go away by themselves
+            while watch.alive() and time.monotonic() < left_at + scenario.exit_timeout:
+                await asyncio.sleep(SCAN_INTERVAL)
+            watch_task.cancel()
+            orphans = watch.alive()
+
+            async with http.get(f"{url}/_debug/agents") as resp:
+                registry = await resp.json()
+            leaked = [r for r, info in registry.items()
+                      if not any(pid == info["pid"] for pid, _ in orphans)]
+
+            result.update({
+                "room": room,
+                "agents": watch.scripts,
+                "time_to_speech_s": round(user.speaking_at[0] - launched_at, 2) if user.speaking_at else None,
+                "replies": user.replies,
+                "missed_replies": user.missed,
+                "exit_s": None if orphans else round(time.monotonic() - left_at, 2),
+                "orphans": [cmd for _, cmd in orphans],
+                "registry_slots_leaked": len(leaked),
+            })
+    finally:
+        # Nothing may outlive the scenario into the next one
+        for pid, _ in watch.alive() if watch else []:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        server.terminate()
+        server.wait(10)
+    return result
+
+
+async def main(args) -> list[dict]:
+    names = args.scenarios or list(SCENARIOS)
+    speech = load_speech(args.speech) if args.speech else None
+    results = []
+    for name in names:
+        logger.info(f"💥 Scenario {name}: {SCENARIOS[name].path}")
+        result = await run_scenario(name, SCENARIOS[name], args, speech)
+        results.append(result)
+        logger.info(f"  {json.dumps({k: v for k, v in result.items() if k not in ('env', 'path')})}")
+
+    baseline = next((r for r in results if r["scenario"] == "baseline"), None)
+    for r in results:
+        if baseline and baseline.get("time_to_speech_s") is not None and r.get("time_to_speech_s") is not None:
+            r["recovery_s"] = round(r["time_to_speech_s"] - baseline["time_to_speech_s"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Break each recovery path on purpose and measure how it recovers")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"default all: {', '.join(SCENARIOS)}")
+    parser.add_argument("--mode", default="video", choices=("video", "audio"))
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--think", type=float, default=2.0)
+    parser.add_argument("--reply-timeout", type=float, default=15.0)
+    parser.add_argument("--speech", help="16 kHz mono WAV for the voice turns of the STT scenarios")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "fault_suite"))
+    args = parser.parse_args()
+    if not TOKEN_SERVER_API_KEY:
+        parser.error("TOKEN_SERVER_API_KEY is not set")
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}")
+
+    results = asyncio.run(main(args))
+    logger.info(f"{'scenario':<18} {'path':<36} {'speech s':>8} {'recovery s':>10} {'exit s':>7} {'orphans':>7} {'leaked':>6}")
+    for r in results:
+        if "skipped" in r:
+            logger.info(f"{r['scenario']:<18} {r['path']:<36} skipped: {r['skipped']}")
+            continue
+        logger.info(f"{r['scenario']:<18} {r['path']:<36} {str(r.get('time_to_speech_s')):>8} "
+                    f"{str(r.get('recovery_s')):>10} {str(r.get('exit_s')):>7} {len(r.get('orphans', [])):>7} "
+                    f"{r.get('registry_slots_leaked', 0):>6}")
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"faults_{int(time.time())}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"💥 Fault suite report written to {path}")
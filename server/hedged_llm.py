@@ -0,0 +1,152 @@
+"""
+Hedged LLM requests: fire the same chat context at a second provider when the
+primary has not produced a first token within the deadline; first stream to start wins
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from livekit.agents import llm as livekitllm
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN
+
+logger = logging.getLogger(__name__)
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+# "p90" follows the primary's rolling time-to-first-token, a number is a fixed deadline in seconds
+LLM_HEDGE_DEADLINE = os.getenv("LLM_HEDGE_DEADLINE", "p90")
+LLM_HEDGE_MIN_DEADLINE = float(os.getenv("LLM_HEDGE_MIN_DEADLINE", 0.8))
+LLM_HEDGE_DEFAULT_DEADLINE = float(os.getenv("LLM_HEDGE_DEFAULT_DEADLINE", 1.5))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", 50))
+
+
+class HedgedLLM(livekitllm.LLM):
+    """LLM that races a hedge provider against the primary once the deadline passes"""
+
+    def __init__(self, primary: livekitllm.LLM, hedge: livekitllm.LLM, deadline: str = LLM_HEDGE_DEADLINE):
+        super().__init__()
+        self._primary = primary
+        self._hedge = hedge
+        self._deadline = deadline
+        self._primary_ttft: deque[float] = deque(maxlen=LLM_HEDGE_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def model(self) -> str:
+        return getattr(self._primary, "model", "hedged")
+
+    def current_deadline(self) -> float:
+        if self._deadline != "p90":
+            return float(self._deadline)
+        if len(self._primary_ttft) < 5:
+            return LLM_HEDGE_DEFAULT_DEADLINE
+        ordered = sorted(self._primary_ttft)
+        return max(LLM_HEDGE_MIN_DEADLINE, ordered[int(0.9 * (len(ordered) - 1))])
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedged, 3) if self.hedged else 0.0,
+            "deadline": round(self.current_deadline(), 3),
+        }
+
+    def chat(
+        self,
+        *,
+        chat_ctx: livekitllm.ChatContext,
+        tools=None,
+        conn_options=DEFAULT_API_CONNECT_OPTIONS,
+        parallel_tool_calls=NOT_GIVEN,
+        tool_choice=NOT_GIVEN,
+        extra_kwargs=NOT_GIVEN,
+    ) -> "HedgedLLMStream":
+        return HedgedLLMStream(
+            self,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            conn_options=conn_options,
+            chat_kwargs={
+                "parallel_tool_calls": parallel_tool_calls,
+                "tool_choice": tool_choice,
+                "extra_kwargs": extra_kwargs,
+            },
+        )
+
+    def prewarm(self) -> None:
+        self._primary.prewarm()
+        self._hedge.prewarm()
+
+
+class HedgedLLMStream(livekitllm.LLMStream):
+    def __init__(self, llm: HedgedLLM, *, chat_ctx, tools, conn_options, chat_kwargs: dict):
+        super().__init__(llm, chat_ctx=chat_ctx, tools=tools, conn_options=conn_options)
+        self._hedged = llm
+        self._chat_kwargs = chat_kwargs
+
+    def _open(self, provider: livekitllm.LLM) -> livekitllm.LLMStream:
+        return provider.chat(
+            chat_ctx=self._chat_ctx,
+            tools=self._tools,
+            conn_options=self._conn_options,
+            **self._chat_kwargs,
+        )
+
+    async def _run(self) -> None:
+        hedged = self._hedged
+        hedged.requests += 1
+        deadline = hedged.current_deadline()
+        start = time.perf_counter()
+
+        primary = self._open(hedged._primary)
+        streams = {primary: asyncio.ensure_future(primary.__anext__())}
+        winner, first_chunk = None, None
+        try:
+            done, _ = await asyncio.wait(streams.values(), timeout=deadline)
+            if not done:
+                hedged.hedged += 1
+                logger.info(f"⏩ Primary LLM silent after {deadline:.2f}s, hedging to {hedged._hedge.label}")
+                hedge = self._open(hedged._hedge)
+                streams[hedge] = asyncio.ensure_future(hedge.__anext__())
+
+            pending = set(streams.values())
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for stream, fut in streams.items():
+                    if fut in done and fut.exception() is None:
+                        winner, first_chunk = stream, fut.result()
+                        break
+            if winner is None:
+                # every stream failed before its first token: surface the primary's error
+                exc = streams[primary].exception()
+                if isinstance(exc, StopAsyncIteration):
+                    return
+                raise exc
+        finally:
+            for stream, fut in streams.items():
+                if stream is winner:
+                    continue
+                fut.cancel()
+                try:
+                    await stream.aclose()
+                except Exception:
+                    pass
+
+        elapsed = time.perf_counter() - start
+        # A hedge win is a censored primary sample: the primary had no token after `elapsed` either.
+        # Dropping those slow requests would pull the p90 deadline down and hedge ever more turns
+        hedged._primary_ttft.append(elapsed)
+        if winner is not primary:
+            hedged.hedge_wins += 1
+            logger.info(f"⏩ Hedge {hedged._hedge.label} won after {elapsed:.2f}s")
+
+        self._event_ch.send_nowait(first_chunk)
+        async with winner:
+            async for chunk in winner:
+                self._event_ch.send_nowait(chunk)
@@ -0,0 +1,108 @@
+"""
+Idle-session detection for the avatar agent
+Counts user activity (VAD speech, final transcripts, data packets, reconnects). After IDLE_WARNING_S without any,
+the agent asks whether the child is still there; after IDLE_SHUTDOWN_S more it ends the session,
+so an abandoned session frees its slot long before the process failsafe.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from livekit import rtc
+
+logger = logging.getLogger(__name__)
+
+# 0 disables idle detection
+IDLE_WARNING_S = float(os.getenv("IDLE_WARNING_S", 180))
+IDLE_SHUTDOWN_S = float(os.getenv("IDLE_SHUTDOWN_S", 60))
+_CHECK_INTERVAL = 1.0
+
+
+class IdleMonitor:
+    """
+    Idle time runs while nobody speaks: from the last user activity or the end of the agent's
+    last reply, whichever is later. The warning prompt itself does not reset it.
+    """
+
+    def __init__(self, control_topic: str):
+        self._control_topic = control_topic
+        self._session = None
+        self._last_activity = time.monotonic()
+        self._warned_at: float | None = None
+        self._task: asyncio.Task | None = None
+        self.idle = asyncio.Event()  # set when the session should end
+        self.activity = {"vad": 0, "transcript": 0, "data": 0, "reconnect": 0}
+        self.warnings = 0
+
+    def touch(self, source: str) -> None:
+        self.activity[source] += 1
+        self._last_activity = time.monotonic()
+        if self._warned_at is not None:
+            logger.info(f"💤 Activity ({source}) after the idle warning, session stays")
+            self._warned_at = None
+
+    def attach(self, session) -> None:
+        """(Re)attach to a session; called again after a hot swap"""
+        self._session = session
+        session.on("user_state_changed", self._on_user_state)
+        session.on("user_input_transcribed", self._on_transcript)
+        session.on("agent_state_changed", self._on_agent_state)
+
+    def attach_room(self, room: rtc.Room) -> None:
+        room.on("data_received", self._on_data)
+
+    def _on_user_state(self, ev) -> None:
+        if ev.new_state == "speaking":
+            self.touch("vad")
+
+    def _on_transcript(self, ev) -> None:
+        if ev.is_final:
+            self.touch("transcript")
+
+    def _on_agent_state(self, ev) -> None:
+        # a reply that ended restarts the clock, the warning prompt does not
+        if ev.old_state == "speaking" and self._warned_at is None:
+            self._last_activity = time.monotonic()
+
+    def _on_data(self, packet: rtc.DataPacket) -> None:
+        # server control messages and packets without a sender are not the child
+        if packet.participant is not None and packet.topic != self._control_topic:
+            self.touch("data")
+
+    def _agent_busy(self) -> bool:
+        return self._session is not None and self._session.agent_state in ("thinking", "speaking")
+
+    def start(self, warn) -> None:
+        """`warn()` is awaited to speak the idle prompt"""
+        if IDLE_WARNING_S > 0:
+            self._last_activity = time.monotonic()
+            self._task = asyncio.create_task(self._run(warn))
+
+    async def _run(self, warn) -> None:
+        while True:
+            await asyncio.sleep(_CHECK_INTERVAL)
+            if self._agent_busy():
+                continue
+            now = time.monotonic()
+            if self._warned_at is None:
+                if now - self._last_activity >= IDLE_WARNING_S:
+                    self._warned_at = now
+                    self.warnings += 1
+                    logger.info(f"💤 No activity for {IDLE_WARNING_S:.0f}s, checking on the user")
+                    try:
+                        await warn()
+                    except Exception as e:
+                        logger.warning(f"Could not speak the idle prompt: {e}")
+            elif now - self._warned_at >= IDLE_SHUTDOWN_S:
+                logger.info(f"💤 Still idle {IDLE_SHUTDOWN_S:.0f}s after the warning, ending the session")
+                self.idle.set()
+                return
+
+    async def aclose(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {"activity": dict(self.activity), "warnings": self.warnings, "idle_shutdown": self.idle.is_set()}
@@ -0,0 +1,54 @@
+"""
+Prompt-prefix cache hit rates per LLM provider for one session
+OpenAI caches prompt prefixes automatically (from 1024 tokens), Anthropic through cache_control marks
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCacheStats:
+    """Sums prompt and cached prompt tokens from the LLMMetrics of each provider instance"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._per_label: dict[str, dict[str, int]] = {}
+
+    def watch(self, providers) -> None:
+        # FallbackAdapter children do not forward their metrics to the session, listen on each instance
+        for instance in providers:
+            instance.on("metrics_collected", self._on_metrics)
+
+    def attach(self, session) -> None:
+        """Realtime sessions report their metrics on the session itself"""
+        session.on("metrics_collected", lambda ev: self._on_metrics(ev.metrics))
+
+    def _on_metrics(self, m) -> None:
+        kind = getattr(m, "type", None)
+        if kind == "llm_metrics":
+            prompt, cached = m.prompt_tokens, m.prompt_cached_tokens
+        elif kind == "realtime_model_metrics":
+            prompt, cached = m.input_tokens, m.input_token_details.cached_tokens
+        else:
+            return
+        with self._lock:
+            entry = self._per_label.setdefault(m.label, {"requests": 0, "hits": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            entry["requests"] += 1
+            entry["prompt_tokens"] += prompt
+            entry["cached_tokens"] += cached
+            if cached:
+                entry["hits"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                label: {
+                    **entry,
+                    "request_hit_rate": round(entry["hits"] / entry["requests"], 3) if entry["requests"] else 0.0,
+                    "token_hit_rate": round(entry["cached_tokens"] / entry["prompt_tokens"], 3)
+                    if entry["prompt_tokens"] else 0.0,
+                }
+                for label, entry in self._per_label.items()
+            }
@@ -0,0 +1,187 @@
+"""
+Local pronunciation scoring for pronunciation turns
+Aligns the transcript of the child's attempt with the target text using Arabic-aware normalization
+and a phoneme-level edit distance; clear passes and fails need no LLM call
+"""
+
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+PRONUNCIATION_PASS = float(os.getenv("PRONUNCIATION_PASS", 0.9))
+PRONUNCIATION_FAIL = float(os.getenv("PRONUNCIATION_FAIL", 0.5))
+
+# Harakat, tanween, shadda, sukun, superscript alef, Quranic marks and tatweel
+_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_LETTER_VARIANTS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ؤ": "و", "ئ": "ي", "ى": "ي",
+    "ة": "ه",
+})
+
+# Letter -> phoneme; pairs in _CLOSE are the confusions a child (or the STT) makes most
+_PHONEMES = {
+    "ا": "aa", "ء": "?", "ب": "b", "ت": "t", "ث": "th", "ج": "j", "ح": "H", "خ": "x", "د": "d",
+    "ذ": "dh", "ر": "r", "ز": "z", "س": "s", "ش": "sh", "ص": "S", "ض": "D", "ط": "T", "ظ": "Z",
+    "ع": "3", "غ": "gh", "ف": "f", "ق": "q", "ك": "k", "ل": "l", "م": "m", "ن": "n", "ه": "h",
+    "و": "w", "ي": "y",
+}
+_CLOSE = {
+    frozenset(p) for p in (
+        ("s", "S"), ("t", "T"), ("d", "D"), ("dh", "Z"), ("dh", "z"), ("z", "Z"), ("th", "s"), ("th", "t"),
+        ("H", "h"), ("q", "?"), ("q", "k"), ("3", "?"), ("x", "gh"), ("aa", "?"),
+    )
+}
+
+
+def normalize(text: str) -> str:
+    """Strip diacritics and punctuation, unify hamza, alef maksura and taa marbuta variants"""
+    text = unicodedata.normalize("NFC", text)
+    text = _DIACRITICS.sub("", text).translate(_LETTER_VARIANTS).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def phonemes(word: str) -> list[str]:
+    # Latin words fall back to one symbol per letter
+    return [_PHONEMES.get(c, c) for c in word]
+
+
+def _sub_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    return 0.5 if frozenset((a, b)) in _CLOSE else 1.0
+
+
+def edit_distance(a: list[str], b: list[str]) -> float:
+    """Weighted Levenshtein distance; close phonemes cost half a substitution"""
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + _sub_cost(a[i - 1], b[j - 1]))
+        prev = cur
+    return prev[-1]
+
+
+def _word_score(target: str, heard: str | None) -> float:
+    if heard is None:
+        return 0.0
+    t = phonemes(target)
+    return max(0.0, 1 - edit_distance(t, phonemes(heard)) / max(len(t), 1))
+
+
+@dataclass
+class Mismatch:
+    expected: str
+    heard: str | None  # None when the word was not said at all
+    score: float
+
+
+@dataclass
+class PronunciationResult:
+    target: str
+    transcript: str
+    score: float  # 0..1
+    verdict: str  # "pass", "fail" or "unclear"
+    mismatches: list[Mismatch] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+
+def _align_words(target: list[str], heard: list[str]) -> list[tuple[str, str | None]]:
+    """Word alignment (DP on per-word phoneme cost) so one slip does not shift every later word"""
+    n, m = len(target), len(heard)
+    cost = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        cost[i][0] = float(i)
+    for j in range(1, m + 1):
+        cost[0][j] = j * 0.5  # extra words are cheaper than missing ones
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost[i][j] = min(
+                cost[i - 1][j] + 1,
+                cost[i][j - 1] + 0.5,
+                cost[i - 1][j - 1] + 1 - _word_score(target[i - 1], heard[j - 1]),
+            )
+    pairs: list[tuple[str, str | None]] = []
+    i, j = n, m
+    while i > 0:
+        if j > 0 and cost[i][j] == cost[i - 1][j - 1] + 1 - _word_score(target[i - 1], heard[j - 1]):
+            pairs.append((target[i - 1], heard[j - 1]))
+            i, j = i - 1, j - 1
+        elif cost[i][j] == cost[i - 1][j] + 1:
+            pairs.append((target[i - 1], None))
+            i -= 1
+        else:
+            j -= 1
+    return pairs[::-1]
+
+
+def score(target: str, transcript: str) -> PronunciationResult:
+    """Score an attempt at `target`; per-word mismatches below the pass threshold are reported"""
+    start = time.perf_counter()
+    target_words = normalize(target).split()
+    heard_words = normalize(transcript).split()
+
+    pairs = _align_words(target_words, heard_words)
+    total_phonemes = sum(len(phonemes(w)) for w in target_words) or 1
+    weighted = sum(_word_score(t, h) * len(phonemes(t)) for t, h in pairs)
+    overall = round(weighted / total_phonemes, 3)
+    mismatches = [
+        Mismatch(expected=t, heard=h, score=round(s, 3))
+        for t, h in pairs if (s := _word_score(t, h)) < PRONUNCIATION_PASS
+    ]
+
+    if overall >= PRONUNCIATION_PASS and not mismatches:
+        verdict = "pass"
+    elif overall <= PRONUNCIATION_FAIL:
+        verdict = "fail"
+    else:
+        verdict = "unclear"
+    return PronunciationResult(
+        target=target,
+        transcript=transcript,
+        score=overall,
+        verdict=verdict,
+        mismatches=mismatches,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
+
+
+_FEEDBACK = {
+    "ar": {
+        "pass": "ممتاز! لفظك صحيح تماماً.",
+        "fail": "خلينا نجرب مرة تانية سوا. قول معي: {target}",
+    },
+    "fr": {
+        "pass": "Excellent ! Ta prononciation est parfaite.",
+        "fail": "Essayons encore ensemble. Répète après moi : {target}",
+    },
+    "du": {
+        "pass": "Ausgezeichnet! Deine Aussprache ist perfekt.",
+        "fail": "Lass es uns noch einmal zusammen versuchen. Sprich mir nach: {target}",
+    },
+    "en": {
+        "pass": "Excellent! Your pronunciation is perfect.",
+        "fail": "Let's try that again together. Say it with me: {target}",
+    },
+}
+
+
+def canned_feedback(result: PronunciationResult, language: str) -> str | None:
+    """Spoken feedback for a clear pass or fail, None when the LLM should phrase it"""
+    if result.verdict == "unclear":
+        return None
+    return _FEEDBACK.get(language, _FEEDBACK["en"])[result.verdict].format(target=result.target)
+
+
+def describe(result: PronunciationResult) -> str:
+    """Scoring summary handed to the LLM for the borderline cases"""
+    lines = [f"Local pronunciation check of the child's attempt at '{result.target}': score {result.score:.2f} (0-1)."]
+    for m in result.mismatches:
+        heard = f"'{m.heard}'" if m.heard else "nothing"
+        lines.append(f"- expected '{m.expected}', heard {heard} (score {m.score:.2f})")
+    lines.append("Give short, encouraging feedback on exactly these points; do not judge anything else.")
+    return "\n".join(lines)
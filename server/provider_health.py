@@ -0,0 +1,200 @@
+"""
+Host-wide provider circuit breakers shared by every agent process
+Backed by a small SQLite file so a breaker opened by one agent is honored by all.
+One breaker per provider model ("openai:whisper-1", "openai:gpt-4o", ...) plus "tavus" for the avatar.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_HEALTH_DB = os.getenv("PROVIDER_HEALTH_DB", os.path.join(os.path.dirname(__file__), "provider_health.db"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_FAILURE_WINDOW = float(os.getenv("CIRCUIT_FAILURE_WINDOW", 60))  # seconds
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", 60))  # seconds open after repeated failures
+CIRCUIT_AUTH_COOLDOWN = float(os.getenv("CIRCUIT_AUTH_COOLDOWN", 600))  # seconds open after an auth error
+
+_DB_INIT_RUN = False
+_DB_INIT_LOCK = threading.Lock()
+# Writes from the agent's event loop go through one thread: in order, and never blocking a turn on the file lock
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="provider-health")
+
+
+def _connect() -> sqlite3.Connection:
+    return sqlite3.connect(PROVIDER_HEALTH_DB, timeout=5, isolation_level=None)
+
+
+def _init_db():
+    """Create breaker table if missing."""
+    global _DB_INIT_RUN
+    if _DB_INIT_RUN:
+        return
+    with _DB_INIT_LOCK:
+        if _DB_INIT_RUN:
+            return
+        conn = _connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS provider_circuit (
+                    provider TEXT PRIMARY KEY,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    first_failure_at REAL,
+                    open_until REAL NOT NULL DEFAULT 0,
+                    reason TEXT,
+                    opened_by TEXT
+                );
+            """)
+        finally:
+            conn.close()
+        _DB_INIT_RUN = True
+
+
+def provider_of(label: str) -> str | None:
+    """Map a plugin label like 'livekit.plugins.openai.llm.LLM' to 'openai'"""
+    parts = label.split(".")
+    if len(parts) > 2 and parts[0] == "livekit" and parts[1] == "plugins":
+        return parts[2]
+    return None
+
+
+def breaker_key(instance) -> str | None:
+    """'openai:whisper-1' for a plugin instance; a failing model does not take down the plugin's other models"""
+    plugin = provider_of(instance.label)
+    if not plugin:
+        return None
+    model = getattr(getattr(instance, "_opts", None), "model", None)
+    return f"{plugin}:{model}" if model else f"{plugin}:{instance.label}"
+
+
+def plugin_of(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def is_auth_error(error: Exception) -> bool:
+    if getattr(error, "status_code", None) in (401, 403):
+        return True
+    text = str(error).lower()
+    return "api_key" in text or "api key" in text or "unauthorized" in text
+
+
+def record_failure(provider: str, reason: str, fatal: bool = False, opened_by: str = "") -> bool:
+    """
+    Count a failure for `provider`; fatal errors (revoked key) open the breaker immediately.
+    Returns True if the breaker is open after this call.
+    """
+    _init_db()
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT failures, first_failure_at FROM provider_circuit WHERE provider = ?", (provider,)
+        ).fetchone()
+        failures, first_at = row if row else (0, None)
+        if first_at is None or now - first_at > CIRCUIT_FAILURE_WINDOW:
+            failures, first_at = 0, now
+        failures += 1
+
+        open_until = 0.0
+        if fatal:
+            open_until = now + CIRCUIT_AUTH_COOLDOWN
+        elif failures >= CIRCUIT_FAILURE_THRESHOLD:
+            open_until = now + CIRCUIT_COOLDOWN
+
+        conn.execute("""
+            INSERT INTO provider_circuit (provider, failures, first_failure_at, open_until, reason, opened_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(provider) DO UPDATE SET
+                failures = excluded.failures,
+                first_failure_at = excluded.first_failure_at,
+                open_until = MAX(provider_circuit.open_until, excluded.open_until),
+                reason = excluded.reason,
+                opened_by = CASE WHEN excluded.open_until > 0 THEN excluded.opened_by ELSE provider_circuit.opened_by END;
+        """, (provider, failures, first_at, open_until, reason[:500], opened_by))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Could not record failure for {provider}: {e}")
+        return False
+    finally:
+        conn.close()
+
+    if open_until:
+        logger.error(f"🔌 Circuit OPEN for {provider} until {time.strftime('%H:%M:%S', time.localtime(open_until))}: {reason}")
+    return open_until > 0
+
+
+def record_success(provider: str):
+    """Close the breaker (half-open trial succeeded) and reset the failure count"""
+    _init_db()
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE provider_circuit SET failures = 0, first_failure_at = NULL, open_until = 0 WHERE provider = ?",
+            (provider,),
+        )
+    except Exception as e:
+        logger.debug(f"Could not record success for {provider}: {e}")
+    finally:
+        conn.close()
+
+
+def report_failure(provider: str, reason: str, fatal: bool = False, opened_by: str = ""):
+    """record_failure off the calling thread, for event loop code"""
+    _WRITER.submit(record_failure, provider, reason, fatal, opened_by)
+
+
+def report_success(provider: str):
+    """record_success off the calling thread, for event loop code"""
+    _WRITER.submit(record_success, provider)
+
+
+def open_circuits() -> dict[str, dict]:
+    """Breakers currently open, keyed by breaker key"""
+    _init_db()
+    now = time.time()
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT provider, open_until, reason, opened_by FROM provider_circuit WHERE open_until > ?", (now,)
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Could not read provider health: {e}")
+        return {}
+    finally:
+        conn.close()
+    return {p: {"open_until": until, "reason": reason, "opened_by": by} for p, until, reason, by in rows}
+
+
+def is_open(provider: str) -> bool:
+    return provider in open_circuits()
+
+
+def watch_providers(providers, opened_by: str = ""):
+    """
+    Feed the breakers from plugin instances: errors count as failures, the first metrics
+    event of a provider model in this process closes a breaker left half-open by the cooldown.
+    The callbacks run on the event loop, the SQLite writes do not.
+    """
+    confirmed: set[str] = set()
+    for instance in providers:
+        name = breaker_key(instance)
+        if not name:
+            continue
+
+        def _on_error(ev, name=name):
+            if ev.recoverable:
+                return
+            report_failure(name, f"{ev.label}: {ev.error}", fatal=is_auth_error(ev.error), opened_by=opened_by)
+
+        def _on_metrics(_, name=name):
+            if name not in confirmed:
+                confirmed.add(name)
+                report_success(name)
+
+        instance.on("error", _on_error)
+        instance.on("metrics_collected", _on_metrics)
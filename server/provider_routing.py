@@ -0,0 +1,223 @@
+"""
+Latency-adaptive ordering for the LLM/TTS FallbackAdapter chains
+Providers that are up but slower than their SLO are moved to the back of the chain
+and periodically probed so they can be promoted back.
+A new order only takes effect while none of the adapter's streams is running: a stream walks the
+chain by index, so it must see the instances and their status in one order from start to end.
+The STT chain is not routed: the session keeps one STT stream open from start to end, so its
+chain is never quiet, and a provider cannot be probed without real speech.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+from livekit.agents import llm as livekitllm
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_PROVIDER_ORDER = os.getenv("ADAPTIVE_PROVIDER_ORDER", "1") == "1"
+# Latency SLOs in seconds: LLM time-to-first-token, TTS time-to-first-byte
+PROVIDER_SLO_LLM = float(os.getenv("PROVIDER_SLO_LLM", 2.0))
+PROVIDER_SLO_TTS = float(os.getenv("PROVIDER_SLO_TTS", 1.0))
+PROVIDER_LATENCY_WINDOW = int(os.getenv("PROVIDER_LATENCY_WINDOW", 20))
+PROVIDER_MIN_SAMPLES = int(os.getenv("PROVIDER_MIN_SAMPLES", 3))
+PROVIDER_PROBE_INTERVAL = float(os.getenv("PROVIDER_PROBE_INTERVAL", 60))
+
+# FallbackAdapter keeps its providers and their availability in two parallel lists
+_INSTANCE_ATTRS = {"llm": "_llm_instances", "tts": "_tts_instances"}
+# Adapter methods that open a stream walking the chain
+_STREAM_METHODS = {"llm": ("chat",), "tts": ("synthesize", "stream")}
+
+
+@dataclass
+class ProviderStats:
+    label: str
+    priority: int  # position in the configured chain
+    samples: deque = field(default_factory=lambda: deque(maxlen=PROVIDER_LATENCY_WINDOW))
+    demoted_at: float | None = None
+
+    def p90(self) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+    def over_slo(self, slo: float) -> bool:
+        return len(self.samples) >= PROVIDER_MIN_SAMPLES and self.p90() > slo
+
+
+class LatencyRouter:
+    """Reorders one FallbackAdapter chain by rolling latency per provider"""
+
+    def __init__(self, adapter, kind: str, slo: float, probe_interval: float = PROVIDER_PROBE_INTERVAL):
+        self.adapter = adapter
+        self.kind = kind
+        self.slo = slo
+        self.probe_interval = probe_interval
+        self._instances = getattr(adapter, _INSTANCE_ATTRS[kind])
+        self._stats = {id(p): ProviderStats(label=p.label, priority=i) for i, p in enumerate(self._instances)}
+        self._probing: set[int] = set()
+        self._probe_task: asyncio.Task | None = None
+        self._in_flight = 0
+        self._pending: list | None = None  # (instance, status) pairs waiting for the chain to go quiet
+
+        for provider in list(self._instances):
+            provider.on("metrics_collected", self._make_listener(provider))
+        self._track_streams()
+
+    def _track_streams(self) -> None:
+        """Count the adapter's running streams, the chain is only reordered when there are none"""
+        for name in _STREAM_METHODS[self.kind]:
+            def _tracked(*args, _open=getattr(self.adapter, name), **kwargs):
+                stream = _open(*args, **kwargs)
+                task = getattr(stream, "_task", None) or getattr(stream, "_synthesize_task", None)
+                if task is not None:
+                    self._in_flight += 1
+                    task.add_done_callback(self._on_stream_done)
+                return stream
+            setattr(self.adapter, name, _tracked)
+
+    def _on_stream_done(self, _) -> None:
+        self._in_flight -= 1
+        if self._in_flight == 0 and self._pending is not None:
+            self._apply(self._pending)
+
+    def _make_listener(self, provider):
+        def _on_metrics(metrics):
+            if id(provider) in self._probing or getattr(metrics, "cancelled", False):
+                return
+            value = self._latency_of(metrics)
+            if value is not None and value >= 0:
+                self.record(provider, value)
+        return _on_metrics
+
+    def _latency_of(self, metrics) -> float | None:
+        return getattr(metrics, "ttft" if self.kind == "llm" else "ttfb", None)
+
+    def record(self, provider, latency: float) -> None:
+        self._stats[id(provider)].samples.append(latency)
+        self._reorder()
+
+    # ------------------------------------------------------------------
+    # Ordering
+    # ------------------------------------------------------------------
+    def _reorder(self) -> None:
+        status = self.adapter._status
+        pairs = list(zip(self._instances, status))
+        demoted = []
+
+        def _key(pair):
+            stats = self._stats[id(pair[0])]
+            if stats.over_slo(self.slo):
+                if stats.demoted_at is None:
+                    stats.demoted_at = time.time()
+                    demoted.append(stats)
+                return (1, stats.p90(), stats.priority)
+            return (0, 0.0, stats.priority)
+
+        ordered = sorted(pairs, key=_key)
+        for stats in demoted:
+            when = "after the running streams" if self._in_flight else "now"
+            logger.warning(f"⚠️ {self.kind.upper()} provider {stats.label} demoted ({when}): "
+                           f"p90 {stats.p90():.2f}s > SLO {self.slo:.2f}s")
+        if [p for p, _ in ordered] == list(self._instances):
+            self._pending = None
+            return
+        if self._in_flight:
+            self._pending = ordered
+            return
+        self._apply(ordered)
+
+    def _apply(self, ordered: list) -> None:
+        # New list objects, instances and status together: nothing running holds either anymore
+        self._pending = None
+        self._instances = [p for p, _ in ordered]
+        setattr(self.adapter, _INSTANCE_ATTRS[self.kind], self._instances)
+        self.adapter._status = [s for _, s in ordered]
+        logger.info(f"🔀 {self.kind.upper()} chain order: {self.order()}")
+
+    def order(self) -> list[str]:
+        return [self._stats[id(p)].label for p in self._instances]
+
+    def snapshot(self) -> dict:
+        return {
+            self._stats[id(p)].label: {
+                "p90": self._stats[id(p)].p90(),
+                "samples": len(self._stats[id(p)].samples),
+                "demoted": self._stats[id(p)].demoted_at is not None,
+            }
+            for p in self._instances
+        }
+
+    # ------------------------------------------------------------------
+    # Probing demoted providers
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def aclose(self) -> None:
+        if self._probe_task:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._probe_task = None
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            now = time.time()
+            for provider in list(self._instances):
+                stats = self._stats[id(provider)]
+                if stats.demoted_at is None or now - stats.demoted_at < self.probe_interval:
+                    continue
+                try:
+                    latency = await self._probe(provider)
+                except Exception as e:
+                    logger.debug(f"{self.kind.upper()} probe for {stats.label} failed: {e}")
+                    stats.demoted_at = now
+                    continue
+                if latency is not None and latency <= self.slo:
+                    # fresh window: live traffic decides whether it stays promoted
+                    stats.samples.clear()
+                    stats.samples.append(latency)
+                    stats.demoted_at = None
+                    logger.info(f"✅ {self.kind.upper()} provider {stats.label} promoted back (probe: {latency})")
+                    self._reorder()
+                else:
+                    stats.demoted_at = now
+
+    async def _probe(self, provider) -> float | None:
+        """Time to first chunk of a minimal request; None when nothing came back"""
+        self._probing.add(id(provider))
+        try:
+            start = time.perf_counter()
+            if self.kind == "llm":
+                chat_ctx = livekitllm.ChatContext.empty()
+                chat_ctx.add_message(role="user", content="ping")
+                async with provider.chat(chat_ctx=chat_ctx) as stream:
+                    async for _ in stream:
+                        return time.perf_counter() - start
+            else:
+                async with provider.synthesize("ok") as stream:
+                    async for _ in stream:
+                        return time.perf_counter() - start
+            return None
+        finally:
+            self._probing.discard(id(provider))
+
+
+def attach_routers(llm, tts) -> list[LatencyRouter]:
+    """Create routers for the LLM and TTS chains built in entrypoint (empty list when disabled)"""
+    if not ADAPTIVE_PROVIDER_ORDER:
+        return []
+    return [
+        LatencyRouter(llm, "llm", PROVIDER_SLO_LLM),
+        LatencyRouter(tts, "tts", PROVIDER_SLO_TTS),
+    ]
@@ -0,0 +1,98 @@
+"""
+Provider connection warmup and shared HTTP pools
+Opens DNS/TLS connections to every provider in the fallback chains while the avatar starts,
+and keeps them alive so the first user turn does not pay the connection setup
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+import httpx
+
+if TYPE_CHECKING:
+    import openai
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_WARMUP = os.getenv("PROVIDER_WARMUP", "1") == "1"
+# httpx pools (OpenAI, Anthropic) expire idle connections after 120s, aiohttp (ElevenLabs) after 15s
+WARMUP_KEEPALIVE_HTTPX = float(os.getenv("WARMUP_KEEPALIVE_HTTPX", 60))
+WARMUP_KEEPALIVE_AIOHTTP = float(os.getenv("WARMUP_KEEPALIVE_AIOHTTP", 12))
+
+
+def build_openai_client() -> "openai.AsyncClient":
+    """One OpenAI client (and connection pool) for every openai STT/LLM/TTS plugin of the session"""
+    import openai as openai_sdk  # with the plugins, not at agent import
+
+    return openai_sdk.AsyncClient(
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=50,
+                max_keepalive_connections=50,
+                keepalive_expiry=120,
+            ),
+        ),
+    )
+
+
+class ProviderWarmup:
+    """Warms and keeps alive the provider connections of one session"""
+
+    def __init__(self, openai_client=None, anthropic_llm=None, elevenlabs_tts=None):
+        # name -> (coroutine factory, keepalive interval)
+        self._targets: dict[str, tuple] = {}
+        if openai_client is not None:
+            self._targets["openai"] = (lambda: openai_client.models.retrieve("gpt-4o"), WARMUP_KEEPALIVE_HTTPX)
+        if anthropic_llm is not None:
+            # the anthropic plugin builds its own client, warm that one
+            client = anthropic_llm._client
+            self._targets["anthropic"] = (lambda: client.models.list(limit=1), WARMUP_KEEPALIVE_HTTPX)
+        if elevenlabs_tts is not None:
+            self._targets["elevenlabs"] = (lambda: self._get_elevenlabs(elevenlabs_tts), WARMUP_KEEPALIVE_AIOHTTP)
+        self._keepalive_tasks: list[asyncio.Task] = []
+        self.results: dict[str, float | None] = {}
+
+    @staticmethod
+    async def _get_elevenlabs(tts):
+        # same aiohttp session (and connector) the TTS websocket streams use
+        async with tts._ensure_session().get(
+            f"{tts._opts.base_url}/models", headers={"xi-api-key": tts._opts.api_key}
+        ) as resp:
+            await resp.read()
+
+    async def _warm(self, name: str) -> float | None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._targets[name][0](), timeout=5.0)
+        except Exception as e:
+            logger.warning(f"Warmup of {name} failed: {e}")
+            return None
+        return round((time.perf_counter() - start) * 1000, 1)
+
+    async def warm_once(self) -> dict[str, float | None]:
+        """Open a connection to every provider concurrently; returns ms per provider"""
+        names = list(self._targets)
+        timings = await asyncio.gather(*(self._warm(n) for n in names))
+        self.results = dict(zip(names, timings))
+        logger.info(f"🔥 Provider connections warmed: {self.results}")
+        return self.results
+
+    def start_keepalive(self) -> None:
+        async def _keepalive(name: str, interval: float):
+            while True:
+                await asyncio.sleep(interval)
+                await self._warm(name)
+
+        for name, (_, interval) in self._targets.items():
+            self._keepalive_tasks.append(asyncio.create_task(_keepalive(name, interval)))
+
+    async def aclose(self) -> None:
+        for task in self._keepalive_tasks:
+            task.cancel()
+        self._keepalive_tasks.clear()
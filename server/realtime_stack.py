@@ -0,0 +1,177 @@
+"""
+OpenAI Realtime stack shared by avatar_agent_fallback.py and the in-process hot failover
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+
+from livekit import agents
+from livekit.agents import AgentSession, ChatContext
+
+from AgentInstructions import DebugAvatarAgent
+from context_manager import SUMMARY_ID
+from startup import avatar_audio_output, load_plugin
+
+logger = logging.getLogger(__name__)
+
+HOT_FAILOVER = os.getenv("HOT_FAILOVER", "1") == "1"
+# Keep a pre-authenticated realtime WebSocket open so a failover adopts a live connection
+REALTIME_STANDBY = os.getenv("REALTIME_STANDBY", "0") == "1"
+REALTIME_STANDBY_CHECK_INTERVAL = float(os.getenv("REALTIME_STANDBY_CHECK_INTERVAL", 20))
+
+
+@functools.cache
+def _standby_model_cls():
+    # Defined on first use: subclassing needs the openai plugin, which is imported lazily
+    openai = load_plugin("openai")
+
+    class StandbyRealtimeModel(openai.realtime.RealtimeModel):
+        """RealtimeModel that opens its WebSocket ahead of time and hands it to the next session()"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._standby = None
+            self._keep_warm_task: asyncio.Task | None = None
+
+        def _standby_alive(self) -> bool:
+            return self._standby is not None and not self._standby._main_atask.done()
+
+        def prewarm(self) -> None:
+            """Open (or reopen) the standby connection; the session stays idle until adopted"""
+            if not self._standby_alive():
+                self._standby = super().session()
+                logger.info("🔥 Realtime standby connection opening")
+
+        def start_keep_warm(self) -> None:
+            async def _keep_warm():
+                while True:
+                    self.prewarm()
+                    await asyncio.sleep(REALTIME_STANDBY_CHECK_INTERVAL)
+
+            if self._keep_warm_task is None:
+                self._keep_warm_task = asyncio.create_task(_keep_warm())
+
+        def session(self):
+            if self._keep_warm_task:
+                self._keep_warm_task.cancel()
+                self._keep_warm_task = None
+            standby, self._standby = self._standby, None
+            if standby is not None and not standby._main_atask.done():
+                logger.info("🔥 Adopting prewarmed realtime connection")
+                return standby
+            return super().session()
+
+        async def aclose(self) -> None:
+            if self._keep_warm_task:
+                self._keep_warm_task.cancel()
+                self._keep_warm_task = None
+            if self._standby is not None:
+                try:
+                    await self._standby.aclose()
+                except Exception:
+                    pass
+                self._standby = None
+            await super().aclose()
+
+    return StandbyRealtimeModel
+
+
+def build_realtime_model(standby: bool = False):
+    """Realtime model configuration of the fallback agent"""
+    from openai.types.beta.realtime.session import InputAudioTranscription, TurnDetection
+
+    model_cls = _standby_model_cls() if standby else load_plugin("openai").realtime.RealtimeModel
+    return model_cls(
+        model="gpt-4o-realtime-preview-2024-12-17",
+        voice="echo",
+        api_key=os.getenv("OPENAI_API_KEY"),
+        input_audio_transcription=InputAudioTranscription(
+            model="gpt-4o-transcribe",
+            language=os.getenv("AVATAR_LANGUAGE"),
+        ),
+        temperature=1.0,
+        turn_detection=TurnDetection(
+            type="semantic_vad",
+            eagerness="auto",
+            create_response=True,
+            interrupt_response=True,
+        ),
+    )
+
+
+async def swap_to_realtime(ctx: agents.JobContext, old_session, avatar, realtime_model=None, old_agent=None):
+    """
+    Replace a failing STT/LLM/TTS AgentSession with a realtime one in place.
+    The room connection and the Tavus avatar stay up: the new session streams its
+    audio to the same avatar participant the old one used (or to the room when audio-only),
+    and the new agent continues the old agent's conversation.
+    Returns (new_session, new_agent).
+    """
+    start = time.perf_counter()
+    new_session = AgentSession(llm=realtime_model or build_realtime_model())
+    if avatar is not None:
+        new_session.output.audio = avatar_audio_output(ctx.room, avatar)
+    # The new agent's own instructions replace the old ones, the rolling summary of older turns stays;
+    # tool calls do not carry over to the realtime API
+    chat_ctx = None
+    if old_agent:
+        chat_ctx = ChatContext([
+            i for i in old_agent.chat_ctx.copy(exclude_function_call=True).items
+            if not (i.type == "message" and i.role in ("system", "developer") and i.id != SUMMARY_ID)
+        ])
+    agent = DebugAvatarAgent(system_type="openai_realtime", chat_ctx=chat_ctx)
+
+    # Stop the failing stack first so both sessions never talk to the avatar at once
+    if old_session:
+        try:
+            await asyncio.wait_for(old_session.aclose(), timeout=1.0)
+        except Exception as e:
+            logger.warning(f"Old session did not close cleanly during hot failover: {e}")
+
+    await new_session.start(room=ctx.room, agent=agent,
+                            room_input_options=agents.RoomInputOptions(close_on_disconnect=False))
+    logger.info(f"✅ Hot failover to realtime stack done in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return new_session, agent
+
+
+class RealtimeTranscription:
+    """Input transcription of a realtime model, steered by the STT language lock like an openai STT instance"""
+
+    label = "realtime.input_audio_transcription"
+
+    def __init__(self, model):
+        self._model = model
+
+    def update_options(self, *, language: str) -> None:
+        from openai.types.beta.realtime.session import InputAudioTranscription
+
+        current = self._model._opts.input_audio_transcription
+        # the model pushes the change to its live sessions; no language means detection
+        self._model.update_options(input_audio_transcription=InputAudioTranscription(
+            model=current.model if current else "gpt-4o-transcribe", language=language or None,
+        ))
+
+
+async def rebind_after_swap(session, agent, *, rolling_context=None, speculator=None, language_lock=None,
+                            routers=(), on_pronunciation_result=None) -> list:
+    """
+    Move the session components built for the STT/LLM/TTS stack over to the realtime session and agent
+    of a hot failover. Context folding, the language lock and the pronunciation hook follow the new
+    agent; speculation and the chain routers are closed, the realtime stack has no llm_node and no chains.
+    Returns the STT instances of the new session (the realtime model's input transcription).
+    """
+    stt_instances = [RealtimeTranscription(session.llm)]
+    agent.on_pronunciation_result = on_pronunciation_result
+    if rolling_context:
+        rolling_context.rebind(agent, session)
+    if language_lock:
+        language_lock.retarget(stt_instances)
+        language_lock.attach(session)
+    if speculator:
+        speculator.close()
+    for router in routers:
+        await router.aclose()
+    return stt_instances
@@ -0,0 +1,50 @@
+"""
+Video (Tavus avatar) or audio-only session mode
+The token server picks the mode per /token request and upgrades audio-only rooms to video
+once capacity returns; agents run the same STT/LLM/TTS stack either way
+"""
+
+import os
+import json
+import logging
+
+from livekit import api
+from livekit.protocol import models, room as room_proto
+
+logger = logging.getLogger(__name__)
+
+# Agent side: mode this agent was launched in
+AVATAR_MODE = os.getenv("AVATAR_MODE", "video")
+# Token server side: concurrent Tavus sessions before new sessions go audio-only (0 = no limit)
+VIDEO_SESSION_CAPACITY = int(os.getenv("VIDEO_SESSION_CAPACITY", 0))
+VIDEO_UPGRADE_INTERVAL = float(os.getenv("VIDEO_UPGRADE_INTERVAL", 15))
+# Server-sent control messages to agents; agents ignore this topic from participants
+CONTROL_TOPIC = "control"
+MODES = ("video", "audio", "auto")
+
+
+def choose_mode(requested: str, video_sessions: int, tavus_open: bool) -> str:
+    """Mode a new session starts in; 'auto' goes audio-only when video capacity is used up"""
+    if requested == "audio" or tavus_open:
+        return "audio"
+    if requested == "auto" and VIDEO_SESSION_CAPACITY and video_sessions >= VIDEO_SESSION_CAPACITY:
+        return "audio"
+    return "video"
+
+
+async def send_upgrade(room: str) -> bool:
+    """Ask the agent of `room` to start its Tavus avatar"""
+    lk_api = api.LiveKitAPI(os.getenv("LIVEKIT_URL"), os.getenv("LIVEKIT_API_KEY"), os.getenv("LIVEKIT_API_SECRET"))
+    try:
+        await lk_api.room.send_data(room_proto.SendDataRequest(
+            room=room,
+            data=json.dumps({"type": "upgrade_video"}).encode("utf-8"),
+            kind=models.DataPacket.Kind.RELIABLE,
+            topic=CONTROL_TOPIC,
+        ))
+        return True
+    except Exception as e:
+        logger.warning(f"Could not send video upgrade to {room}: {e}")
+        return False
+    finally:
+        await lk_api.aclose()
@@ -0,0 +1,139 @@
+"""
+Session recording for offline replay
+With SESSION_RECORD=1 the agent writes the inbound events of a session (user audio, data packets)
+and the provider responses (transcripts, replies, metrics) with their offset from the session start
+to recordings/<room>_<ts>/, which session_replay.py plays back without LiveKit or API keys
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+from livekit import rtc
+
+logger = logging.getLogger(__name__)
+
+SESSION_RECORD = os.getenv("SESSION_RECORD", "0") == "1"
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", os.path.join(os.path.dirname(__file__), "recordings"))
+RECORD_SAMPLE_RATE = 16000
+# Inbound frames arriving this much later than expected start a new audio segment
+AUDIO_GAP_S = 0.1
+# Environment the replay needs to rebuild the same agent
+_META_ENV = ("AVATAR_LANGUAGE", "AVATAR_LANGUAGE_STT", "AVATAR_MODE", "EXPECTED_USER_IDENTITY")
+
+
+class SessionRecorder:
+    """
+    events.jsonl holds one record per event, `t` in seconds since the recorder started;
+    audio.pcm holds the user's audio as 16 kHz mono s16le, indexed by the audio_segment records
+    """
+
+    def __init__(self, room_name: str):
+        self.path = os.path.join(RECORDINGS_DIR, f"{room_name}_{int(time.time())}")
+        os.makedirs(self.path, exist_ok=True)
+        self._t0 = time.perf_counter()
+        # line buffered / unbuffered: the agent is SIGKILLed at the end of every session
+        self._events = open(os.path.join(self.path, "events.jsonl"), "a", encoding="utf-8", buffering=1)
+        self._audio = open(os.path.join(self.path, "audio.pcm"), "ab", buffering=0)
+        self._audio_bytes = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+        self.write("meta", room=room_name, sample_rate=RECORD_SAMPLE_RATE,
+                   env={k: os.getenv(k) for k in _META_ENV})
+        logger.info(f"⏺️ Recording session to {self.path}")
+
+    def _now(self) -> float:
+        return round(time.perf_counter() - self._t0, 4)
+
+    def write(self, kind: str, **fields) -> None:
+        if self._closed:
+            return
+        try:
+            self._events.write(json.dumps({"t": self._now(), "kind": kind, **fields}, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.debug(f"Could not record {kind} event: {e}")
+
+    # ------------------------------------------------------------------
+    # Room: data packets and user audio
+    # ------------------------------------------------------------------
+    def attach_room(self, room: rtc.Room) -> None:
+        room.on("data_received", self._on_data)
+        room.on("track_subscribed", self._on_track)
+        room.on("participant_disconnected", lambda p: self.write("participant_disconnected", identity=p.identity))
+        for participant in room.remote_participants.values():
+            for publication in participant.track_publications.values():
+                if publication.track is not None:
+                    self._on_track(publication.track, publication, participant)
+
+    def _on_data(self, packet: rtc.DataPacket) -> None:
+        self.write(
+            "data",
+            topic=packet.topic,
+            identity=packet.participant.identity if packet.participant else None,
+            payload=packet.data.decode("utf-8", errors="replace"),
+        )
+
+    def _on_track(self, track, publication, participant) -> None:
+        if track.kind != rtc.TrackKind.KIND_AUDIO:
+            return
+        task = asyncio.create_task(self._record_audio(track, participant.identity))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record_audio(self, track, identity: str) -> None:
+        stream = rtc.AudioStream(track, sample_rate=RECORD_SAMPLE_RATE, num_channels=1)
+        segment_start, segment_samples = None, 0
+        try:
+            async for ev in stream:
+                if self._closed:
+                    break
+                now = self._now()
+                expected = segment_start + segment_samples / RECORD_SAMPLE_RATE if segment_start is not None else None
+                if expected is None or now > expected + AUDIO_GAP_S:
+                    segment_start, segment_samples = now, 0
+                    self.write("audio_segment", identity=identity, offset=self._audio_bytes)
+                data = bytes(ev.frame.data)
+                self._audio.write(data)
+                self._audio_bytes += len(data)
+                segment_samples += ev.frame.samples_per_channel
+        except Exception as e:
+            logger.warning(f"Audio recording of {identity} stopped: {e}")
+        finally:
+            await stream.aclose()
+
+    # ------------------------------------------------------------------
+    # Session: transcripts, replies and provider metrics
+    # ------------------------------------------------------------------
+    def attach_session(self, session) -> None:
+        session.on("user_input_transcribed", self._on_transcript)
+        session.on("conversation_item_added", self._on_item)
+        session.on("metrics_collected", self._on_metrics)
+
+    def _on_transcript(self, ev) -> None:
+        if ev.is_final:
+            self.write("transcript", text=ev.transcript)
+
+    def _on_item(self, ev) -> None:
+        item = ev.item
+        if item.type == "message" and item.role in ("user", "assistant"):
+            self.write("item", role=item.role, text=item.text_content or "", interrupted=item.interrupted)
+
+    def _on_metrics(self, ev) -> None:
+        m = ev.metrics
+        if m.type in ("llm_metrics", "tts_metrics", "stt_metrics", "eou_metrics"):
+            self.write("metrics", metrics=m.model_dump(mode="json"))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.write("end")
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        for f in (self._events, self._audio):
+            try:
+                f.close()
+            except Exception:
+                pass
@@ -0,0 +1,346 @@
+"""
+Offline replay of recorded sessions
+`python session_replay.py <recording>` runs avatar_agent's entrypoint in a child process against a
+fake room that re-emits the recorded user audio and data packets on the recorded schedule, with
+stand-in providers answering from the recording. Reports per-turn latency and the messages the
+agent published, and fails against a baseline replay when either regressed.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import subprocess
+
+from livekit import rtc
+from livekit.agents.voice.io import AudioInput, AudioOutput
+
+from session_mode import CONTROL_TOPIC
+from stand_in_providers import StandInAvatarOutput, StandInLLM, StandInSTT, StandInTTS
+
+logger = logging.getLogger(__name__)
+
+# Set in the child process: path of the recording being replayed
+SESSION_REPLAY = os.getenv("SESSION_REPLAY")
+REPLAY_TOLERANCE = float(os.getenv("REPLAY_TOLERANCE", 0.2))
+REPLAY_SLACK_MS = float(os.getenv("REPLAY_SLACK_MS", 50))
+# Session features that need a network or add nondeterminism are turned off in the child
+_CHILD_ENV = {
+    "AVATAR_MODE": "audio",
+    "PROVIDER_WARMUP": "0",
+    "HOT_FAILOVER": "0",
+    "REALTIME_STANDBY": "0",
+    "SPECULATIVE_LLM": "0",
+    "LLM_HEDGING": "0",
+    "CONTEXT_MANAGER": "0",
+    "TAVUS_PREPROVISIONED": "0",
+    "SESSION_RECORD": "0",
+    "STARTUP_PROFILE": "0",
+}
+_REPORT_STAGES = ("stt", "llm", "tts", "first_audio", "total")
+_FRAME_MS = 20
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+class Recording:
+    """Parsed recordings/<room>_<ts>/ directory written by SessionRecorder"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "events.jsonl"), encoding="utf-8") as f:
+            self.events = [json.loads(line) for line in f if line.strip()]
+        self.meta = next((e for e in self.events if e["kind"] == "meta"), {})
+        self.sample_rate = self.meta.get("sample_rate", 16000)
+        self.duration = max((e["t"] for e in self.events), default=0.0)
+        with open(os.path.join(path, "audio.pcm"), "rb") as f:
+            pcm = f.read()
+        offsets = [e for e in self.events if e["kind"] == "audio_segment"]
+        ends = [e["offset"] for e in offsets[1:]] + [len(pcm)]
+        self.audio_segments = [(e["t"], pcm[e["offset"]:end]) for e, end in zip(offsets, ends)]
+
+    def metrics(self, kind: str) -> list[dict]:
+        return [e["metrics"] for e in self.events if e["kind"] == "metrics" and e["metrics"]["type"] == kind]
+
+    def transcripts(self) -> list[tuple[str, float]]:
+        """Final transcripts in order, each with the recorded end-of-speech to transcript delay"""
+        delays = [m["transcription_delay"] for m in self.metrics("eou_metrics")]
+        texts = [e["text"] for e in self.events if e["kind"] == "transcript"]
+        return [(text, delays[i] if i < len(delays) else 0.3) for i, text in enumerate(texts)]
+
+    def replies(self) -> list[dict]:
+        """Assistant replies that came from an LLM call, with the user message they answered"""
+        replies, pending, last_user = [], [], None
+        for e in self.events:
+            if e["kind"] == "metrics" and e["metrics"]["type"] == "llm_metrics":
+                pending.append(e["metrics"])
+            elif e["kind"] == "item" and e["role"] == "user":
+                last_user = e["text"]
+            elif e["kind"] == "item" and e["role"] == "assistant":
+                if pending:  # no LLM metrics: answered locally (canned pronunciation feedback)
+                    fastest = min(pending, key=lambda m: m["ttft"])
+                    replies.append({"user": last_user, "text": e["text"], "ttft": max(fastest["ttft"], 0.0),
+                                    "tokens_per_s": fastest["tokens_per_second"]})
+                pending = []
+        return replies
+
+    def tts_timing(self) -> tuple[float, float]:
+        """(median time to first byte, seconds of audio per character)"""
+        tts = [m for m in self.metrics("tts_metrics") if m["ttfb"] >= 0]
+        if not tts:
+            return 0.25, 0.06
+        chars = sum(m["characters_count"] for m in tts)
+        audio = sum(m["audio_duration"] for m in tts)
+        return statistics.median(m["ttfb"] for m in tts), (audio / chars if chars else 0.06)
+
+
+def replay_chains(path: str) -> tuple[list, list, list]:
+    """STT, LLM and TTS chains of stand-ins scripted from the recording at `path`"""
+    recording = Recording(path)
+    ttfb, seconds_per_char = recording.tts_timing()
+    language = (recording.meta.get("env") or {}).get("AVATAR_LANGUAGE") or ""
+    return (
+        [StandInSTT(recording.transcripts(), language=language)],
+        [StandInLLM(recording.replies())],
+        [StandInTTS(ttfb=ttfb, seconds_per_char=seconds_per_char)],
+    )
+
+
+# ---------------------------------------------------------------------------
+# Fake room and audio IO
+# ---------------------------------------------------------------------------
+class _Participant:
+    def __init__(self, identity: str):
+        self.identity = identity
+        self.track_publications: dict = {}
+
+
+class _LocalParticipant(_Participant):
+    def __init__(self, room: "FakeRoom"):
+        super().__init__("agent")
+        self._room = room
+
+    async def publish_data(self, payload, *, reliable: bool = True, topic: str = "", destination_identities=None):
+        data = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+        self._room.log("published", topic=topic, payload=data)
+
+
+class FakeRoom(rtc.EventEmitter):
+    """The parts of rtc.Room the entrypoint uses; plays the recorded data packets and departures"""
+
+    def __init__(self, recording: Recording, out_dir: str):
+        super().__init__()
+        self.name = f"replay-{os.path.basename(os.path.normpath(recording.path))}"
+        self._recording = recording
+        self._user = (recording.meta.get("env") or {}).get("EXPECTED_USER_IDENTITY") or "replay-user"
+        self.local_participant = _LocalParticipant(self)
+        self.remote_participants = {self._user: _Participant(self._user)}
+        self._connected = False
+        self._t0 = time.perf_counter()
+        self._log = open(os.path.join(out_dir, "published.jsonl"), "a", encoding="utf-8", buffering=1)
+        self._listeners: dict[str, asyncio.Event] = {}
+
+    def log(self, kind: str, **fields) -> None:
+        self._log.write(json.dumps({"t": round(time.perf_counter() - self._t0, 4), "kind": kind, **fields},
+                                   ensure_ascii=False) + "\n")
+
+    def _listener(self, event: str) -> asyncio.Event:
+        return self._listeners.setdefault(event, asyncio.Event())
+
+    def on(self, event, callback=None):
+        self._listener(event).set()
+        return super().on(event, callback)
+
+    def isconnected(self) -> bool:
+        return self._connected
+
+    async def connect(self) -> None:
+        self._connected = True
+        self._play_task = asyncio.create_task(self._play())
+
+    async def disconnect(self) -> None:
+        self._connected = False
+
+    async def _play(self) -> None:
+        disconnected = False
+        for e in self._recording.events:
+            await asyncio.sleep(max(self._t0 + e["t"] - time.perf_counter(), 0))
+            if e["kind"] == "data" and e.get("topic") != CONTROL_TOPIC:
+                # the agent only listens once its session started; hold earlier packets until then
+                await self._listener("data_received").wait()
+                participant = self.remote_participants.get(e.get("identity")) or _Participant(e.get("identity") or "")
+                self.log("received", topic=e.get("topic"), payload=e["payload"])
+                self.emit("data_received", rtc.DataPacket(
+                    data=e["payload"].encode("utf-8"), kind=rtc.DataPacketKind.KIND_RELIABLE,
+                    participant=participant, topic=e.get("topic"),
+                ))
+            elif e["kind"] == "participant_disconnected" and e["identity"] == self._user:
+                disconnected = True
+                await self._leave()
+        if not disconnected:
+            await self._leave()
+
+    async def _leave(self) -> None:
+        await self._listener("participant_disconnected").wait()
+        self.log("user_left")
+        self.emit("participant_disconnected", self.remote_participants[self._user])
+
+
+class ReplayAudioInput(AudioInput):
+    """Recorded user audio at real-time pace, silence between segments as a live track would send"""
+
+    def __init__(self, recording: Recording, t0: float):
+        self._recording = recording
+        self._t0 = t0
+        self._frames = self._generate()
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        return await self._frames.__anext__()
+
+    async def _generate(self):
+        rate = self._recording.sample_rate
+        frame_samples = rate * _FRAME_MS // 1000
+        frame_s = frame_samples / rate
+        silence = b"\x00\x00" * frame_samples
+        pos = 0.0
+        segments = list(self._recording.audio_segments) + [(float("inf"), b"")]
+        for start, pcm in segments:
+            while pos + frame_s <= start:
+                await asyncio.sleep(max(self._t0 + pos - time.perf_counter(), 0))
+                yield rtc.AudioFrame(silence, rate, 1, frame_samples)
+                pos += frame_s
+            pos = max(pos, start)
+            for i in range(0, len(pcm) - 1, frame_samples * 2):
+                chunk = pcm[i:i + frame_samples * 2]
+                await asyncio.sleep(max(self._t0 + pos - time.perf_counter(), 0))
+                yield rtc.AudioFrame(chunk, rate, 1, len(chunk) // 2)
+                pos += len(chunk) / 2 / rate
+
+
+class ReplayJobContext:
+    """Stands in for agents.JobContext; the entrypoint asks it for the audio IO via replay_audio()"""
+
+    def __init__(self, recording_path: str, out_dir: str):
+        self.recording = Recording(recording_path)
+        self.room = FakeRoom(self.recording, out_dir)
+
+    async def connect(self, **kwargs) -> None:
+        await self.room.connect()
+
+    def replay_audio(self) -> tuple[AudioInput, AudioOutput]:
+        return ReplayAudioInput(self.recording, self.room._t0), StandInAvatarOutput(on_event=self.room.log)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+def _run_child(recording_path: str, out_dir: str) -> None:
+    import avatar_agent
+
+    ctx = ReplayJobContext(recording_path, out_dir)
+    try:
+        asyncio.run(avatar_agent.entrypoint(ctx))
+    except BaseException as e:
+        logger.error(f"Replay child failed: {e!r}")
+    finally:
+        # the agent's atexit handler SIGKILLs the process, the report is already on disk
+        os._exit(0)
+
+
+def replay(recording_path: str, out_dir: str) -> dict:
+    """Replay once in a fresh process and collect the latency records and published messages"""
+    recording = Recording(recording_path)
+    os.makedirs(out_dir, exist_ok=True)
+    env = {**os.environ, **_CHILD_ENV,
+           **{k: v for k, v in (recording.meta.get("env") or {}).items() if v and k != "AVATAR_MODE"},
+           "SESSION_REPLAY": recording_path,
+           "LATENCY_LOG_PATH": os.path.join(out_dir, "latency.jsonl")}
+    env.setdefault("EXPECTED_USER_IDENTITY", "replay-user")
+    with open(os.path.join(out_dir, "agent.log"), "w", encoding="utf-8") as log:
+        try:
+            exit_code = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", recording_path, out_dir],
+                cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT,
+                timeout=recording.duration + 60,
+            ).returncode
+        except subprocess.TimeoutExpired:
+            exit_code = None
+
+    records, published = [], []
+    for name, sink in (("latency.jsonl", records), ("published.jsonl", published)):
+        try:
+            with open(os.path.join(out_dir, name), encoding="utf-8") as f:
+                sink.extend(json.loads(line) for line in f if line.strip())
+        except OSError:
+            pass
+    summary = next((r for r in reversed(records) if r["kind"] == "summary"), None)
+    turns = [r for r in records if r["kind"] == "turn"]
+    sent = [json.loads(p["payload"]).get("type") for p in published
+            if p["kind"] == "published" and p["payload"].startswith("{")]
+    return {
+        "recording": recording_path,
+        "exit_code": exit_code,  # -9 is the normal end: the agent SIGKILLs itself
+        "turns": len(turns),
+        "turn_sources": [t["source"] for t in turns],
+        "stages_p50": {name: (summary or {}).get("stages", {}).get(name, {}).get("p50") for name in _REPORT_STAGES},
+        "published_types": sent,
+        "summary": summary,
+    }
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """Regressions of `report` against `baseline`: slower stages and changed behavior"""
+    problems = []
+    for name in _REPORT_STAGES:
+        new, old = report["stages_p50"].get(name), baseline["stages_p50"].get(name)
+        if new is not None and old is not None and new > old * (1 + REPLAY_TOLERANCE) + REPLAY_SLACK_MS:
+            problems.append(f"{name} p50 {old:.0f} -> {new:.0f} ms")
+    if report["turn_sources"] != baseline["turn_sources"]:
+        problems.append(f"turns {baseline['turn_sources']} -> {report['turn_sources']}")
+    if report["published_types"] != baseline["published_types"]:
+        problems.append(f"published messages {baseline['published_types']} -> {report['published_types']}")
+    return problems
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        _run_child(sys.argv[2], sys.argv[3])
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Replay a recorded session offline and check for regressions")
+    parser.add_argument("recording")
+    parser.add_argument("--out", help="output directory (default <recording>/replay_<ts>)")
+    parser.add_argument("--baseline", help="report to compare with (default <recording>/baseline.json)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    out = args.out or os.path.join(args.recording, f"replay_{int(time.time())}")
+    report = replay(args.recording, out)
+    with open(os.path.join(out, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"🔁 {report['turns']} turns, p50 {report['stages_p50']} -> {out}")
+    if report["summary"] is None:
+        logger.error(f"❌ Replay produced no latency summary, see {os.path.join(out, 'agent.log')}")
+        sys.exit(1)
+
+    baseline_path = args.baseline or os.path.join(args.recording, "baseline.json")
+    if args.update_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Recorded baseline {baseline_path}")
+        sys.exit(0)
+    try:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        logger.warning("No baseline yet, run with --update-baseline")
+        sys.exit(0)
+    problems = compare(report, baseline)
+    for problem in problems:
+        logger.error(f"❌ Regression: {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,71 @@
+"""
+Reconnect-aware session resume
+When the expected user drops out, the agent keeps its session for RECONNECT_GRACE_S instead of shutting
+down. A /token request for the same room and identity in that window reuses the live agent: the token
+server only issues a fresh JWT, the conversation context, avatar and provider connections stay.
+The handoff is a small presence file per room, written by the agent and read by the token server.
+"""
+
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long an agent waits for its user to come back (0 = shut down 4s after the user left, as before)
+RECONNECT_GRACE_S = float(os.getenv("RECONNECT_GRACE_S", 30))
+# A rejoin needs this much of the window left: token round trip plus the client's room connect
+RESUME_MARGIN_S = float(os.getenv("RESUME_MARGIN_S", 5))
+_PRESENCE_DIR = os.path.join(os.path.dirname(__file__), "session_resume")
+
+
+def _presence_path(room: str) -> str:
+    return os.path.join(_PRESENCE_DIR, f"{room}.json")
+
+
+# ---------------------------------------------------------------------------
+# Agent side
+# ---------------------------------------------------------------------------
+def write_presence(room: str, state: str, until: float | None = None):
+    """
+    state: "active" (user in the room), "waiting" (user gone, resumable until `until`)
+    or "closed" (shutting down or handed over to the fallback agent, never resumable)
+    """
+    try:
+        os.makedirs(_PRESENCE_DIR, exist_ok=True)
+        tmp = _presence_path(room) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"state": state, "until": until, "pid": os.getpid(), "ts": time.time()}, f)
+        os.replace(tmp, _presence_path(room))
+    except OSError as e:
+        logger.warning(f"Could not write session presence for {room}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Token server side
+# ---------------------------------------------------------------------------
+def read_presence(room: str) -> dict | None:
+    try:
+        with open(_presence_path(room), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def clear_presence(room: str):
+    try:
+        os.remove(_presence_path(room))
+    except FileNotFoundError:
+        pass
+
+
+def resumable(room: str, pids: set[int]) -> bool:
+    """Whether the room's agent (`pids`: its process tree) would still be there for a user joining now"""
+    presence = read_presence(room)
+    # a file left by an earlier agent of the room does not count
+    if presence is None or presence.get("pid") not in pids:
+        return False
+    if presence["state"] == "active":
+        return True
+    return presence["state"] == "waiting" and time.time() < (presence["until"] or 0) - RESUME_MARGIN_S
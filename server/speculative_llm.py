@@ -0,0 +1,209 @@
+"""
+Speculative LLM generation from interim transcripts
+Starts the chat request on a stable interim transcript while the user is finishing their turn;
+the agent's llm_node commits it when the final user message matches and discards it otherwise
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+
+from livekit.agents import llm as livekitllm
+from livekit.agents.voice.agent_activity import _SpeechHandleContextVar
+
+from turn_latency import percentile
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "0") == "1"
+# An interim transcript unchanged for this long (or at VAD end of speech) is worth speculating on
+SPECULATION_STABLE_MS = float(os.getenv("SPECULATION_STABLE_MS", 300))
+SPECULATION_MIN_CHARS = int(os.getenv("SPECULATION_MIN_CHARS", 4))
+
+
+def normalize(text: str) -> str:
+    """Compare transcripts without case, punctuation and spacing differences"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _fingerprint(items) -> list[tuple]:
+    return [(item.type, getattr(item, "role", None), getattr(item, "text_content", None)) for item in items]
+
+
+class _Speculation:
+    """One in-flight chat request started on an interim transcript"""
+
+    def __init__(self, llm, chat_ctx: livekitllm.ChatContext, text: str, conn_options):
+        self.text = text
+        self.base = _fingerprint(chat_ctx.items)
+        self.started_at = time.time()
+        self.first_chunk_at: float | None = None
+        self.chunks: list = []
+        self.done = False
+        self.error: Exception | None = None
+        self._updated = asyncio.Event()
+
+        ctx = chat_ctx.copy()
+        ctx.add_message(role="user", content=text)
+        self._task = asyncio.create_task(self._run(llm, ctx, conn_options))
+
+    async def _run(self, llm, ctx, conn_options):
+        try:
+            async with llm.chat(chat_ctx=ctx, conn_options=conn_options) as stream:
+                async for chunk in stream:
+                    if self.first_chunk_at is None:
+                        self.first_chunk_at = time.time()
+                    self.chunks.append(chunk)
+                    self._updated.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._updated.set()
+
+    def matches(self, chat_ctx: livekitllm.ChatContext) -> bool:
+        items = chat_ctx.items
+        if not items or getattr(items[-1], "role", None) != "user" or self.error is not None:
+            return False
+        return normalize(items[-1].text_content or "") == normalize(self.text) and _fingerprint(items[:-1]) == self.base
+
+    async def replay(self):
+        """Buffered chunks first, then the rest of the stream as it arrives"""
+        sent = 0
+        while True:
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._updated.clear()
+            await self._updated.wait()
+
+    def cancel(self) -> None:
+        if not self._task.done():
+            self._task.cancel()
+
+
+class SpeculativeGenerator:
+    """Feeds on interim transcripts of a session and hands matching speculations to the agent"""
+
+    def __init__(self, llm, conn_options=None, latency=None):
+        self._llm = llm
+        self._conn_options = conn_options
+        self._latency = latency
+        self._agent = None
+        self._current: _Speculation | None = None
+        self._interim = ""
+        self._stable_timer: asyncio.TimerHandle | None = None
+        self.started = 0
+        self.committed = 0
+        self.discarded = 0
+        self._saved_ms: list[float] = []
+
+    def attach(self, session, agent) -> None:
+        self._agent = agent
+        agent.speculator = self
+        if self._conn_options is None:
+            self._conn_options = session.conn_options.llm_conn_options
+        session.on("user_input_transcribed", self._on_transcribed)
+        session.on("user_state_changed", self._on_user_state_changed)
+
+    def _on_transcribed(self, ev) -> None:
+        if ev.is_final:
+            return
+        self._interim = ev.transcript
+        if self._current is not None and normalize(self._current.text) != normalize(ev.transcript):
+            # the user kept talking, this speculation can no longer match
+            self._discard()
+        if self._stable_timer:
+            self._stable_timer.cancel()
+        self._stable_timer = asyncio.get_running_loop().call_later(SPECULATION_STABLE_MS / 1000, self._speculate)
+
+    def _on_user_state_changed(self, ev) -> None:
+        if ev.old_state == "speaking" and ev.new_state == "listening":
+            self._speculate()
+
+    def _speculate(self) -> None:
+        text = self._interim
+        if len(normalize(text)) < SPECULATION_MIN_CHARS or self._agent is None:
+            return
+        if self._current is not None and normalize(self._current.text) == normalize(text):
+            return
+        self._discard()
+        self._current = _Speculation(self._llm, self._agent.chat_ctx, text, self._conn_options)
+        self.started += 1
+        logger.debug(f"Speculating on interim transcript: {text!r}")
+
+    def close(self) -> None:
+        """Stop speculating for good (hot failover): the realtime stack has no llm_node to take a speculation"""
+        if self._stable_timer:
+            self._stable_timer.cancel()
+            self._stable_timer = None
+        self._discard()
+        if self._agent is not None:
+            self._agent.speculator = None
+            self._agent = None
+
+    def _discard(self) -> None:
+        if self._current is not None:
+            self._current.cancel()
+            self._current = None
+            self.discarded += 1
+
+    def skip(self) -> None:
+        """The turn was answered without an LLM call: its speculation is discarded"""
+        if self._stable_timer:
+            self._stable_timer.cancel()
+            self._stable_timer = None
+        self._interim = ""
+        self._discard()
+
+    def take(self, chat_ctx: livekitllm.ChatContext, tools: list):
+        """Chunk iterator of a matching speculation, or None to run the normal LLM call"""
+        if self._stable_timer:
+            self._stable_timer.cancel()
+            self._stable_timer = None
+        self._interim = ""
+        spec, self._current = self._current, None
+        if spec is None:
+            return None
+        if tools or not spec.matches(chat_ctx):
+            spec.cancel()
+            self.discarded += 1
+            logger.debug(f"Speculation discarded, final transcript differs from {spec.text!r}")
+            return None
+
+        # The head start is the whole time-to-first-token when the first chunk is already there
+        now = time.time()
+        elapsed = now - spec.started_at
+        ttft = (spec.first_chunk_at - spec.started_at) if spec.first_chunk_at else None
+        self._saved_ms.append(round(min(elapsed, ttft if ttft is not None else elapsed) * 1000, 1))
+        self.committed += 1
+        return self._commit(spec, _SpeechHandleContextVar.get(None))
+
+    async def _commit(self, spec: _Speculation, speech):
+        first = True
+        try:
+            async for chunk in spec.replay():
+                if first and self._latency and speech is not None:
+                    # the speculative request ran outside the speech, its LLM metrics carry no speech_id
+                    self._latency.mark_speculated(speech.id, time.time())
+                first = False
+                yield chunk
+        finally:
+            spec.cancel()  # interrupted reply
+
+    def stats(self) -> dict:
+        decided = self.committed + self.discarded
+        return {
+            "started": self.started,
+            "committed": self.committed,
+            "discarded": self.discarded,
+            "discard_rate": round(self.discarded / decided, 3) if decided else 0.0,
+            "saved_ms_p50": percentile(self._saved_ms, 50),
+            "saved_ms_p90": percentile(self._saved_ms, 90),
+        }
@@ -0,0 +1,289 @@
+"""
+Local stand-in STT, LLM, TTS and avatar providers
+Answer from scripted responses with scripted latencies, so a session runs without network
+access or API keys; the session replay harness scripts them from a recording.
+With SIM_PROVIDERS=1 the agent runs on them for capacity testing, timed by the SIM_* settings.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+from livekit import rtc
+from livekit.agents import APIConnectionError, stt as livekitstt, llm as livekitllm, tts as livekittts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN
+from livekit.agents.voice.io import AudioOutput
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 24000
+_WORD = re.compile(r"\S+\s*")
+_TTS_CHUNK_S = 0.1
+
+# Capacity testing: simulated providers instead of the real chains and the Tavus avatar
+SIM_PROVIDERS = os.getenv("SIM_PROVIDERS", "0") == "1"
+# Default +/- fraction applied to every simulated latency, SIM_<KIND>_JITTER overrides it
+SIM_JITTER = float(os.getenv("SIM_JITTER", 0.2))
+SIM_TRANSCRIPT = os.getenv("SIM_TRANSCRIPT", "Can you teach me a new word?")
+SIM_REPLY = os.getenv("SIM_REPLY", "Of course! Today's word is apple. An apple is a round fruit that can be red, "
+                                   "green or yellow. Can you say apple?")
+
+
+@dataclass
+class SimProfile:
+    """Timing of one simulated provider kind, from SIM_<KIND>_LATENCY/_JITTER/_RATE/_FAILURE_RATE/_BACKUP_FAILURE_RATE"""
+    latency: float  # STT: end of speech to transcript, LLM: time to first token, TTS: first byte, avatar: start
+    jitter: float
+    rate: float  # LLM: tokens/s, TTS: seconds of audio per second (0 = all at once), avatar: output delay (s)
+    failure_rate: float  # probability that a request to the first provider of the chain fails
+    backup_failure_rate: float  # same for the second one; both at 1 take the whole chain down
+
+    @classmethod
+    def from_env(cls, kind: str, latency: float, rate: float = 0.0) -> "SimProfile":
+        prefix = f"SIM_{kind.upper()}_"
+        return cls(
+            latency=float(os.getenv(prefix + "LATENCY", latency)),
+            jitter=float(os.getenv(prefix + "JITTER", SIM_JITTER)),
+            rate=float(os.getenv(prefix + "RATE", rate)),
+            failure_rate=float(os.getenv(prefix + "FAILURE_RATE", 0)),
+            backup_failure_rate=float(os.getenv(prefix + "BACKUP_FAILURE_RATE", 0)),
+        )
+
+    def failure_rates(self, inject: bool = True) -> tuple[float, float]:
+        return (self.failure_rate, self.backup_failure_rate) if inject else (0.0, 0.0)
+
+
+def _jittered(seconds: float, jitter: float) -> float:
+    return max(seconds * (1 + random.uniform(-jitter, jitter)), 0.0) if jitter else seconds
+
+
+def _inject_failure(what: str, failure_rate: float) -> None:
+    if failure_rate and random.random() < failure_rate:
+        raise APIConnectionError(f"Simulated {what} failure")
+
+
+def last_user_text(chat_ctx) -> str | None:
+    for item in reversed(chat_ctx.items):
+        if item.type == "message" and item.role == "user":
+            return item.text_content
+    return None
+
+
+class StandInSTT(livekitstt.STT):
+    """Batch STT (run behind VAD by the FallbackAdapter) returning scripted transcripts in order"""
+
+    def __init__(self, transcripts: list[tuple[str, float]], *, language: str = "", default_text: str = "",
+                 default_delay: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(capabilities=livekitstt.STTCapabilities(streaming=False, interim_results=False))
+        self._script = deque(transcripts)  # (text, seconds from end of speech to transcript)
+        self._language = language
+        self._default = (default_text, default_delay)  # once the script ran out
+        self._jitter = jitter
+        self._failure_rate = failure_rate
+
+    async def _recognize_impl(self, buffer, *, language=NOT_GIVEN, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        _inject_failure("STT", self._failure_rate)
+        text, delay = self._script.popleft() if self._script else self._default
+        await asyncio.sleep(_jittered(delay, self._jitter))
+        return livekitstt.SpeechEvent(
+            type=livekitstt.SpeechEventType.FINAL_TRANSCRIPT,
+            request_id=utils.shortuuid(),
+            alternatives=[livekitstt.SpeechData(language=self._language, text=text)],
+        )
+
+
+class StandInLLM(livekitllm.LLM):
+    """
+    Streams scripted replies word by word after a scripted time to first token.
+    A reply scripted for the same user message wins over the next one in order, so a turn
+    answered without an LLM call (canned pronunciation feedback) does not shift the script.
+    """
+
+    def __init__(self, replies: list[dict], *, fallback_text: str = "OK.", ttft: float = 0.4,
+                 tokens_per_s: float = 40.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        super().__init__()
+        self._replies = list(replies)  # {"user", "text", "ttft", "tokens_per_s"}
+        self._fallback_text = fallback_text
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    def _next_reply(self, chat_ctx) -> dict:
+        user = last_user_text(chat_ctx)
+        for i, reply in enumerate(self._replies):
+            if user is not None and reply.get("user") == user:
+                return self._replies.pop(i)
+        if self._replies:
+            return self._replies.pop(0)
+        return {"text": self._fallback_text}
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=DEFAULT_API_CONNECT_OPTIONS, **kwargs):
+        return _StandInLLMStream(
+            self, reply=self._next_reply(chat_ctx), chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options
+        )
+
+
+class _StandInLLMStream(livekitllm.LLMStream):
+    def __init__(self, llm: StandInLLM, *, reply: dict, **kwargs):
+        self._reply = reply
+        super().__init__(llm, **kwargs)
+
+    async def _run(self) -> None:
+        llm: StandInLLM = self._llm
+        request_id = utils.shortuuid()
+        _inject_failure("LLM", llm.failure_rate)
+        interval = 1 / max(self._reply.get("tokens_per_s") or llm.tokens_per_s, 1.0)
+        await asyncio.sleep(_jittered(self._reply.get("ttft") or llm.ttft, llm.jitter))
+        for i, word in enumerate(_WORD.findall(self._reply["text"])):
+            if i:
+                await asyncio.sleep(_jittered(interval, llm.jitter))
+            self._event_ch.send_nowait(livekitllm.ChatChunk(
+                id=request_id, delta=livekitllm.ChoiceDelta(role="assistant", content=word)
+            ))
+
+
+class StandInTTS(livekittts.TTS):
+    """
+    Non-streaming TTS producing silence: scripted time to first byte, duration from the text length.
+    `rate` paces the audio at that many seconds of audio per second; 0 returns it all at once.
+    """
+
+    def __init__(self, *, ttfb: float = 0.25, seconds_per_char: float = 0.06, rate: float = 0.0,
+                 jitter: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(
+            capabilities=livekittts.TTSCapabilities(streaming=False), sample_rate=SAMPLE_RATE, num_channels=1
+        )
+        self.ttfb = ttfb
+        self.seconds_per_char = seconds_per_char
+        self.rate = rate
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    def synthesize(self, text: str, *, conn_options=DEFAULT_API_CONNECT_OPTIONS) -> "_StandInChunkedStream":
+        return _StandInChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class _StandInChunkedStream(livekittts.ChunkedStream):
+    async def _run(self, output_emitter) -> None:
+        tts: StandInTTS = self._tts
+        output_emitter.initialize(
+            request_id=utils.shortuuid(), sample_rate=SAMPLE_RATE, num_channels=1, mime_type="audio/pcm"
+        )
+        _inject_failure("TTS", tts.failure_rate)
+        await asyncio.sleep(_jittered(tts.ttfb, tts.jitter))
+        samples = max(int(len(self._input_text) * tts.seconds_per_char * SAMPLE_RATE), SAMPLE_RATE // 10)
+        if not tts.rate:
+            # Whole response at once, like a provider returning the audio faster than real time
+            output_emitter.push(b"\x00\x00" * samples)
+        else:
+            chunk = int(_TTS_CHUNK_S * SAMPLE_RATE)
+            for i in range(0, samples, chunk):
+                if i:
+                    await asyncio.sleep(_TTS_CHUNK_S / tts.rate)
+                output_emitter.push(b"\x00\x00" * min(chunk, samples - i))
+        output_emitter.flush()
+
+
+# ---------------------------------------------------------------------------
+# Avatar
+# ---------------------------------------------------------------------------
+class StandInAvatarOutput(AudioOutput):
+    """
+    Discards the agent's audio but reports playout in real time, `latency` after the first frame,
+    like the Tavus/room sink. `on_event(kind, **fields)` is told about every playout start and end.
+    """
+
+    def __init__(self, *, latency: float = 0.0, on_event=None):
+        super().__init__(next_in_chain=None, sample_rate=None)
+        self._latency = latency
+        self._on_event = on_event
+        self._started_at: float | None = None
+        self._pushed = 0.0
+        self._finish_task: asyncio.Task | None = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._started_at is None:
+            self._started_at = time.perf_counter() + self._latency
+            if self._on_event:
+                self._on_event("playout_start")
+        self._pushed += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._started_at is None or self._finish_task is not None:
+            return
+        remaining = self._started_at + self._pushed - time.perf_counter()
+        self._finish_task = asyncio.create_task(self._finish(remaining))
+
+    async def _finish(self, delay: float) -> None:
+        await asyncio.sleep(max(delay, 0))
+        self._end(self._pushed, interrupted=False)
+
+    def clear_buffer(self) -> None:
+        if self._started_at is None:
+            return
+        if self._finish_task is not None:
+            self._finish_task.cancel()
+        self._end(min(max(time.perf_counter() - self._started_at, 0.0), self._pushed), interrupted=True)
+
+    def _end(self, position: float, interrupted: bool) -> None:
+        if self._on_event:
+            self._on_event("playout_end", position=round(position, 3), interrupted=interrupted)
+        self._started_at, self._pushed, self._finish_task = None, 0.0, None
+        self.on_playback_finished(playback_position=position, interrupted=interrupted)
+
+
+class StandInAvatar:
+    """
+    Stands in for tavus.AvatarSession: start() takes the replica's join time, then moves the
+    session's audio output to a StandInAvatarOutput. Publishes no video.
+    """
+
+    _avatar_participant_identity = "stand-in-avatar"
+
+    def __init__(self, *, start_delay: float = 2.0, latency: float = 0.1, jitter: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.start_delay = start_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    async def start(self, agent_session, room=None) -> None:
+        await asyncio.sleep(_jittered(self.start_delay, self.jitter))
+        _inject_failure("avatar", self.failure_rate)
+        agent_session.output.audio = StandInAvatarOutput(latency=_jittered(self.latency, self.jitter))
+
+
+# ---------------------------------------------------------------------------
+# Capacity testing chains
+# ---------------------------------------------------------------------------
+def sim_chains(language: str = "", inject_failures: bool = True) -> tuple[list, list, list]:
+    """
+    Two-provider STT, LLM and TTS chains shaped like the production ones, timed by the SIM_* settings.
+    SIM_<KIND>_FAILURE_RATE fails the first provider of a chain, so it exercises the FallbackAdapter.
+    The fallback agent passes inject_failures=False: it stands in for a different provider.
+    """
+    stt = SimProfile.from_env("stt", 0.3)
+    llm = SimProfile.from_env("llm", 0.5, 40.0)
+    tts = SimProfile.from_env("tts", 0.25)
+    return (
+        [StandInSTT([], language=language, default_text=SIM_TRANSCRIPT, default_delay=stt.latency, jitter=stt.jitter,
+                    failure_rate=failure_rate) for failure_rate in stt.failure_rates(inject_failures)],
+        [StandInLLM([], fallback_text=SIM_REPLY, ttft=llm.latency, tokens_per_s=llm.rate, jitter=llm.jitter,
+                    failure_rate=failure_rate) for failure_rate in llm.failure_rates(inject_failures)],
+        [StandInTTS(ttfb=tts.latency, rate=tts.rate, jitter=tts.jitter, failure_rate=failure_rate)
+         for failure_rate in tts.failure_rates(inject_failures)],
+    )
+
+
+def sim_avatar() -> StandInAvatar:
+    avatar = SimProfile.from_env("avatar", 2.0, 0.1)
+    return StandInAvatar(start_delay=avatar.latency, latency=avatar.rate, jitter=avatar.jitter,
+                         failure_rate=avatar.failure_rate)
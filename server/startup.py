@@ -0,0 +1,138 @@
+"""
+Startup orchestration for the avatar agents
+Runs independent startup steps concurrently and logs the critical path as a per-stage timeline
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import importlib
+from contextlib import contextmanager
+
+from livekit import rtc
+from livekit.agents import utils
+from livekit.agents.voice.avatar import DataStreamAudioOutput
+
+from provider_health import plugin_of
+from turn_latency import LATENCY_LOG_PATH
+from startup_profile import STARTUP_PROFILE, write_agent_report
+
+logger = logging.getLogger(__name__)
+
+AVATAR_READY_TIMEOUT = float(os.getenv("AVATAR_READY_TIMEOUT", 5))
+
+# Import time (ms) of each plugin loaded by this process
+PLUGIN_LOAD_MS: dict[str, float] = {}
+
+
+def load_plugin(name: str):
+    """
+    Import livekit.plugins.<name> on first use instead of at module import, so the watcher and
+    worker processes and unused providers never pay for it. Plugins register themselves on import,
+    which livekit only allows on the main thread: never call this from asyncio.to_thread.
+    """
+    module_name = f"livekit.plugins.{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    PLUGIN_LOAD_MS[name] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"🔌 Loaded {name} plugin in {PLUGIN_LOAD_MS[name]:.0f} ms")
+    return module
+
+
+def chain_plugins(mode: str, dead) -> list[str]:
+    """Plugins the STT/LLM/TTS chains of a session use; providers with an open circuit are left out"""
+    # silero (VAD) and openai (the only STT) are needed by every session; anthropic and elevenlabs
+    # each serve one model here, so any open breaker of theirs leaves the plugin out
+    down = {plugin_of(key) for key in dead}
+    names = ["silero", "openai", *(n for n in ("anthropic", "elevenlabs") if n not in down)]
+    if mode == "video":
+        names.append("tavus")
+    return names
+
+
+class StartupTimeline:
+    """Start/end offsets (ms from agent start) of each startup stage"""
+
+    def __init__(self, room_name: str):
+        self.room_name = room_name
+        self.t0 = time.perf_counter()
+        self.stages: dict[str, list[float | None]] = {}
+
+    def _now_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 1)
+
+    async def stage(self, name: str, aw):
+        """Await `aw` and record it as stage `name`"""
+        self.stages[name] = [self._now_ms(), None]
+        try:
+            return await aw
+        finally:
+            self.stages[name][1] = self._now_ms()
+
+    def task(self, name: str, aw) -> asyncio.Task:
+        """Run `aw` as a concurrent stage"""
+        return asyncio.create_task(self.stage(name, aw))
+
+    def mark(self, name: str) -> None:
+        now = self._now_ms()
+        self.stages[name] = [now, now]
+
+    @contextmanager
+    def span(self, name: str):
+        """Record a blocking (non-awaitable) step as stage `name`"""
+        self.stages[name] = [self._now_ms(), None]
+        try:
+            yield
+        finally:
+            self.stages[name][1] = self._now_ms()
+
+    def log(self) -> None:
+        ordered = sorted(self.stages.items(), key=lambda kv: kv[1][0])
+        total = max((end or start for start, end in self.stages.values()), default=0.0)
+        logger.info(f"🚀 Startup timeline for {self.room_name} ({total:.0f} ms):")
+        for name, (start, end) in ordered:
+            duration = f"{end - start:7.1f} ms" if end is not None else "   running"
+            logger.info(f"  {name:<20} {start:8.1f} -> {end if end is not None else '...':>8}  {duration}")
+        try:
+            with open(LATENCY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"room": self.room_name, "ts": time.time(), "kind": "startup",
+                                    "total_ms": total, "stages": self.stages, "plugins_ms": PLUGIN_LOAD_MS}) + "\n")
+        except Exception as e:
+            logger.warning(f"Could not write startup timeline: {e}")
+        if STARTUP_PROFILE:
+            write_agent_report(self.room_name, self.t0, self.stages, PLUGIN_LOAD_MS)
+
+
+def avatar_audio_output(room: rtc.Room, avatar) -> DataStreamAudioOutput:
+    """
+    Audio output towards the Tavus avatar participant. Setting it before session.start lets the
+    session start while the avatar is still joining; frames wait until the avatar is in the room.
+    """
+    tavus_avatar = importlib.import_module("livekit.plugins.tavus.avatar")
+    return DataStreamAudioOutput(
+        room=room,
+        destination_identity=avatar._avatar_participant_identity,
+        sample_rate=tavus_avatar.SAMPLE_RATE,
+    )
+
+
+async def wait_for_avatar_ready(room: rtc.Room, avatar_task: asyncio.Task | None, avatar) -> None:
+    """Readiness signal replacing the fixed sleeps: avatar started and its video track published"""
+    if avatar_task is not None:
+        await avatar_task
+    try:
+        await asyncio.wait_for(
+            utils.wait_for_track_publication(
+                room=room,
+                identity=avatar._avatar_participant_identity,
+                kind=rtc.TrackKind.KIND_VIDEO,
+            ),
+            timeout=AVATAR_READY_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Avatar video not published after {AVATAR_READY_TIMEOUT}s, continuing anyway")
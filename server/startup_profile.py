@@ -0,0 +1,191 @@
+"""
+Cold-start profiling for the agent scripts
+`python startup_profile.py [script]` imports the script and the plugins of its chains in fresh
+interpreters under -X importtime, writes the import time of every module to a JSON report and
+exits non-zero when the cold start got slower than the recorded budget.
+With STARTUP_PROFILE=1 a running agent also writes the startup profile of its session.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+STARTUP_PROFILE_DIR = os.getenv("STARTUP_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "startup_profile"))
+STARTUP_BUDGET_PATH = os.getenv("STARTUP_BUDGET_PATH", os.path.join(os.path.dirname(__file__), "startup_budget.json"))
+# Allowed slowdown over the recorded cold start before the check fails
+STARTUP_BUDGET_TOLERANCE = float(os.getenv("STARTUP_BUDGET_TOLERANCE", 0.2))
+STARTUP_PROFILE_RUNS = int(os.getenv("STARTUP_PROFILE_RUNS", 3))
+
+# "import time: <self us> | <cumulative us> | <indent><module>"
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+# Child process: import the script as a module, then load the plugins its chains use.
+# os._exit skips the agents' atexit handler, which SIGKILLs the process.
+_CHILD = """
+import os, json, time
+start = time.perf_counter()
+import {script}
+import_ms = (time.perf_counter() - start) * 1000
+from startup import PLUGIN_LOAD_MS, chain_plugins, load_plugin
+for name in chain_plugins({mode!r}, ()):
+    load_plugin(name)
+print(json.dumps({{"import_ms": import_ms, "plugins_ms": PLUGIN_LOAD_MS,
+                  "total_ms": (time.perf_counter() - start) * 1000}}), flush=True)
+os._exit(0)
+"""
+
+
+def _report_path(name: str) -> str:
+    os.makedirs(STARTUP_PROFILE_DIR, exist_ok=True)
+    return os.path.join(STARTUP_PROFILE_DIR, f"{name}.json")
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Per-module self/cumulative import time (ms) from -X importtime output, in import order"""
+    modules = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            modules.append({
+                "module": m.group(4),
+                "self_ms": round(int(m.group(1)) / 1000, 2),
+                "cumulative_ms": round(int(m.group(2)) / 1000, 2),
+                "depth": (len(m.group(3)) - 1) // 2,
+            })
+    return modules
+
+
+def _run_once(script: str, mode: str) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(script=script, mode=mode)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    process_ms = (time.perf_counter() - started) * 1000
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        tail = "\n".join(proc.stderr.splitlines()[-20:])
+        raise RuntimeError(f"Profiling {script} failed (exit {proc.returncode}):\n{tail}")
+    result = json.loads(lines[-1])
+    result["process_ms"] = process_ms
+    result["modules"] = parse_importtime(proc.stderr)
+    return result
+
+
+def profile(script: str, mode: str = "video", runs: int = STARTUP_PROFILE_RUNS) -> dict:
+    """Median cold start over `runs` fresh interpreters, with the module breakdown of the median run"""
+    results = sorted((_run_once(script, mode) for _ in range(max(runs, 1))), key=lambda r: r["total_ms"])
+    median = results[len(results) // 2]
+
+    packages: dict[str, float] = {}
+    for m in median["modules"]:
+        top = m["module"].split(".")[0]
+        packages[top] = packages.get(top, 0.0) + m["self_ms"]
+    return {
+        "script": script,
+        "mode": mode,
+        "ts": time.time(),
+        "runs": len(results),
+        "total_ms": round(median["total_ms"], 1),
+        "total_ms_runs": [round(r["total_ms"], 1) for r in results],
+        "import_ms": round(median["import_ms"], 1),
+        "plugins_ms": median["plugins_ms"],
+        "process_ms": round(statistics.median(r["process_ms"] for r in results), 1),
+        "packages_ms": dict(sorted(((k, round(v, 1)) for k, v in packages.items()), key=lambda kv: -kv[1])),
+        "modules": sorted(median["modules"], key=lambda m: -m["self_ms"]),
+    }
+
+
+def write_report(report: dict) -> str:
+    path = _report_path(report["script"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def load_budget(script: str) -> float | None:
+    """Cold start budget (ms) of `script`: STARTUP_BUDGET_MS, else the recorded baseline plus tolerance"""
+    if os.getenv("STARTUP_BUDGET_MS"):
+        return float(os.getenv("STARTUP_BUDGET_MS"))
+    try:
+        with open(STARTUP_BUDGET_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)[script]["total_ms"]
+    except (OSError, KeyError, ValueError):
+        return None
+    return round(baseline * (1 + STARTUP_BUDGET_TOLERANCE), 1)
+
+
+def record_budget(report: dict) -> None:
+    try:
+        with open(STARTUP_BUDGET_PATH, encoding="utf-8") as f:
+            budgets = json.load(f)
+    except (OSError, ValueError):
+        budgets = {}
+    budgets[report["script"]] = {"total_ms": report["total_ms"], "mode": report["mode"], "ts": report["ts"]}
+    with open(STARTUP_BUDGET_PATH, "w", encoding="utf-8") as f:
+        json.dump(budgets, f, indent=2)
+
+
+def write_agent_report(room_name: str, t0: float, stages: dict, plugins_ms: dict) -> None:
+    """Startup profile of a running agent: process start to entrypoint, plugin imports and stages"""
+    try:
+        import psutil
+
+        entrypoint_at = time.time() - (time.perf_counter() - t0)
+        report = {
+            "room": room_name,
+            "pid": os.getpid(),
+            "ts": time.time(),
+            "process_to_entrypoint_ms": round((entrypoint_at - psutil.Process().create_time()) * 1000, 1),
+            "plugins_ms": plugins_ms,
+            "stages": stages,
+            "modules_loaded": len(sys.modules),
+        }
+        path = _report_path(f"{room_name}_{os.getpid()}")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"⏱️ Startup profile written to {path}")
+    except Exception as e:
+        logger.warning(f"Could not write startup profile: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Cold start profile and regression budget of an agent script")
+    parser.add_argument("script", nargs="?", default="avatar_agent")
+    parser.add_argument("--mode", default="video", choices=("video", "audio"))
+    parser.add_argument("--runs", type=int, default=STARTUP_PROFILE_RUNS)
+    parser.add_argument("--update-budget", action="store_true", help="record this run as the new baseline")
+    args = parser.parse_args()
+
+    report = profile(args.script, args.mode, args.runs)
+    path = write_report(report)
+    logger.info(f"⏱️ {args.script}: cold start {report['total_ms']:.0f} ms "
+                f"(imports {report['import_ms']:.0f} ms, plugins {report['plugins_ms']}) -> {path}")
+    for package, ms in list(report["packages_ms"].items())[:10]:
+        logger.info(f"  {package:<24} {ms:8.1f} ms")
+
+    if args.update_budget:
+        record_budget(report)
+        logger.info(f"Recorded {report['total_ms']:.0f} ms as the {args.script} baseline in {STARTUP_BUDGET_PATH}")
+        sys.exit(0)
+    budget = load_budget(args.script)
+    if budget is None:
+        logger.warning("No cold start budget recorded yet, run with --update-budget")
+        sys.exit(0)
+    if report["total_ms"] > budget:
+        logger.error(f"❌ Cold start regression: {report['total_ms']:.0f} ms > budget {budget:.0f} ms")
+        sys.exit(1)
+    logger.info(f"✅ Within budget ({budget:.0f} ms)")
@@ -0,0 +1,127 @@
+"""
+Adaptive STT language for AVATAR_LANGUAGE_STT == "detect"
+Pins the STT chain to the detected language once detections are consistent, and goes back to
+detection when transcripts stop matching the pinned language.
+The openai plugin reports the configured language, not the detected one, so the signal is the script of
+the transcript: Arabic, or Latin. Latin script cannot tell French, German and English apart; it only locks
+to the session's own language when that is a Latin-script one, never to a guess.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+STT_LANGUAGE_LOCK = os.getenv("STT_LANGUAGE_LOCK", "0") == "1"
+STT_LOCK_AFTER = int(os.getenv("STT_LOCK_AFTER", 2))  # consecutive confident detections
+STT_UNLOCK_AFTER = int(os.getenv("STT_UNLOCK_AFTER", 2))  # consecutive mismatching transcripts
+STT_LOCK_CONFIDENCE = float(os.getenv("STT_LOCK_CONFIDENCE", 0.8))
+STT_LOCK_MIN_LETTERS = int(os.getenv("STT_LOCK_MIN_LETTERS", 6))
+
+_SCRIPTS = {
+    "ar": lambda c: "\u0600" <= c <= "\u06ff" or "\u0750" <= c <= "\u077f" or "\ufb50" <= c <= "\ufefc",
+    # ASCII letters plus Latin-1 and Latin Extended-A (é, ç, ü, ß, ...)
+    "latin": lambda c: c.isascii() or "\u00c0" <= c <= "\u017f",
+}
+# STT language for a Latin-script transcript, by session language (AVATAR_LANGUAGE)
+_LATIN_STT = {"fr": "fr", "du": "de", "en": "en"}
+
+
+def detect_language(text: str) -> tuple[str | None, float]:
+    """("ar" or "latin", confidence) from the share of letters in each script; (None, 0) on short text"""
+    counts = dict.fromkeys(_SCRIPTS, 0)
+    letters = 0
+    for c in text:
+        if not c.isalpha():
+            continue
+        letters += 1
+        for lang, in_script in _SCRIPTS.items():
+            if in_script(c):
+                counts[lang] += 1
+                break
+    if letters < STT_LOCK_MIN_LETTERS:
+        return None, 0.0
+    lang = max(counts, key=counts.get)
+    return lang, counts[lang] / letters
+
+
+def set_stt_language(stt_instances: list, language: str) -> None:
+    """Language of every openai STT instance of the chain; "" makes the plugin send none, i.e. detection"""
+    for instance in stt_instances:
+        try:
+            instance.update_options(language=language)
+        except Exception as e:
+            logger.warning(f"Could not set STT language on {instance.label}: {e}")
+
+
+class LanguageLock:
+    """Switches a set of openai STT instances between detection and a pinned language"""
+
+    def __init__(self, stt_instances: list, session_language: str | None):
+        self._stt = stt_instances
+        self.session_language = session_language  # AVATAR_LANGUAGE, names the Latin-script language
+        self.locked: str | None = None
+        self.pinned: str | None = None  # set from outside (control channel), no detection while set
+        self._candidate: str | None = None
+        self._streak = 0
+        self._misses = 0
+        self.locks = 0
+        self.unlocks = 0
+
+    def attach(self, session) -> None:
+        session.on("user_input_transcribed", self._on_transcribed)
+
+    def retarget(self, stt_instances: list) -> None:
+        """Steer another set of STT instances (hot failover), starting from the current lock or pin"""
+        self._stt = stt_instances
+        self._set_language(self.pinned or self.locked or "")
+
+    def _set_language(self, language: str) -> None:
+        set_stt_language(self._stt, language)
+
+    def pin(self, language: str | None) -> None:
+        """Fix the STT language (None: back to detection, the lock starts over)"""
+        self.pinned = language
+        self.locked, self._candidate, self._streak, self._misses = None, None, 0, 0
+        self._set_language(language or "")
+
+    def _stt_language(self, script: str) -> str | None:
+        """STT language a transcript's script stands for; None when the script does not name one"""
+        return "ar" if script == "ar" else _LATIN_STT.get(self.session_language)
+
+    def _on_transcribed(self, ev) -> None:
+        if not ev.is_final or self.pinned:
+            return
+        script, confidence = detect_language(ev.transcript)
+        if script is None:
+            return
+        lang = self._stt_language(script)
+        # a Latin-script transcript in a non-Latin session could be French, German or English: no lock on it
+        confident = lang is not None and confidence >= STT_LOCK_CONFIDENCE
+
+        if self.locked is None:
+            if confident and lang == self._candidate:
+                self._streak += 1
+            else:
+                self._candidate, self._streak = (lang, 1) if confident else (None, 0)
+            if self._streak >= STT_LOCK_AFTER:
+                self.locked = lang
+                self.locks += 1
+                self._misses = 0
+                self._set_language(lang)
+                logger.info(f"🔒 STT language locked to '{lang}' after {self._streak} detections")
+            return
+
+        if lang == self.locked and confident:
+            self._misses = 0
+            return
+        self._misses += 1
+        if self._misses >= STT_UNLOCK_AFTER:
+            logger.info(f"🔓 STT language '{self.locked}' unlocked, back to detection ({script} at {confidence:.2f})")
+            self.locked = None
+            self.unlocks += 1
+            self._candidate, self._streak = None, 0
+            self._set_language("")
+
+    def stats(self) -> dict:
+        return {"locked": self.locked, "pinned": self.pinned, "locks": self.locks, "unlocks": self.unlocks}
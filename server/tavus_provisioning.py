@@ -0,0 +1,183 @@
+"""
+Early Tavus avatar provisioning
+The token server creates the Tavus conversation for a room as soon as it decides to launch an
+agent; the agent then adopts the replica instead of provisioning it on its own critical path.
+The handoff is a small status file per room.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+
+import aiohttp
+import requests
+from livekit import api
+
+logger = logging.getLogger(__name__)
+
+TAVUS_EARLY_PROVISION = os.getenv("TAVUS_EARLY_PROVISION", "0") == "1"
+TAVUS_API_URL = os.getenv("TAVUS_API_URL", "https://tavusapi.com/v2")
+# Whole conversation create request of the token server
+TAVUS_PROVISION_TIMEOUT = float(os.getenv("TAVUS_PROVISION_TIMEOUT", 20))
+# How long the agent waits, on its startup path, for the provisioned replica before starting its own
+TAVUS_ADOPT_TIMEOUT = float(os.getenv("TAVUS_ADOPT_TIMEOUT", 8))
+# Same identity the tavus plugin uses, so the agent side is unchanged
+AVATAR_IDENTITY = "tavus-avatar-agent"
+_STATUS_DIR = os.path.join(os.path.dirname(__file__), "tavus_provisioning")
+
+
+def _status_path(room: str) -> str:
+    return os.path.join(_STATUS_DIR, f"{room}.json")
+
+
+def _abandoned_path(room: str) -> str:
+    # separate from the status file, which the provisioner may still overwrite
+    return os.path.join(_STATUS_DIR, f"{room}.abandoned")
+
+
+def write_status(room: str, status: str, conversation_id: str | None = None, error: str | None = None):
+    os.makedirs(_STATUS_DIR, exist_ok=True)
+    tmp = _status_path(room) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"status": status, "conversation_id": conversation_id, "error": error, "ts": time.time()}, f)
+    os.replace(tmp, _status_path(room))
+
+
+def read_status(room: str) -> dict | None:
+    try:
+        with open(_status_path(room), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def clear_status(room: str):
+    try:
+        os.remove(_status_path(room))
+    except FileNotFoundError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Token server side
+# ---------------------------------------------------------------------------
+async def provision_for_room(room: str):
+    """Create the Tavus conversation for `room`; result is written to the room's status file"""
+    start = time.perf_counter()
+    try:
+        os.remove(_abandoned_path(room))
+    except FileNotFoundError:
+        pass
+    try:
+        livekit_token = (
+            api.AccessToken(os.getenv("LIVEKIT_API_KEY"), os.getenv("LIVEKIT_API_SECRET"))
+            .with_kind("agent")
+            .with_identity(AVATAR_IDENTITY)
+            .with_name(AVATAR_IDENTITY)
+            .with_grants(api.VideoGrants(room_join=True, room=room))
+            .to_jwt()
+        )
+        payload = {
+            "replica_id": os.getenv("TAVUS_REPLICA_ID"),
+            "persona_id": os.getenv("TAVUS_PERSONA_ID"),
+            "conversation_name": f"lk_{room}",
+            "properties": {"livekit_ws_url": os.getenv("LIVEKIT_URL"), "livekit_room_token": livekit_token},
+        }
+        async with aiohttp.ClientSession() as http:
+            async with http.post(
+                f"{TAVUS_API_URL}/conversations",
+                headers={"x-api-key": os.getenv("TAVUS_API_KEY", ""), "Content-Type": "application/json"},
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=TAVUS_PROVISION_TIMEOUT),
+            ) as resp:
+                if not resp.ok:
+                    raise RuntimeError(f"Tavus returned {resp.status}: {await resp.text()}")
+                data = await resp.json()
+        write_status(room, "ready", conversation_id=data["conversation_id"])
+        logger.info("Tavus conversation %s provisioned for room %s in %.0f ms",
+                    data["conversation_id"], room, (time.perf_counter() - start) * 1000)
+        # The agent gave up waiting and started its own replica: this one must not join next to it
+        if os.path.exists(_abandoned_path(room)):
+            logger.info("Provisioned conversation for room %s was abandoned by its agent, ending it", room)
+            end_conversation_for_room(room)
+    except Exception as e:
+        logger.error(f"Early Tavus provisioning failed for room {room}: {e}")
+        write_status(room, "failed", error=str(e))
+
+
+def end_conversation_for_room(room: str):
+    """End a provisioned conversation (adopted or not) and drop the status file; non-blocking"""
+    info = read_status(room)
+    clear_status(room)
+    if not info or not info.get("conversation_id"):
+        return
+
+    def _end():
+        try:
+            requests.post(
+                f"{TAVUS_API_URL}/conversations/{info['conversation_id']}/end",
+                headers={"x-api-key": os.getenv("TAVUS_API_KEY", "")},
+                timeout=5,
+            )
+        except Exception as e:
+            logger.warning(f"Could not end Tavus conversation for room {room}: {e}")
+
+    threading.Thread(target=_end, daemon=True).start()
+
+
+# ---------------------------------------------------------------------------
+# Agent side
+# ---------------------------------------------------------------------------
+def _abandon(room: str):
+    """
+    End the provisioned conversation before the caller starts a replica under the same identity.
+    The marker covers a provisioning still in flight: the provisioner ends what it created once it sees it.
+    """
+    os.makedirs(_STATUS_DIR, exist_ok=True)
+    open(_abandoned_path(room), "w").close()
+    end_conversation_for_room(room)
+
+
+async def adopt_provisioned_avatar(ctx, avatar) -> bool:
+    """
+    Wait for the conversation provisioned by the token server and for its replica to join.
+    Returns False when nothing usable was provisioned, so the caller starts the avatar itself.
+    """
+    deadline = time.time() + TAVUS_ADOPT_TIMEOUT
+    info = read_status(ctx.room.name)
+    while (info is None or info["status"] == "pending") and time.time() < deadline:
+        await asyncio.sleep(0.1)
+        info = read_status(ctx.room.name)
+    if not info or info["status"] != "ready":
+        logger.warning(f"No pre-provisioned Tavus avatar for {ctx.room.name} ({info}), starting one")
+        _abandon(ctx.room.name)
+        return False
+
+    identity = avatar._avatar_participant_identity
+    try:
+        from livekit.agents import utils
+        await asyncio.wait_for(
+            utils.wait_for_participant(room=ctx.room, identity=identity),
+            timeout=max(0.1, deadline - time.time()),
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Pre-provisioned Tavus replica never joined {ctx.room.name}, starting one")
+        _abandon(ctx.room.name)
+        return False
+
+    # Mark the replica as publishing on behalf of this agent, as the plugin does in its token
+    try:
+        from livekit.agents.types import ATTRIBUTE_PUBLISH_ON_BEHALF
+        await ctx.api.room.update_participant(api.UpdateParticipantRequest(
+            room=ctx.room.name,
+            identity=identity,
+            attributes={ATTRIBUTE_PUBLISH_ON_BEHALF: ctx.room.local_participant.identity},
+        ))
+    except Exception as e:
+        logger.debug(f"Could not set publish-on-behalf on the avatar participant: {e}")
+
+    logger.info(f"✅ Adopted pre-provisioned Tavus conversation {info['conversation_id']}")
+    return True
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server modules are imported flat, as the agent and the token server do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,141 @@
+"""
+First-turn latency with warmed provider connections
+A local OpenAI-compatible server charges every new TCP connection a handshake delay, like DNS/TLS
+setup to the real API. With ProviderWarmup run first, the first turn's LLM TTFT and TTS TTFB must
+be within tolerance of the later turns' median, which reuse the pooled connection.
+The TTS side times the audio.speech request the openai TTS plugin sends, on the same shared client:
+the pinned plugin release does not run its ChunkedStream under livekit-agents 1.1.6.
+"""
+
+import json
+import time
+import asyncio
+import statistics
+
+import pytest
+
+from livekit.agents import llm as livekitllm
+from livekit.plugins import openai
+
+import provider_warmup
+from provider_warmup import ProviderWarmup, build_openai_client
+
+CONNECT_S = 0.3  # new connection to the provider
+PROCESSING_S = 0.05  # provider time to first token / byte
+TOLERANCE_S = 0.1
+TURNS = 5
+
+
+class FakeOpenAI:
+    """Just enough of the OpenAI HTTP API for models.retrieve, streamed chat completions and audio.speech"""
+
+    def __init__(self):
+        self._server: asyncio.AbstractServer | None = None
+        self.connections = 0
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/v1"
+
+    async def aclose(self) -> None:
+        self._server.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(CONNECT_S)
+        try:
+            while request_line := await reader.readline():
+                _, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get("content-length", 0)))
+                await asyncio.sleep(PROCESSING_S)
+                if path.endswith("/chat/completions"):
+                    await self._chat(writer)
+                elif path.endswith("/audio/speech"):
+                    self._respond(writer, "audio/pcm", b"\x00\x00" * 2400)
+                else:
+                    body = {"id": "gpt-4o", "object": "model", "created": 0, "owned_by": "openai"}
+                    self._respond(writer, "application/json", json.dumps(body).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, content_type: str, body: bytes) -> None:
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode())
+        writer.write(body)
+
+    @staticmethod
+    async def _chat(writer: asyncio.StreamWriter) -> None:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        events = [
+            {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+             "choices": [{"index": 0, "delta": {"role": "assistant", "content": word} if word else {},
+                          "finish_reason": None if word else "stop"}]}
+            for word in ("Hello", " there", "!", None)
+        ]
+        for event in [*(f"data: {json.dumps(e)}\n\n".encode() for e in events), b"data: [DONE]\n\n"]:
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+
+async def _run_turns(warm: bool) -> tuple[list[float], list[float], int]:
+    """LLM TTFT and TTS TTFB (s) of TURNS turns on one shared client, plus the connections opened"""
+    server = FakeOpenAI()
+    base_url = await server.start()
+    client = build_openai_client()
+    client.base_url = base_url
+    llm = openai.LLM(model="gpt-4o-mini", client=client)
+    ttft, ttfb = [], []
+    llm.on("metrics_collected", lambda m: ttft.append(m.ttft))
+    try:
+        if warm:
+            await ProviderWarmup(openai_client=client).warm_once()
+        for _ in range(TURNS):
+            chat_ctx = livekitllm.ChatContext()
+            chat_ctx.add_message(role="user", content="Hi")
+            async with llm.chat(chat_ctx=chat_ctx) as stream:
+                text = "".join([chunk.delta.content async for chunk in stream if chunk.delta and chunk.delta.content])
+            start, first_byte = time.perf_counter(), None
+            async with client.audio.speech.with_streaming_response.create(
+                input=text, model="gpt-4o-mini-tts", voice="ash", response_format="pcm"
+            ) as response:
+                # read to the end, as the plugin does, so the connection goes back to the pool
+                async for _ in response.iter_bytes():
+                    first_byte = first_byte or time.perf_counter()
+            ttfb.append(first_byte - start)
+    finally:
+        await client.close()
+        await server.aclose()
+    return ttft, ttfb, server.connections
+
+
+def _first_turn_excess(samples: list[float]) -> float:
+    return samples[0] - statistics.median(samples[1:])
+
+
+@pytest.fixture
+def openai_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    # keepalive pings are not part of this check
+    monkeypatch.setattr(provider_warmup, "WARMUP_KEEPALIVE_HTTPX", 3600)
+
+
+def test_first_turn_matches_later_turns_when_warmed(openai_env):
+    ttft, ttfb, connections = asyncio.run(_run_turns(warm=True))
+    assert len(ttft) == len(ttfb) == TURNS
+    assert connections == 1
+    assert _first_turn_excess(ttft) < TOLERANCE_S, ttft
+    assert _first_turn_excess(ttfb) < TOLERANCE_S, ttfb
+
+
+def test_cold_first_turn_pays_the_connection(openai_env):
+    """Guards the check above: without the warmup the first turn is measurably slower"""
+    ttft, _, _ = asyncio.run(_run_turns(warm=False))
+    assert _first_turn_excess(ttft) > CONNECT_S - TOLERANCE_S, ttft
@@ -0,0 +1,108 @@
+"""
+Session components after a hot failover to the realtime stack
+rebind_after_swap must move context folding, the STT language lock and the pronunciation hook to
+the new agent and session, and close speculation and the chain routers of the STT/LLM/TTS stack.
+"""
+
+import asyncio
+import types
+
+import pytest
+
+from livekit.agents import AgentSession, ConversationItemAddedEvent, UserInputTranscribedEvent
+from livekit.agents import llm as livekitllm, tts as livekittts
+
+import context_manager
+from AgentInstructions import DebugAvatarAgent
+from context_manager import SUMMARY_ID, RollingContext
+from provider_routing import attach_routers
+from realtime_stack import RealtimeTranscription, build_realtime_model, rebind_after_swap
+from speculative_llm import SpeculativeGenerator
+from stand_in_providers import StandInLLM, StandInSTT, StandInTTS
+from stt_language import STT_LOCK_AFTER, LanguageLock
+
+
+class SummaryClient:
+    """The chat.completions.create call RollingContext makes, answering with a fixed summary"""
+
+    def __init__(self):
+        self.requests = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.requests += 1
+        message = types.SimpleNamespace(content="The child practiced the word apple.")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("AVATAR_LANGUAGE", "ar")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(context_manager, "CONTEXT_KEEP_TURNS", 2)
+    monkeypatch.setattr(context_manager, "CONTEXT_FOLD_BATCH", 1)
+
+
+async def _swap():
+    llm = livekitllm.FallbackAdapter([StandInLLM([]), StandInLLM([])])
+    tts = livekittts.FallbackAdapter([StandInTTS(), StandInTTS()])
+    old_session = AgentSession(llm=llm, tts=tts)
+    old_agent = DebugAvatarAgent(system_type="elevenlabs")
+
+    client = SummaryClient()
+    rolling_context = RollingContext(old_agent, client)
+    rolling_context.attach(old_session)
+    speculator = SpeculativeGenerator(llm)
+    speculator.attach(old_session, old_agent)
+    language_lock = LanguageLock([StandInSTT([])], "ar")
+    language_lock.attach(old_session)
+    routers = attach_routers(llm, tts)
+    for router in routers:
+        router.start()
+
+    new_session = AgentSession(llm=build_realtime_model())
+    new_agent = DebugAvatarAgent(system_type="openai_realtime")
+    published = []
+    stt_instances = await rebind_after_swap(
+        new_session, new_agent, rolling_context=rolling_context, speculator=speculator,
+        language_lock=language_lock, routers=routers, on_pronunciation_result=published.append,
+    )
+    return types.SimpleNamespace(
+        old_agent=old_agent, new_session=new_session, new_agent=new_agent, client=client,
+        rolling_context=rolling_context, speculator=speculator, language_lock=language_lock,
+        routers=routers, published=published, stt_instances=stt_instances,
+    )
+
+
+def test_components_follow_the_realtime_session(env):
+    async def run():
+        swap = await _swap()
+        session, agent = swap.new_session, swap.new_agent
+
+        # Context folding works on the new agent, fed by the new session
+        for turn in range(4):
+            ctx = agent.chat_ctx.copy()
+            ctx.add_message(role="user", content=f"question {turn}")
+            reply = ctx.add_message(role="assistant", content=f"answer {turn}")
+            await agent.update_chat_ctx(ctx)
+            session.emit("conversation_item_added", ConversationItemAddedEvent(item=reply))
+            await asyncio.sleep(0.01)
+        assert swap.client.requests >= 1
+        assert any(i.id == SUMMARY_ID for i in agent.chat_ctx.items)
+
+        # The language lock steers the realtime model's input transcription
+        assert isinstance(swap.stt_instances[0], RealtimeTranscription)
+        for _ in range(STT_LOCK_AFTER):
+            session.emit("user_input_transcribed", UserInputTranscribedEvent(transcript="مرحبا كيف حالك اليوم", is_final=True))
+        assert swap.language_lock.locked == "ar"
+        assert session.llm._opts.input_audio_transcription.language == "ar"
+
+        # Pronunciation results of the new agent still reach the client
+        agent.on_pronunciation_result("result")
+        assert swap.published == ["result"]
+
+        # Nothing of the STT/LLM/TTS stack keeps running
+        assert swap.speculator._agent is None and swap.old_agent.speculator is None and agent.speculator is None
+        assert all(router._probe_task is None for router in swap.routers)
+
+    asyncio.run(run())
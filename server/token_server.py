@@ -3,7 +3,7 @@ Token server for Tavus Avatar Flutter clients
 Generates JWT tokens for connecting to LiveKit rooms
 """
 
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Body
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from livekit import api
@@ -18,11 +18,18 @@ import sys
 import shutil
 import sqlite3
 import threading
+import asyncio
 import signal
 import time
 from dataclasses import dataclass
 from livekit.protocol import room as room_proto
 import secrets
+from provider_health import open_circuits
+from tavus_provisioning import TAVUS_EARLY_PROVISION, end_conversation_for_room, provision_for_room, write_status
+from session_mode import MODES, VIDEO_SESSION_CAPACITY, VIDEO_UPGRADE_INTERVAL, choose_mode, send_upgrade
+from agent_telemetry import AGENT_SAMPLE_INTERVAL, AgentTelemetry, agent_limits, apply_limits
+from session_resume import clear_presence, read_presence, resumable
+from agent_control import remove_socket, send_command
 
 
 
@@ -37,8 +44,14 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # --- startup ---
     _init_counter_db()
-    # (add other startup work here if needed)
+    upgrade_task = asyncio.create_task(_video_upgrade_loop()) if VIDEO_SESSION_CAPACITY else None
+    telemetry_task = asyncio.create_task(_telemetry_loop())
+    if any(agent_limits().values()):
+        logger.info(f"Per-agent limits: {agent_limits()}")
     yield
+    if upgrade_task:
+        upgrade_task.cancel()
+    telemetry_task.cancel()
     # --- shutdown ---
     # (add any cleanup if needed; none required for SQLite counter)
 
@@ -82,14 +95,91 @@ class AgentProc:
     popen: subprocess.Popen
     popup: bool  # launched in a visible terminal?
     started_ts: float
+    mode: str = "video"  # "video" (Tavus avatar) or "audio"
+    upgradable: bool = False  # audio-only because of capacity, not by request
+    telemetry: AgentTelemetry | None = None
+    language: str | None = None
+    language_stt: str | None = None
+    resumes: int = 0  # /token requests served by this agent after the first
 
 # Registry of active agents by room
 _AGENT_REGISTRY: dict[str, AgentProc] = {}
 _AGENT_LOCK = threading.Lock()
+# Rooms whose new agent is being started and not registered yet
+_STARTING_ROOMS: set[str] = set()
 
-def _register_agent(room: str, identity: str | None, popen: subprocess.Popen, popup: bool):
+def _register_agent(room: str, identity: str | None, popen: subprocess.Popen, popup: bool,
+                    mode: str = "video", upgradable: bool = False, language: str | None = None,
+                    language_stt: str | None = None):
     with _AGENT_LOCK:
-        _AGENT_REGISTRY[room] = AgentProc(room=room, identity=identity, popen=popen, popup=popup, started_ts=time.time())
+        _AGENT_REGISTRY[room] = AgentProc(room=room, identity=identity, popen=popen, popup=popup, started_ts=time.time(),
+                                          mode=mode, upgradable=upgradable, telemetry=AgentTelemetry(popen.pid),
+                                          language=language, language_stt=language_stt)
+
+def _video_sessions() -> int:
+    with _AGENT_LOCK:
+        return sum(1 for ap in _AGENT_REGISTRY.values() if ap.mode == "video")
+
+async def _video_upgrade_loop():
+    """Move audio-only sessions (oldest first) back to video as Tavus capacity frees up"""
+    while True:
+        await asyncio.sleep(VIDEO_UPGRADE_INTERVAL)
+        try:
+            if "tavus" in open_circuits():
+                continue
+            with _AGENT_LOCK:
+                waiting = sorted((ap for ap in _AGENT_REGISTRY.values() if ap.mode == "audio" and ap.upgradable),
+                                 key=lambda ap: ap.started_ts)
+            for ap in waiting:
+                if _video_sessions() >= VIDEO_SESSION_CAPACITY:
+                    break
+                if await send_upgrade(ap.room):
+                    ap.mode, ap.upgradable = "video", False
+                    logger.info("Upgraded room %s to video", ap.room)
+        except Exception as e:
+            logger.error(f"Video upgrade check failed: {e}")
+
+def _sample_agents(agents: list[AgentProc]):
+    for ap in agents:
+        if ap.telemetry:
+            ap.telemetry.sample()
+
+def _reap_exited_agents():
+    """Free the slots of agents that ended on their own (user left, idle, failsafe)"""
+    # All under the lock (file operations only, the Tavus call runs on its own thread): a /token starting
+    # a new agent for the same room must not have its conversation, presence file or socket removed
+    with _AGENT_LOCK:
+        exited = [ap for ap in _AGENT_REGISTRY.values() if ap.popen.poll() is not None]
+        for ap in exited:
+            del _AGENT_REGISTRY[ap.room]
+            logger.info("Agent for room %s exited (code %s), slot freed", ap.room, ap.popen.returncode)
+            if ap.room not in _STARTING_ROOMS:
+                clear_presence(ap.room)
+                remove_socket(ap.room)
+                if TAVUS_EARLY_PROVISION:
+                    end_conversation_for_room(ap.room)
+            if not sys.platform.startswith("win"):
+                # job processes left behind in the agent's process group
+                try:
+                    os.killpg(ap.popen.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+async def _telemetry_loop():
+    """
+    CPU, RSS, FDs and threads of every agent's process tree, kept as a short time series per agent;
+    agents that exited are dropped from the registry on the way
+    """
+    while True:
+        await asyncio.sleep(AGENT_SAMPLE_INTERVAL)
+        try:
+            # psutil reads /proc for every process of every tree, keep it off the event loop
+            await asyncio.to_thread(_reap_exited_agents)
+            with _AGENT_LOCK:
+                agents = list(_AGENT_REGISTRY.values())
+            await asyncio.to_thread(_sample_agents, agents)
+        except Exception as e:
+            logger.error(f"Agent telemetry sampling failed: {e}")
 
 def _pop_agent(room: str) -> AgentProc | None:
     with _AGENT_LOCK:
@@ -108,6 +198,19 @@ def _collect_tree(pid: int) -> list[psutil.Process]:
     procs.append(parent)
     return procs
 
+def _resumable_agent(room: str, identity: str, requested_mode: str) -> AgentProc | None:
+    """The room's live agent, when the same user asks again for the same session (reconnect after a network blip)"""
+    ap = _get_agent(room)
+    if ap is None or ap.popen.poll() is not None:
+        return None
+    if ap.identity != identity:
+        return None
+    if requested_mode not in ("auto", ap.mode):
+        return None
+    if not resumable(room, {p.pid for p in _collect_tree(ap.popen.pid)}):
+        return None
+    return ap
+
 def _terminate_tree_posix(pid: int, timeout: float):
     # Send SIGTERM to process group if available
     try:
@@ -164,6 +267,10 @@ def stop_agent(room: str, graceful_timeout: float = 5.0) -> bool:
     Attempt to stop the agent associated with `room`.
     Returns True if process was found (and termination attempted), False otherwise.
     """
+    if TAVUS_EARLY_PROVISION:
+        end_conversation_for_room(room)
+    clear_presence(room)
+    remove_socket(room)
     info = _pop_agent(room)
     if not info:
         return False
@@ -184,6 +291,21 @@ def stop_all_agents():
 
 
 
+async def _agent_command(room: str, cmd: str, **fields) -> dict | None:
+    """Control channel command to the room's agent; None when it is not reachable"""
+    try:
+        return await send_command(room, cmd, **fields)
+    except (OSError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+        logger.warning("Agent of room %s did not take '%s': %r", room, cmd, e)
+        return None
+
+async def _set_agent_language(ap: AgentProc, language: str, language_stt: str) -> bool:
+    reply = await _agent_command(ap.room, "set_language", language=language, language_stt=language_stt)
+    if not reply or not reply.get("ok"):
+        return False
+    ap.language, ap.language_stt = language, language_stt
+    return True
+
 def require_admin_key(x_api_key: str = Header(None)):
     if not ADMIN_API_KEY:
         raise HTTPException(status_code=500, detail="Server admin key not configured.")
@@ -195,7 +317,8 @@ async def create_token(
     identity_id: int = None,
     room_id: int = None,
     language: str = "ar",
-    language_stt: str = None
+    language_stt: str = None,
+    mode: str = "auto"
 ):
     """
     Generate a token for connecting to LiveKit room with Tavus avatar
@@ -203,6 +326,7 @@ async def create_token(
     Args:
         identity: User identifier (optional)
         room: Room name to join (optional)
+        mode: "video", "audio" (no Tavus avatar) or "auto" (audio-only when video capacity is used up)
     
     Returns:
         JSON with accessToken and connection details
@@ -240,6 +364,22 @@ async def create_token(
             detail="LiveKit credentials not configured. Check .env file."
         )
     
+    if mode not in MODES:
+        warnings.append(f"Invalid mode={mode!r}; falling back to auto.")
+        requested_mode = "auto"
+    else:
+        requested_mode = mode
+    language_stt = language_stt or language
+    resumed = _resumable_agent(room, identity, requested_mode)
+    if resumed and (resumed.language, resumed.language_stt) != (language, language_stt):
+        # Same session in another language: switched live instead of a new agent
+        if not await _set_agent_language(resumed, language, language_stt):
+            resumed = None
+    if resumed:
+        mode = resumed.mode
+    else:
+        mode = choose_mode(requested_mode, _video_sessions(), "tavus" in open_circuits())
+
     if len(_AGENT_REGISTRY) >= MAX_ACTIVE_AGENTS and room not in _AGENT_REGISTRY:
         logger.warning("Max active agents reached, cannot start new agent.")
         raise HTTPException(
@@ -270,7 +410,7 @@ async def create_token(
         token.with_metadata(
             json.dumps({
                 "client": "flutter",
-                "avatar_enabled": True
+                "avatar_enabled": mode == "video"
             })
         )
         
@@ -279,14 +419,21 @@ async def create_token(
         
         logger.info(f"Token generated for {identity} in room {room}")
         
-        # Start new agent for this room
-        await start_new_agent(room, identity, language, language_stt)
+        if resumed:
+            # Same user back within the agent's grace window: it keeps its session, only the JWT is new
+            resumed.resumes += 1
+            logger.info("Resuming live agent for %s in room %s (pid=%s)", identity, room, resumed.popen.pid)
+        else:
+            # Start new agent for this room
+            await start_new_agent(room, identity, language, language_stt, mode, upgradable=requested_mode == "auto")
 
         response = {
             "accessToken": jwt_token,
             "url": LIVEKIT_URL,
             "room": room,
             "identity": identity,
+            "mode": mode,
+            "resumed": resumed is not None,
             "expiresIn": 86400  # 24 hours in seconds
         }
         
@@ -324,17 +471,32 @@ async def root():
             "/token": "Get access token for LiveKit room",
             "/health": "Health check",
             "/rooms": "List active rooms (if enabled)",
+            "/agents/{room}/health": "State of the room's running agent",
+            "/agents/{room}/language": "Switch a running agent's language (POST)",
+            "/agents/{room}/instructions": "Replace a running agent's instructions (POST)",
+            "/agents/{room}/stop": "Stop a running agent gracefully (POST)",
         },
         "usage": "GET /token?identity_id=int&room_id=int"
     }
 
 @app.get("/_debug/agents", dependencies=[Depends(require_admin_key)])
-async def _debug_agents():
+async def _debug_agents(samples: bool = True):
     with _AGENT_LOCK:
-        data = {r: {"pid": ap.popen.pid, "identity": ap.identity, "popup": ap.popup, "started": ap.started_ts}
+        data = {r: {"pid": ap.popen.pid, "identity": ap.identity, "popup": ap.popup, "started": ap.started_ts,
+                    "mode": ap.mode, "resumes": ap.resumes, "presence": read_presence(r), "limits": agent_limits(),
+                    "telemetry": ap.telemetry.snapshot() if ap.telemetry else None}
                 for r, ap in _AGENT_REGISTRY.items()}
+    if not samples:
+        for info in data.values():
+            if info["telemetry"]:
+                info["telemetry"].pop("samples")
     return data
 
+@app.get("/_debug/providers", dependencies=[Depends(require_admin_key)])
+async def _debug_providers():
+    """Host-wide provider circuit breakers currently open"""
+    return open_circuits()
+
 @app.post("/_debug/stop/{room}", dependencies=[Depends(require_admin_key)])
 async def _debug_stop(room: str, all: bool = False):
     if not all:
@@ -344,6 +506,47 @@ async def _debug_stop(room: str, all: bool = False):
         stop_all_agents()
         return {"message": "All agents stopped"}
 
+# --- Running agents, over their local control channel (no respawn) ---
+def _require_agent(room: str) -> AgentProc:
+    ap = _get_agent(room)
+    if ap is None:
+        raise HTTPException(status_code=404, detail="No agent running for this room")
+    return ap
+
+async def _control(room: str, cmd: str, **fields) -> dict:
+    reply = await _agent_command(room, cmd, **fields)
+    if reply is None:
+        raise HTTPException(status_code=502, detail="Agent not reachable on its control channel")
+    if not reply.get("ok"):
+        raise HTTPException(status_code=400, detail=reply.get("error"))
+    return reply
+
+@app.get("/agents/{room}/health", dependencies=[Depends(require_admin_key)])
+async def agent_health(room: str):
+    _require_agent(room)
+    return await _control(room, "health")
+
+@app.post("/agents/{room}/language", dependencies=[Depends(require_admin_key)])
+async def agent_language(room: str, language: str, language_stt: str = None):
+    ap = _require_agent(room)
+    reply = await _control(room, "set_language", language=language, language_stt=language_stt or language)
+    ap.language, ap.language_stt = reply["language"], reply["language_stt"]
+    return {"room": room, "language": ap.language, "language_stt": ap.language_stt}
+
+@app.post("/agents/{room}/instructions", dependencies=[Depends(require_admin_key)])
+async def agent_instructions(room: str, instructions: str = Body(..., embed=True)):
+    _require_agent(room)
+    await _control(room, "set_instructions", instructions=instructions)
+    return {"room": room, "instructions": len(instructions)}
+
+@app.post("/agents/{room}/stop", dependencies=[Depends(require_admin_key)])
+async def agent_stop(room: str):
+    """The agent ends its session as if the user left (slot freed once it exited); killed when it does not answer"""
+    _require_agent(room)
+    if await _agent_command(room, "stop") is None:
+        return {"room": room, "stopped": stop_agent(room), "graceful": False}
+    return {"room": room, "stopped": True, "graceful": True}
+
 
 @app.get("/_debug/logs/server", dependencies=[Depends(require_admin_key)])
 async def _debug_logs(lines: int = 100):
@@ -482,14 +685,36 @@ def next_counter_id() -> int:
         conn.close()
     return int(val)
 
-async def start_new_agent(room_name: str, identity: str, language: str, language_stt: str):
+_PROVISION_TASKS: set = set()
+
+async def start_new_agent(room_name: str, identity: str, language: str, language_stt: str,
+                          mode: str = "video", upgradable: bool = False):
     """Start a new Avatar agent for a specific room in a new terminal window"""
-    
+    # Reserved until registered: the reaper then leaves the room's conversation, presence and socket alone
+    with _AGENT_LOCK:
+        _STARTING_ROOMS.add(room_name)
+    try:
+        await _spawn_agent(room_name, identity, language, language_stt, mode, upgradable)
+    finally:
+        with _AGENT_LOCK:
+            _STARTING_ROOMS.discard(room_name)
+
+async def _spawn_agent(room_name: str, identity: str, language: str, language_stt: str,
+                       mode: str, upgradable: bool):
     # Kill existing agent if any for this specific room
     stop_agent(room_name)
     agent_script = os.path.join(os.path.dirname(__file__), "avatar_agent.py")
     python_exe = sys.executable  # assumes we're already in the desired environment
-    env = {**os.environ, "EXPECTED_USER_IDENTITY": identity, "AVATAR_LANGUAGE": language, "AVATAR_LANGUAGE_STT": language_stt or language}
+    env = {**os.environ, "EXPECTED_USER_IDENTITY": identity, "AVATAR_LANGUAGE": language, "AVATAR_LANGUAGE_STT": language_stt or language,
+           "AVATAR_MODE": mode}
+
+    # Create the Tavus conversation now so it overlaps with the agent's process start and room join
+    if TAVUS_EARLY_PROVISION and mode == "video" and "tavus" not in open_circuits():
+        write_status(room_name, "pending")
+        task = asyncio.create_task(provision_for_room(room_name))
+        _PROVISION_TASKS.add(task)
+        task.add_done_callback(_PROVISION_TASKS.discard)
+        env["TAVUS_PREPROVISIONED"] = "1"
 
     # Local Windows-specific command to start new agent only for testing
     if sys.platform.startswith("win"):
@@ -501,7 +726,8 @@ async def start_new_agent(room_name: str, identity: str, language: str, language
             creationflags=subprocess.CREATE_NEW_CONSOLE,
             env = env
         )
-        _register_agent(room_name, identity, proc, popup=True)
+        _register_agent(room_name, identity, proc, popup=True, mode=mode, upgradable=upgradable,
+                        language=language, language_stt=language_stt)
         
     
         logger.info("Started new Avatar agent for room %s in Windows PowerShell terminal (local testing).", room_name)
@@ -535,15 +761,16 @@ async def start_new_agent(room_name: str, identity: str, language: str, language
         else:
             # No terminal, headless mode
             full_cmd = agent_cmd
-            preexec = os.setsid
+            preexec = apply_limits
         proc = subprocess.Popen(full_cmd, stdout=log_file, stderr=subprocess.STDOUT, preexec_fn=preexec, env=env)
     else:
-        # Headless/background: just run the agent, logging to server.log.
-        proc = subprocess.Popen(agent_cmd, stdout=log_file, stderr=subprocess.STDOUT, preexec_fn=os.setsid, env=env)
+        # Headless/background: just run the agent, logging to server.log; own process group and per-agent rlimits
+        proc = subprocess.Popen(agent_cmd, stdout=log_file, stderr=subprocess.STDOUT, preexec_fn=apply_limits, env=env)
 
     log_file.close()
 
-    _register_agent(room_name, identity, proc, popup=popup)
+    _register_agent(room_name, identity, proc, popup=popup, mode=mode, upgradable=upgradable,
+                    language=language, language_stt=language_stt)
     logger.info("Started new Avatar agent for room %s (Linux/POSIX). Output -> %s", room_name, log_path)
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+"""
+Per-turn latency breakdown for the avatar agent
+Timestamps every turn (voice and data-channel) and writes them to a JSONL sink
+"""
+
+import os
+import math
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, asdict
+
+logger = logging.getLogger(__name__)
+
+LATENCY_LOG_PATH = os.getenv("LATENCY_LOG_PATH", os.path.join(os.path.dirname(__file__), "latency.jsonl"))
+
+# (name, start mark, end mark) - a stage is only reported when both marks are present
+STAGES = [
+    ("stt", "vad_eos", "final_transcript"),
+    ("llm", "turn_origin", "llm_first_token"),
+    ("tts", "llm_first_token", "tts_first_byte"),
+    ("avatar", "tts_first_byte", "playout_start"),
+    ("playout", "playout_start", "playout_end"),
+    ("first_audio", "turn_origin", "playout_start"),
+    ("total", "turn_origin", "playout_end"),
+]
+
+
+@dataclass
+class TurnTimeline:
+    turn_id: int
+    source: str  # "voice", "text" or "greeting"
+    speech_id: str | None = None
+    vad_eos: float | None = None
+    final_transcript: float | None = None
+    text_received: float | None = None
+    llm_first_token: float | None = None
+    tts_first_byte: float | None = None
+    playout_start: float | None = None
+    playout_end: float | None = None
+    llm_label: str | None = None
+    tts_label: str | None = None
+    interrupted: bool = False
+    speculated: bool = False  # reply generated from an interim transcript
+
+    @property
+    def turn_origin(self) -> float | None:
+        """Moment the user finished their turn (end of speech, transcript or data packet)"""
+        for ts in (self.vad_eos, self.final_transcript, self.text_received):
+            if ts is not None:
+                return ts
+        return None
+
+    def stage_ms(self) -> dict[str, float]:
+        stages = {}
+        for name, start, end in STAGES:
+            t0, t1 = getattr(self, start), getattr(self, end)
+            if t0 is not None and t1 is not None and t1 >= t0:
+                stages[name] = round((t1 - t0) * 1000, 1)
+        return stages
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile, None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class TurnLatencyTracker:
+    """Collects AgentSession events into one TurnTimeline per speech handle"""
+
+    def __init__(self, room_name: str, sink_path: str = LATENCY_LOG_PATH):
+        self.room_name = room_name
+        self.sink_path = sink_path
+        self._lock = threading.Lock()
+        self._next_turn_id = 1
+        self._pending: TurnTimeline | None = None  # user turn waiting for its speech handle
+        self._turns: dict[str, TurnTimeline] = {}  # speech_id -> open turn
+        self._completed: list[TurnTimeline] = []
+        self._closed = False
+        self._session = None
+        self._extra_summaries: dict = {}  # name -> callable returning a dict for the summary
+
+    # ------------------------------------------------------------------
+    # Wiring
+    # ------------------------------------------------------------------
+    def attach(self, session) -> None:
+        """Subscribe to the AgentSession events that carry turn timing"""
+        self._session = session
+        session.on("user_state_changed", self.on_user_state_changed)
+        session.on("user_input_transcribed", self.on_user_input_transcribed)
+        session.on("speech_created", self.on_speech_created)
+        session.on("metrics_collected", self.on_metrics_collected)
+        session.on("agent_state_changed", self.on_agent_state_changed)
+
+    def register_summary(self, name: str, fn) -> None:
+        """Add another component's counters (e.g. LLM hedging) to the exit summary"""
+        self._extra_summaries[name] = fn
+
+    def _new_turn(self, source: str) -> TurnTimeline:
+        turn = TurnTimeline(turn_id=self._next_turn_id, source=source)
+        self._next_turn_id += 1
+        return turn
+
+    # ------------------------------------------------------------------
+    # Event handlers
+    # ------------------------------------------------------------------
+    def on_user_state_changed(self, ev) -> None:
+        # speaking -> listening is the VAD end-of-speech
+        if ev.old_state == "speaking" and ev.new_state == "listening":
+            with self._lock:
+                if self._pending is None or self._pending.source != "voice":
+                    self._pending = self._new_turn("voice")
+                self._pending.vad_eos = ev.created_at
+
+    def on_user_input_transcribed(self, ev) -> None:
+        if not ev.is_final:
+            return
+        with self._lock:
+            if self._pending is None or self._pending.source != "voice":
+                self._pending = self._new_turn("voice")
+            self._pending.final_transcript = ev.created_at
+
+    def begin_text_turn(self) -> None:
+        """Mark the arrival of a data-channel user_message before generate_reply is called"""
+        with self._lock:
+            self._pending = self._new_turn("text")
+            self._pending.text_received = time.time()
+
+    def begin_greeting(self) -> None:
+        with self._lock:
+            self._pending = self._new_turn("greeting")
+            self._pending.text_received = time.time()
+
+    def on_speech_created(self, ev) -> None:
+        handle = ev.speech_handle
+        with self._lock:
+            turn = self._pending or self._new_turn("voice")
+            self._pending = None
+            turn.speech_id = handle.id
+            self._turns[handle.id] = turn
+        try:
+            handle.add_done_callback(self._on_playout_done)
+        except Exception as e:
+            logger.debug(f"Could not attach latency callback to speech handle: {e}")
+
+    def on_metrics_collected(self, ev) -> None:
+        m = ev.metrics
+        speech_id = getattr(m, "speech_id", None)
+        with self._lock:
+            turn = self._turns.get(speech_id) if speech_id else None
+            if turn is None:
+                return
+            if m.type == "llm_metrics" and turn.llm_first_token is None and m.ttft >= 0:
+                # metrics timestamp is taken when the request completes
+                turn.llm_first_token = m.timestamp - m.duration + m.ttft
+                turn.llm_label = m.label
+            elif m.type == "tts_metrics" and turn.tts_first_byte is None and m.ttfb >= 0:
+                turn.tts_first_byte = m.timestamp - m.duration + m.ttfb
+                turn.tts_label = m.label
+
+    def mark_speculated(self, speech_id: str, first_token: float) -> None:
+        """First token of a reply that was committed from a speculative LLM request"""
+        with self._lock:
+            turn = self._turns.get(speech_id)
+            if turn is not None:
+                turn.speculated = True
+                turn.llm_first_token = first_token
+                turn.llm_label = "speculative"
+
+    def on_agent_state_changed(self, ev) -> None:
+        # "speaking" means the first audio frame was forwarded to the Tavus avatar
+        if ev.new_state != "speaking":
+            return
+        speech = getattr(self._session, "current_speech", None)
+        if speech is None:
+            return
+        with self._lock:
+            turn = self._turns.get(speech.id)
+            if turn is not None and turn.playout_start is None:
+                turn.playout_start = ev.created_at
+
+    def _on_playout_done(self, handle) -> None:
+        with self._lock:
+            turn = self._turns.pop(handle.id, None)
+            if turn is None:
+                return
+            turn.playout_end = time.time()
+            turn.interrupted = handle.interrupted
+            self._completed.append(turn)
+        self._write({"kind": "turn", **asdict(turn), "stages_ms": turn.stage_ms()})
+        logger.info(f"⏱️ Turn {turn.turn_id} ({turn.source}) latency: {turn.stage_ms()}")
+
+    # ------------------------------------------------------------------
+    # Sink / summary
+    # ------------------------------------------------------------------
+    def _write(self, record: dict) -> None:
+        record = {"room": self.room_name, "ts": time.time(), **record}
+        try:
+            with open(self.sink_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            logger.warning(f"Could not write latency record: {e}")
+
+    def summary(self) -> dict:
+        """p50/p90/p99 per stage (ms) over the completed turns of this session"""
+        with self._lock:
+            turns = list(self._completed)
+        per_stage: dict[str, list[float]] = {}
+        for turn in turns:
+            for name, value in turn.stage_ms().items():
+                per_stage.setdefault(name, []).append(value)
+        later = [t.stage_ms() for t in turns[1:]]
+        return {
+            "turns": len(turns),
+            "language": os.getenv("AVATAR_LANGUAGE"),
+            # cold vs warm connections: the first turn should look like the median of the rest
+            "first_turn": turns[0].stage_ms() if turns else None,
+            # end-to-end effect of speculative generation
+            "first_audio_p50_speculated": percentile(
+                [t.stage_ms()["first_audio"] for t in turns if t.speculated and "first_audio" in t.stage_ms()], 50),
+            "first_audio_p50_not_speculated": percentile(
+                [t.stage_ms()["first_audio"] for t in turns if not t.speculated and t.source == "voice"
+                 and "first_audio" in t.stage_ms()], 50),
+            "later_turns_p50": {
+                name: percentile([st[name] for st in later if name in st], 50)
+                for name in ("llm", "tts", "first_audio")
+            },
+            "stages": {
+                name: {
+                    "count": len(values),
+                    "p50": percentile(values, 50),
+                    "p90": percentile(values, 90),
+                    "p99": percentile(values, 99),
+                }
+                for name, values in per_stage.items()
+            },
+        }
+
+    def close(self) -> None:
+        """Write the session summary once; safe to call from every shutdown path"""
+        if self._closed:
+            return
+        self._closed = True
+        summary = self.summary()
+        for name, fn in self._extra_summaries.items():
+            try:
+                summary[name] = fn()
+            except Exception as e:
+                logger.debug(f"Summary source {name} failed: {e}")
+        self._write({"kind": "summary", **summary})
+        logger.info(f"⏱️ Session latency summary for {self.room_name}: {json.dumps(summary)}")